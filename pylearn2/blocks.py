@@ -36,6 +36,11 @@ class Block(object):
     # TODO: Give this input and output spaces to make it different from a
     #       theano Op. Supporting CompositeSpace would allow more complicated
     #       structures than just chains.
+
+    # Compiled function of `perform`. Models do not pickle it, in which case
+    # the class attribute stands in for it after unpickling.
+    fn = None
+
     def __init__(self):
         super(Block, self).__init__()
         self.fn = None
@@ -78,6 +83,9 @@ class Block(object):
         """
         if self.fn is None:
             self.fn = self.function("perform")
+            # Compiled again on first use rather than on unpickling
+            if hasattr(self, 'register_names_to_del'):
+                self.register_names_to_del(['fn'])
         return self.fn(X)
 
     def inverse(self):
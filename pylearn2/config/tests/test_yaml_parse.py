@@ -283,6 +283,52 @@ def test_instantiate_regression():
     assert obj['a'] is obj['b']
 
 
+def test_try_to_import_cached():
+    """
+    Tests that the objects tags refer to are only imported once.
+    """
+    from pylearn2.config.yaml_parse import try_to_import, _imported
+    obj = try_to_import('pylearn2.config.tests.test_yaml_parse.DumDum')
+    assert obj is DumDum
+    assert _imported['pylearn2.config.tests.test_yaml_parse.DumDum'] is obj
+    assert try_to_import('pylearn2.config.tests.test_yaml_parse.DumDum') is obj
+
+
+def test_parallel_instantiation():
+    """
+    Tests that independent datasets are constructed concurrently, that the
+    datasets sharing objects with the rest of the graph are not, and that
+    references are preserved.
+    """
+    from pylearn2.config.yaml_parse import _independent_io_subtrees
+    yaml = """{
+        'train': &train !obj:pylearn2.testing.datasets.ArangeDataset {
+            num_examples: 3},
+        'valid': !obj:pylearn2.testing.datasets.ArangeDataset {
+            num_examples: 4},
+        'test': !obj:pylearn2.datasets.dense_design_matrix.DenseDesignMatrix {
+            X: &X !obj:numpy.ones {shape: [2, 1]}},
+        'X': *X,
+        'monitoring': {'train': *train}
+    }"""
+    graph = load(yaml, instantiate=False)
+    roots = _independent_io_subtrees(graph)
+    assert len(roots) == 2
+    assert set(root.keywords['num_examples'] for root in roots) == set([3, 4])
+
+    timings = []
+    obj = load(yaml, num_threads=2, timings=timings)
+    assert obj['monitoring']['train'] is obj['train']
+    assert obj['test'].X.shape == (2, 1)
+    assert obj['X'].shape == (2, 1)
+    assert obj['train'].X.shape == (3, 1)
+    assert obj['valid'].X.shape == (4, 1)
+    names = [name for name, seconds in timings]
+    assert len(names) == 4
+    assert names.count('pylearn2.testing.datasets.ArangeDataset') == 2
+    assert all(seconds >= 0 for name, seconds in timings)
+
+
 if __name__ == "__main__":
     test_multi_constructor_obj()
     test_duplicate_keywords()
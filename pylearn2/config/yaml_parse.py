@@ -7,8 +7,11 @@ from pylearn2.utils.call_check import checked_call
 from pylearn2.utils.string_utils import match
 from collections import namedtuple
 import logging
+from multiprocessing.pool import ThreadPool
+import time
 import warnings
 import re
+import sys
 
 from theano.compat import six
 
@@ -18,6 +21,9 @@ is_initialized = False
 additional_environ = None
 logger = logging.getLogger(__name__)
 
+# Callables already resolved by try_to_import, by tag suffix
+_imported = {}
+
 # Lightweight container for initial YAML evaluation.
 #
 # This is intended as a robust, forward-compatible intermediate representation
@@ -199,7 +205,28 @@ def do_not_recurse(value):
     return value
 
 
-def _instantiate_proxy_tuple(proxy, bindings=None):
+def _callable_name(callable):
+    """
+    Returns the full name of a callable, for reporting.
+
+    Parameters
+    ----------
+    callable : callable
+
+    Returns
+    -------
+    name : str
+    """
+    name = getattr(callable, '__name__', None)
+    if name is None:
+        return str(callable)
+    module = getattr(callable, '__module__', None)
+    if module is None:
+        return name
+    return module + '.' + name
+
+
+def _instantiate_proxy_tuple(proxy, bindings=None, timings=None):
     """
     Helper function for `_instantiate` that handles objects of the `Proxy`
     class.
@@ -211,6 +238,10 @@ def _instantiate_proxy_tuple(proxy, bindings=None):
     bindings : dict, opitonal
         A dictionary mapping previously instantiated `Proxy` objects
         to their instantiated values.
+    timings : list, optional
+        If given, a (name, seconds) pair is appended to it for each object
+        instantiated, with the time spent in its constructor, excluding
+        the instantiation of its arguments.
 
     Returns
     -------
@@ -229,9 +260,13 @@ def _instantiate_proxy_tuple(proxy, bindings=None):
             if len(proxy.positionals) > 0:
                 raise NotImplementedError('positional arguments not yet '
                                           'supported in proxy instantiation')
-            kwargs = dict((k, _instantiate(v, bindings))
+            kwargs = dict((k, _instantiate(v, bindings, timings))
                           for k, v in six.iteritems(proxy.keywords))
+            t0 = time.time()
             obj = checked_call(proxy.callable, kwargs)
+            if timings is not None:
+                timings.append((_callable_name(proxy.callable),
+                                time.time() - t0))
         try:
             obj.yaml_src = proxy.yaml_src
         except AttributeError:  # Some classes won't allow this.
@@ -256,7 +291,7 @@ def instantiate_all(graph):
     """
 
 
-def _instantiate(proxy, bindings=None):
+def _instantiate(proxy, bindings=None, timings=None):
     """
     Instantiate a (hierarchy of) Proxy object(s).
 
@@ -268,6 +303,8 @@ def _instantiate(proxy, bindings=None):
     bindings : dict, opitonal
         A dictionary mapping previously instantiated `Proxy` objects
         to their instantiated values.
+    timings : list, optional
+        See `_instantiate_proxy_tuple`.
 
     Returns
     -------
@@ -281,14 +318,15 @@ def _instantiate(proxy, bindings=None):
     if bindings is None:
         bindings = {}
     if isinstance(proxy, Proxy):
-        return _instantiate_proxy_tuple(proxy, bindings)
+        return _instantiate_proxy_tuple(proxy, bindings, timings)
     elif isinstance(proxy, dict):
         # Recurse on the keys too, for backward compatibility.
         # Is the key instantiation feature ever actually used, by anyone?
-        return dict((_instantiate(k, bindings), _instantiate(v, bindings))
+        return dict((_instantiate(k, bindings, timings),
+                     _instantiate(v, bindings, timings))
                     for k, v in six.iteritems(proxy))
     elif isinstance(proxy, list):
-        return [_instantiate(v, bindings) for v in proxy]
+        return [_instantiate(v, bindings, timings) for v in proxy]
     # In the future it might be good to consider a dict argument that provides
     # a type->callable mapping for arbitrary transformations like this.
     elif isinstance(proxy, six.string_types):
@@ -297,7 +335,177 @@ def _instantiate(proxy, bindings=None):
         return proxy
 
 
-def load(stream, environ=None, instantiate=True, **kwargs):
+def _nested_proxies(value):
+    """
+    Returns the `Proxy` objects found in a value, looking inside lists and
+    dicts but not inside the proxies themselves.
+
+    Parameters
+    ----------
+    value : object
+        A `Proxy` object or list/dict/literal.
+
+    Returns
+    -------
+    proxies : list
+    """
+    if isinstance(value, Proxy):
+        return [value]
+    elif isinstance(value, dict):
+        return [p for k, v in six.iteritems(value)
+                for p in _nested_proxies(k) + _nested_proxies(v)]
+    elif isinstance(value, list):
+        return [p for v in value for p in _nested_proxies(v)]
+    return []
+
+
+def _children(proxy):
+    """
+    Returns the `Proxy` objects the arguments of a proxy are made of.
+
+    Parameters
+    ----------
+    proxy : Proxy object
+
+    Returns
+    -------
+    children : list
+        The child proxies, once per reference.
+    """
+    if proxy.callable == do_not_recurse:
+        return []
+    return _nested_proxies(list(proxy.keywords.values()))
+
+
+def _subtree(proxy):
+    """
+    Returns the proxies reachable from a proxy, including itself.
+
+    Parameters
+    ----------
+    proxy : Proxy object
+
+    Returns
+    -------
+    subtree : dict
+        Maps the ids of the proxies to the proxies.
+    """
+    subtree = {}
+    stack = [proxy]
+    while stack:
+        p = stack.pop()
+        if id(p) not in subtree:
+            subtree[id(p)] = p
+            stack.extend(_children(p))
+    return subtree
+
+
+def _is_io_bound(proxy):
+    """
+    Returns whether the object of a proxy is worth constructing in a
+    separate thread: datasets, whose construction is dominated by reading
+    files.
+
+    Parameters
+    ----------
+    proxy : Proxy object
+
+    Returns
+    -------
+    rval : bool
+    """
+    from pylearn2.datasets.dataset import Dataset
+    return (isinstance(proxy.callable, type) and
+            issubclass(proxy.callable, Dataset))
+
+
+def _independent_io_subtrees(graph):
+    """
+    Returns the outermost I/O-bound proxies of a graph whose subtrees do
+    not share any proxy with the rest of the graph, and can thus be
+    instantiated independently.
+
+    Parameters
+    ----------
+    graph : object
+        A `Proxy` object or list/dict/literal.
+
+    Returns
+    -------
+    roots : list
+        The roots of the independent subtrees, in depth-first order.
+    """
+    top = _nested_proxies(graph)
+    everything = {}
+    for proxy in top:
+        everything.update(_subtree(proxy))
+    num_refs = dict((key, 0) for key in everything)
+    for proxy in top:
+        num_refs[id(proxy)] += 1
+    for proxy in everything.values():
+        for child in _children(proxy):
+            num_refs[id(child)] += 1
+
+    roots = []
+    visited = set()
+    stack = list(reversed(top))
+    while stack:
+        proxy = stack.pop()
+        if id(proxy) in visited:
+            continue
+        visited.add(id(proxy))
+        if _is_io_bound(proxy):
+            subtree = _subtree(proxy)
+            inner_refs = dict((key, 0) for key in subtree)
+            for p in subtree.values():
+                for child in _children(p):
+                    inner_refs[id(child)] += 1
+            if all(inner_refs[key] == num_refs[key]
+                   for key in subtree if key != id(proxy)):
+                roots.append(proxy)
+                continue
+        stack.extend(reversed(_children(proxy)))
+    return roots
+
+
+def _instantiate_parallel(graph, num_threads, timings=None):
+    """
+    Instantiates a graph, constructing its independent I/O-bound subtrees
+    (e.g. the training, validation and test datasets) concurrently in a
+    pool of threads, and the rest of the graph serially afterwards.
+
+    Parameters
+    ----------
+    graph : object
+        A `Proxy` object or list/dict/literal.
+    num_threads : int
+        Number of threads.
+    timings : list, optional
+        See `_instantiate_proxy_tuple`.
+
+    Returns
+    -------
+    obj : object
+        The result object from instantiating the graph.
+    """
+    bindings = {}
+    roots = _independent_io_subtrees(graph)
+    if len(roots) > 1:
+        pool = ThreadPool(min(num_threads, len(roots)))
+        try:
+            results = [(root, pool.apply_async(_instantiate,
+                                               (root, {}, timings)))
+                       for root in roots]
+            for root, result in results:
+                bindings[root] = result.get()
+        finally:
+            pool.close()
+            pool.join()
+    return _instantiate(graph, bindings, timings)
+
+
+def load(stream, environ=None, instantiate=True, num_threads=1,
+         timings=None, **kwargs):
     """
     Loads a YAML configuration from a string or file-like object.
 
@@ -313,6 +521,13 @@ def load(stream, environ=None, instantiate=True, **kwargs):
     instantiate : bool, optional
         If `False`, do not actually instantiate the objects but instead
         produce a nested hierarchy of `Proxy` objects.
+    num_threads : int, optional
+        If greater than 1, the datasets that do not share any object with
+        the rest of the configuration are constructed concurrently in this
+        many threads, before the other objects.
+    timings : list, optional
+        If given, a (name, seconds) pair is appended to it for each object
+        instantiated, with the time spent in its constructor.
 
     Returns
     -------
@@ -337,13 +552,16 @@ def load(stream, environ=None, instantiate=True, **kwargs):
         string = stream.read()
 
     proxy_graph = yaml.load(string, **kwargs)
-    if instantiate:
-        return _instantiate(proxy_graph)
-    else:
+    if not instantiate:
         return proxy_graph
+    elif num_threads > 1:
+        return _instantiate_parallel(proxy_graph, num_threads, timings)
+    else:
+        return _instantiate(proxy_graph, timings=timings)
 
 
-def load_path(path, environ=None, instantiate=True, **kwargs):
+def load_path(path, environ=None, instantiate=True, num_threads=1,
+              timings=None, **kwargs):
     """
     Convenience function for loading a YAML configuration from a file.
 
@@ -358,6 +576,10 @@ def load_path(path, environ=None, instantiate=True, **kwargs):
     instantiate : bool, optional
         If `False`, do not actually instantiate the objects but instead
         produce a nested hierarchy of `Proxy` objects.
+    num_threads : int, optional
+        See `load`.
+    timings : list, optional
+        See `load`.
 
     Returns
     -------
@@ -380,19 +602,32 @@ def load_path(path, environ=None, instantiate=True, **kwargs):
         raise AssertionError("Expected content to be of type str, got " +
                              str(type(content)))
 
-    return load(content, instantiate=instantiate, environ=environ, **kwargs)
+    return load(content, instantiate=instantiate, environ=environ,
+                num_threads=num_threads, timings=timings, **kwargs)
 
 
 def try_to_import(tag_suffix):
     """
-    .. todo::
+    Imports the object a tag suffix refers to.
+
+    Parameters
+    ----------
+    tag_suffix : str
+        Full name of the object, e.g. 'pylearn2.models.mlp.MLP'.
 
-        WRITEME
+    Returns
+    -------
+    obj : object
+        The object. It is cached, so that configurations with many objects
+        of the same class only import it once.
     """
+    if tag_suffix in _imported:
+        return _imported[tag_suffix]
     components = tag_suffix.split('.')
     modulename = '.'.join(components[:-1])
     try:
-        exec('import %s' % modulename)
+        __import__(modulename)
+        module = sys.modules[modulename]
     except ImportError as e:
         # We know it's an ImportError, but is it an ImportError related to
         # this path,
@@ -417,7 +652,7 @@ def try_to_import(tag_suffix):
             while j <= len(pcomponents):
                 modulename = '.'.join(pcomponents[:j])
                 try:
-                    exec('import %s' % modulename)
+                    __import__(modulename)
                 except Exception:
                     base_msg = 'Could not import %s' % modulename
                     if j > 1:
@@ -426,17 +661,17 @@ def try_to_import(tag_suffix):
                     reraise_as(ImportError(base_msg + '. Original exception: '
                                            + str(e)))
                 j += 1
+            __import__(modulename)
+            module = sys.modules[modulename]
     try:
-        obj = eval(tag_suffix)
+        obj = getattr(module, components[-1])
     except AttributeError as e:
         try:
             # Try to figure out what the wrong field name was
             # If we fail to do it, just fall back to giving the usual
             # attribute error
-            pieces = tag_suffix.split('.')
-            module = '.'.join(pieces[:-1])
-            field = pieces[-1]
-            candidates = dir(eval(module))
+            field = components[-1]
+            candidates = dir(module)
 
             msg = ('Could not evaluate %s. ' % tag_suffix +
                    'Did you mean ' + match(field, candidates) + '? ' +
@@ -447,6 +682,7 @@ def try_to_import(tag_suffix):
             reraise_as(AttributeError('Could not evaluate %s. ' % tag_suffix +
                                       'Original error was ' + str(e)))
         reraise_as(AttributeError(msg))
+    _imported[tag_suffix] = obj
     return obj
 
 
@@ -8,6 +8,7 @@ from __future__ import print_function
 import numpy
 import theano
 from theano import tensor
+import theano.sparse
 T = tensor
 from pylearn2.utils.rng import make_np_rng
 
@@ -63,10 +64,12 @@ class Corruptor(object):
             Theano symbolic(s) representing the corresponding corrupted
             inputs.
         """
-        if isinstance(inputs, tensor.Variable):
+        if isinstance(inputs, theano.sparse.SparseVariable):
+            return self._corrupt_sparse(inputs)
+        elif isinstance(inputs, tensor.Variable):
             return self._corrupt(inputs)
         else:
-            return [self._corrupt(inp) for inp in inputs]
+            return [self(inp) for inp in inputs]
 
     def _corrupt(self, x):
         """
@@ -91,6 +94,30 @@ class Corruptor(object):
         """
         raise NotImplementedError()
 
+    def _corrupt_sparse(self, x):
+        """
+        Corrupts a single sparse minibatch.
+
+        Parameters
+        ----------
+        x : theano.sparse.SparseVariable
+            Theano symbolic representing a CSR or CSC (mini)batch of
+            inputs to be corrupted.
+
+        Returns
+        -------
+        corrupted : theano.sparse.SparseVariable
+            Theano symbolic representing the corresponding corrupted
+            input, with the same format.
+
+        Notes
+        -----
+        Only corruptors that leave the zeros of their inputs unchanged can
+        implement this without densifying the minibatch.
+        """
+        raise NotImplementedError("%s does not support sparse inputs."
+                                  % self.__class__.__name__)
+
     def corruption_free_energy(self, corrupted_X, X):
         """
         .. todo::
@@ -145,6 +172,30 @@ class BinomialCorruptor(Corruptor):
             dtype=theano.config.floatX
         ) * x
 
+    def _corrupt_sparse(self, x):
+        """
+        Corrupts a single sparse minibatch by dropping some of its stored
+        entries, the zeros being unaffected.
+
+        Parameters
+        ----------
+        x : theano.sparse.SparseVariable
+            Theano symbolic representing a CSR or CSC (mini)batch of
+            inputs to be corrupted.
+
+        Returns
+        -------
+        corrupted : theano.sparse.SparseVariable
+            Theano symbolic representing the corresponding corrupted
+            input, with the same sparsity structure.
+        """
+        data, indices, indptr, shape = theano.sparse.csm_properties(x)
+        if x.format == 'csr':
+            build = theano.sparse.CSR
+        else:
+            build = theano.sparse.CSC
+        return build(self._corrupt(data), indices, indptr, shape)
+
 
 class DropoutCorruptor(BinomialCorruptor):
     """
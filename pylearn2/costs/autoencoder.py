@@ -5,7 +5,9 @@
 """
 from theano import tensor
 import theano.sparse
+from theano.tensor.extra_ops import diff, repeat
 from pylearn2.costs.cost import Cost, DefaultDataSpecsMixin
+from pylearn2.utils.rng import make_theano_rng
 from theano.tensor.shared_randomstreams import RandomStreams
 
 
@@ -194,6 +196,232 @@ class SampledMeanSquaredReconstructionError(MeanSquaredReconstructionError):
         return cost
 
 
+class SparseSampledReconstructionCost(DefaultDataSpecsMixin, Cost):
+    """
+    Reconstruction cost of an autoencoder with sparse inputs, which only
+    scores the nonzero entries of each example and a few randomly sampled
+    other entries, without ever densifying the minibatch or computing the
+    full reconstruction.
+
+    The model must have been built with `sparse_input=True` and implement
+    `reconstruct_entries`, as `Autoencoder` and `DenoisingAutoencoder` do.
+    The costs of the sampled entries are importance weighted so that, in
+    expectation, they sum to the cost of all the zero entries of the
+    example: each one is weighted by the number of zero entries of its
+    example divided by the number of its sampled entries which are zeros.
+    Sampled entries which hit a nonzero entry are already scored, and get
+    a weight of zero.
+
+    For theory:
+    Y. Dauphin, X. Glorot, Y. Bengio. ICML2011
+    Large-Scale Learning of Embeddings with Reconstruction Sampling
+
+    Parameters
+    ----------
+    num_samples : int
+        Number of entries sampled uniformly at random in each example, in
+        addition to its nonzero entries.
+    seed : int, optional
+        Seed of the random number generator used to sample the entries.
+    """
+
+    def __init__(self, num_samples, seed=2015):
+        self.num_samples = num_samples
+        self.theano_rng = make_theano_rng(seed, which_method='uniform')
+
+    def entry_cost(self, model, target, before_activation):
+        """
+        Returns the cost of each scored entry.
+
+        Parameters
+        ----------
+        model : Autoencoder
+            The model.
+        target : tensor_like
+            Theano vector, the values of the entries in the inputs.
+        before_activation : tensor_like
+            Theano vector, the input to the decoder nonlinearity for the
+            same entries.
+
+        Returns
+        -------
+        cost : tensor_like
+            Theano vector.
+        """
+        raise NotImplementedError(str(type(self)) + " does not implement "
+                                  "entry_cost.")
+
+    def get_entries(self, X):
+        """
+        Returns the entries scored for a minibatch, its nonzero entries
+        followed by the sampled ones, with their weights.
+
+        Parameters
+        ----------
+        X : theano.sparse.SparseVariable
+            A CSR minibatch.
+
+        Returns
+        -------
+        rows : tensor_like
+            Integer vector, the example of each entry.
+        cols : tensor_like
+            Integer vector, the visible unit of each entry.
+        target : tensor_like
+            The values of the entries in `X`.
+        weights : tensor_like
+            The weight of the cost of each entry: 1 for the nonzero
+            entries, the importance weight of the sampled ones.
+        """
+        if not isinstance(X, theano.sparse.SparseVariable) or \
+                X.format != 'csr':
+            raise TypeError("%s expects CSR minibatches, got %s. Build the "
+                            "model with sparse_input=True." %
+                            (self.__class__.__name__, X))
+        data, indices, indptr, shape = theano.sparse.csm_properties(X)
+        batch_size = shape[0]
+        examples = tensor.arange(batch_size)
+        nnz = diff(indptr)
+        rows = repeat(examples, nnz)
+        cols = tensor.cast(indices, 'int64')
+        weights = tensor.ones_like(data)
+        if self.num_samples == 0:
+            return rows, cols, data, weights
+
+        sampled_rows = repeat(examples, self.num_samples)
+        u = self.theano_rng.uniform(size=(batch_size * self.num_samples,),
+                                    dtype=theano.config.floatX)
+        sampled_cols = tensor.minimum(tensor.cast(u * shape[1], 'int64'),
+                                      shape[1] - 1)
+
+        # 1 where a sampled entry is a nonzero entry of X
+        structure = theano.sparse.sp_ones_like(X)
+        if structure.dtype != theano.config.floatX:
+            structure = theano.sparse.cast(structure, theano.config.floatX)
+        hits = theano.sparse.get_item_2lists(structure, sampled_rows,
+                                             sampled_cols)
+        misses = 1. - hits
+        num_zeros = tensor.cast(shape[1] - nnz, theano.config.floatX)
+        num_misses = misses.reshape((batch_size, self.num_samples)).sum(1)
+        sampled_weights = misses * repeat(
+            num_zeros / tensor.maximum(num_misses, 1.), self.num_samples)
+
+        rows = tensor.concatenate([rows, sampled_rows])
+        cols = tensor.concatenate([cols, sampled_cols])
+        target = tensor.concatenate([data, tensor.zeros_like(u)])
+        weights = tensor.concatenate([weights, sampled_weights])
+        return rows, cols, target, weights
+
+    def expr(self, model, data, **kwargs):
+        """
+        Returns the weighted sum of the costs of the scored entries,
+        averaged over the examples of the minibatch.
+
+        Parameters
+        ----------
+        model : Autoencoder
+            The model.
+        data : theano.sparse.SparseVariable
+            A CSR minibatch.
+        kwargs : dict
+            Unused.
+
+        Returns
+        -------
+        cost : tensor_like
+            Theano scalar.
+        """
+        self.get_data_specs(model)[0].validate(data)
+        X = data
+        rows, cols, target, weights = self.get_entries(X)
+        before_activation = model.reconstruct_entries(X, rows, cols)
+        cost = (weights *
+                self.entry_cost(model, target, before_activation)).sum()
+        return cost / tensor.cast(theano.sparse.csm_shape(X)[0],
+                                  theano.config.floatX)
+
+
+class SparseSampledMeanSquaredReconstructionError(
+        SparseSampledReconstructionCost):
+    """
+    Squared reconstruction error of an autoencoder with sparse inputs,
+    computed on the nonzero entries and sampled other entries only. See
+    `SparseSampledReconstructionCost`.
+
+    Parameters
+    ----------
+    num_samples : int
+        Number of entries sampled in each example.
+    seed : int, optional
+        Seed of the random number generator used to sample the entries.
+    """
+
+    def entry_cost(self, model, target, before_activation):
+        """
+        Returns the squared error of each scored entry.
+
+        Parameters
+        ----------
+        model : Autoencoder
+            The model.
+        target : tensor_like
+            Theano vector, the values of the entries in the inputs.
+        before_activation : tensor_like
+            Theano vector, the input to the decoder nonlinearity for the
+            same entries.
+
+        Returns
+        -------
+        cost : tensor_like
+            Theano vector.
+        """
+        output = before_activation
+        if model.act_dec is not None:
+            output = model.act_dec(output)
+        return tensor.sqr(output - target)
+
+
+class SparseSampledMeanBinaryCrossEntropy(SparseSampledReconstructionCost):
+    """
+    Cross-entropy of the reconstruction of an autoencoder with sparse
+    inputs in [0, 1] and a sigmoid decoder, computed on the nonzero entries
+    and sampled other entries only. See `SparseSampledReconstructionCost`.
+
+    Parameters
+    ----------
+    num_samples : int
+        Number of entries sampled in each example.
+    seed : int, optional
+        Seed of the random number generator used to sample the entries.
+    """
+
+    def entry_cost(self, model, target, before_activation):
+        """
+        Returns the cross-entropy of each scored entry, computed stably
+        from the input to the sigmoid.
+
+        Parameters
+        ----------
+        model : Autoencoder
+            The model, whose decoder nonlinearity must be a sigmoid.
+        target : tensor_like
+            Theano vector, the values of the entries in the inputs.
+        before_activation : tensor_like
+            Theano vector, the input to the decoder nonlinearity for the
+            same entries.
+
+        Returns
+        -------
+        cost : tensor_like
+            Theano vector.
+        """
+        if model.act_dec is not tensor.nnet.sigmoid:
+            raise ValueError("%s requires a sigmoid decoder."
+                             % self.__class__.__name__)
+        return (tensor.nnet.softplus(before_activation) -
+                target * before_activation)
+
+
 # class MeanBinaryCrossEntropyTanh(Cost):
 #     def expr(self, model, data):
 #        self.get_data_specs(model)[0].validate(data)
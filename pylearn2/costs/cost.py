@@ -9,7 +9,9 @@ import functools
 import logging
 import warnings
 
+import numpy as np
 from theano.compat.six.moves import reduce
+from theano.scalar import upcast
 import theano.tensor as T
 from theano.compat.six.moves import zip as izip
 
@@ -69,7 +71,7 @@ class Cost(object):
         raise NotImplementedError(str(type(self)) + " does not implement "
                                   "expr.")
 
-    def get_gradients(self, model, data, ** kwargs):
+    def get_gradients(self, model, data, loss_scale=None, ** kwargs):
         """
         Provides the gradients of the cost function with respect to the model
         parameters.
@@ -82,6 +84,13 @@ class Cost(object):
         ----------
         model : a pylearn2 Model instance
         data : a batch in cost.get_data_specs() form
+        loss_scale : float, optional
+            If specified, the gradients are back-propagated from the cost
+            multiplied by this factor, computed in at least float32, and
+            divided by it afterwards, so that small gradients of
+            activations stored in float16 do not underflow. Subclasses
+            overriding this method must accept it to be trained with
+            loss scaling, and only scale what they back-propagate.
         kwargs : dict
             Optional extra arguments, not used by the base class.
 
@@ -122,8 +131,17 @@ class Cost(object):
 
         params = list(model.get_params())
 
+        if loss_scale is not None:
+            dtype = upcast(cost.dtype, 'float32')
+            cost = T.cast(cost, dtype) * np.cast[dtype](loss_scale)
+
         grads = T.grad(cost, params, disconnected_inputs='ignore')
 
+        if loss_scale is not None:
+            grads = [T.cast(grad / np.cast[grad.dtype](loss_scale),
+                            param.dtype)
+                     for param, grad in izip(params, grads)]
+
         gradients = OrderedDict(izip(params, grads))
 
         updates = OrderedDict()
@@ -389,10 +407,14 @@ class SumOfCosts(Cost):
         return data_specs
 
     @functools.wraps(Cost.get_gradients)
-    def get_gradients(self, model, data, ** kwargs):
+    def get_gradients(self, model, data, loss_scale=None, ** kwargs):
         indiv_results = []
         composite_specs, mapping = self.get_composite_specs_and_mapping(model)
         nested_data = mapping.nest(data)
+        if loss_scale is not None:
+            # Only passed on when specified, so that costs which do not
+            # accept it can still be combined without loss scaling
+            kwargs['loss_scale'] = loss_scale
         for cost, cost_data in safe_zip(self.costs, nested_data):
             result = cost.get_gradients(model, cost_data, ** kwargs)
             indiv_results.append(result)
@@ -238,11 +238,23 @@ class SML(Cost):
         Batch size of the training algorithm
     nsteps: int
         Number of steps made by the block Gibbs sampler between each epoch
+    sampler_class : callable, optional
+        Class of the sampler of the negative particles, or any callable
+        building one from the `rbm`, `particles`, `rng` and `steps` keyword
+        arguments, e.g. `pylearn2.models.rbm.ParallelTemperingSampler`.
+        Defaults to `pylearn2.models.rbm.BlockGibbsSampler`.
+    sampler_kwargs : dict, optional
+        Extra keyword arguments of `sampler_class`.
     """
-    def __init__(self, batch_size, nsteps ):
+    def __init__(self, batch_size, nsteps, sampler_class=BlockGibbsSampler,
+                 sampler_kwargs=None):
         super(SML, self).__init__()
         self.nchains = batch_size
         self.nsteps  = nsteps
+        self.sampler_class = sampler_class
+        if sampler_kwargs is None:
+            sampler_kwargs = {}
+        self.sampler_kwargs = sampler_kwargs
 
     def get_gradients(self, model, data, **kwargs):
         cost = self._cost(model,data,**kwargs)
@@ -260,17 +272,32 @@ class SML(Cost):
         updates.update(sampler_updates)
         return gradients, updates
 
-    def _cost(self, model, data):
+    def _get_sampler(self, model):
+        """
+        Returns the sampler of the negative particles, building it the
+        first time.
+
+        Parameters
+        ----------
+        model : RBM
+            The model.
 
-        if not hasattr(self,'sampler'):
-            self.sampler = BlockGibbsSampler(
+        Returns
+        -------
+        sampler : Sampler
+        """
+        if not hasattr(self, 'sampler'):
+            self.sampler = self.sampler_class(
                 rbm=model,
                 particles=0.5+np.zeros((self.nchains,model.get_input_dim())),
                 rng=model.rng,
-                steps=self.nsteps)
+                steps=self.nsteps,
+                **self.sampler_kwargs)
+        return self.sampler
 
-        # compute negative phase updates
-        sampler_updates = self.sampler.updates()
+    def _cost(self, model, data):
+
+        self._get_sampler(model)
 
         # Compute SML cost
         pos_v = data
@@ -284,6 +311,14 @@ class SML(Cost):
     def expr(self, model, data):
         return None
 
+    @functools.wraps(Cost.get_monitoring_channels)
+    def get_monitoring_channels(self, model, data, **kwargs):
+        rval = super(SML, self).get_monitoring_channels(model, data,
+                                                        **kwargs)
+        # e.g. the acceptance rates of a ParallelTemperingSampler
+        rval.update(self._get_sampler(model).get_monitoring_channels())
+        return rval
+
     def get_data_specs(self, model):
         return (model.get_input_space(), model.get_input_source())
 
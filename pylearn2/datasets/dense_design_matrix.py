@@ -15,8 +15,10 @@ __license__ = "3-clause BSD"
 __maintainer__ = "LISA Lab"
 __email__ = "pylearn-dev@googlegroups"
 import functools
+import hashlib
 
 import logging
+import os
 import warnings
 
 import numpy as np
@@ -57,6 +59,96 @@ def ensure_tables():
         import tables
 
 
+# dtypes in which DenseDesignMatrix.set_compact_storage can store X
+compact_dtypes = ('uint8', 'int8', 'uint16', 'int16', 'float16')
+
+
+def encode_compact(X, dtype, per_feature=False, chunk_size=10000):
+    """
+    Encodes a design matrix in a compact dtype, as integer codes with a
+    scale and an offset, or as float16.
+
+    Parameters
+    ----------
+    X : numpy.ndarray
+        The design matrix.
+    dtype : str
+        One of `compact_dtypes`.
+    per_feature : bool, optional
+        If True, each feature has its own scale and offset, otherwise the
+        range of the whole matrix is used. Ignored for float16.
+    chunk_size : int, optional
+        Number of rows encoded at a time, which bounds the size of the
+        temporary arrays.
+
+    Returns
+    -------
+    codes : numpy.ndarray
+        The encoded matrix, of dtype `dtype`.
+    scale, offset : numpy.ndarray or None
+        Arrays, broadcastable against a row of X, such that X is
+        approximately codes * scale + offset, or None for float16. Integer
+        data whose range does not exceed the number of codes is encoded
+        exactly.
+    """
+    if dtype not in compact_dtypes:
+        raise ValueError("Can not store a design matrix as %s, the compact "
+                         "dtypes are %s." % (dtype, str(compact_dtypes)))
+    if dtype == 'float16':
+        return X.astype(dtype), None, None
+
+    info = np.iinfo(dtype)
+    axis = 0 if per_feature else None
+    low = np.asarray(X.min(axis=axis), dtype='float64')
+    high = np.asarray(X.max(axis=axis), dtype='float64')
+    num_steps = float(info.max) - float(info.min)
+    scale = (high - low) / num_steps
+    scale = np.where(scale == 0., 1., scale)
+    if np.all(high - low <= num_steps) and all(
+            np.all(np.round(X[start:start + chunk_size]) ==
+                   X[start:start + chunk_size])
+            for start in xrange(0, X.shape[0], chunk_size)):
+        # Integers are stored as is, up to the offset
+        scale = np.ones_like(scale)
+    offset = low - info.min * scale
+    codes = np.empty(X.shape, dtype=dtype)
+    for start in xrange(0, X.shape[0], chunk_size):
+        chunk = (X[start:start + chunk_size] - offset) / scale
+        codes[start:start + chunk_size] = np.clip(np.round(chunk),
+                                                  info.min, info.max)
+    return (codes, np.asarray(scale, dtype=config.floatX),
+            np.asarray(offset, dtype=config.floatX))
+
+
+def decode_compact(codes, scale, offset, out=None):
+    """
+    Decodes a batch encoded by `encode_compact`.
+
+    Parameters
+    ----------
+    codes : numpy.ndarray
+        Rows of the encoded design matrix.
+    scale, offset : numpy.ndarray or None
+        As returned by `encode_compact`.
+    out : numpy.ndarray, optional
+        An array of dtype floatX and of the shape of `codes` to write the
+        result into.
+
+    Returns
+    -------
+    batch : numpy.ndarray
+        The decoded rows, of dtype floatX.
+    """
+    if out is None:
+        out = np.empty(codes.shape, dtype=config.floatX)
+    if scale is None:
+        out[...] = codes
+    else:
+        np.multiply(codes, scale, out=out)
+        out += offset
+    return out
+
+
 class DenseDesignMatrix(Dataset):
 
     """
@@ -283,15 +375,30 @@ class DenseDesignMatrix(Dataset):
             sub_spaces = (space,)
             sub_sources = (source,)
 
+        layout = getattr(self, '_topo_layout', None)
+        if layout is not None and layout[0] is not self.X:
+            # The design matrix was replaced since the layout was made
+            layout = None
+        compact = self._get_compact()
         convert = []
+        layouts = []
         for sp, src in safe_zip(sub_spaces, sub_sources):
-            if src == 'features' and \
-               getattr(self, 'view_converter', None) is not None:
+            if src == 'features' and layout is not None and sp == layout[1]:
+                # Served as is from the laid out copy
+                conv_fn = None
+                layouts.append((layout[2], sp.get_batch_axis()))
+            elif src == 'features' and compact is not None:
+                conv_fn = self._compact_decoder(sp, compact)
+                layouts.append(None)
+            elif (src == 'features' and
+                  getattr(self, 'view_converter', None) is not None):
                 conv_fn = (lambda batch, self=self, space=sp:
                            self.view_converter.get_formatted_batch(batch,
                                                                    space))
+                layouts.append(None)
             else:
                 conv_fn = None
+                layouts.append(None)
 
             convert.append(conv_fn)
 
@@ -318,7 +425,188 @@ class DenseDesignMatrix(Dataset):
                                           rng),
                                      data_specs=data_specs,
                                      return_tuple=return_tuple,
-                                     convert=convert)
+                                     convert=convert,
+                                     layouts=layouts)
+
+    def set_compact_storage(self, dtype='uint8', per_feature=False,
+                            reuse_buffer=False):
+        """
+        Stores the design matrix in a compact dtype, several times smaller
+        than floatX. The batches served by the iterators are decoded to
+        floatX on the fly.
+
+        `get_design_matrix`, `get_topological_view` and `get_batch_design`
+        return decoded copies, while `self.X` and `get_data()` hold the
+        codes. Setting a new design matrix, e.g. by applying a
+        preprocessor, goes back to the regular storage, so this should be
+        the last preprocessing step (see `preprocessing.CompactStorage`).
+
+        Parameters
+        ----------
+        dtype : str, optional
+            One of 'uint8', 'int8', 'uint16', 'int16' and 'float16'. Integer
+            dtypes store codes with a scale and an offset, which is exact
+            for integer data whose range fits, e.g. pixel values in
+            [0, 255] in uint8. See `encode_compact`.
+        per_feature : bool, optional
+            Use a scale and an offset per feature rather than global ones.
+        reuse_buffer : bool, optional
+            If True, each iterator decodes its batches into the same array,
+            so a batch is only valid until the next one is requested.
+        """
+        if self.X_labels is not None:
+            raise ValueError("A design matrix of labels can not be stored "
+                             "in a compact dtype.")
+        compact = self._get_compact()
+        if compact is not None:
+            X = self.get_design_matrix()
+        else:
+            X = self.X
+        codes, scale, offset = encode_compact(X, dtype, per_feature)
+        self.X = codes
+        self._compact = (dtype, scale, offset, reuse_buffer)
+
+    def _get_compact(self):
+        """
+        Returns the parameters of the compact storage of the design matrix.
+
+        Returns
+        -------
+        compact : tuple or None
+            (dtype, scale, offset, reuse_buffer), or None if the design
+            matrix is not stored compactly, including when it was replaced
+            since `set_compact_storage` was called.
+        """
+        compact = getattr(self, '_compact', None)
+        if compact is None or self.X is None:
+            return None
+        if str(self.X.dtype) != compact[0]:
+            return None
+        return compact
+
+    def _compact_decoder(self, space, compact):
+        """
+        Returns a function decoding batches of the compact design matrix
+        and formatting them to a space.
+
+        Parameters
+        ----------
+        space : Space
+            The space of the batches.
+        compact : tuple
+            As returned by `_get_compact`.
+
+        Returns
+        -------
+        decode : callable
+        """
+        dtype, scale, offset, reuse_buffer = compact
+        buffers = {}
+        view_converter = self.view_converter
+        if view_converter is None:
+            plan = self.X_space.np_format_plan(space)
+
+        def decode(batch):
+            out = None
+            if reuse_buffer:
+                if batch.shape not in buffers:
+                    buffers[batch.shape] = np.empty(batch.shape,
+                                                    dtype=config.floatX)
+                out = buffers[batch.shape]
+            batch = decode_compact(batch, scale, offset, out)
+            if view_converter is not None:
+                return view_converter.get_formatted_batch(batch, space)
+            return plan(batch)
+
+        return decode
+
+    def set_topo_layout(self, space, path=None):
+        """
+        Lays out the features of the whole dataset in a Conv2DSpace once,
+        so that the iterators asked for batches in this space serve them
+        without reshaping and transposing every batch.
+
+        This is useful for models whose input space does not have the batch
+        axis first, e.g. ('c', 0, 1, 'b') for the cuda-convnet style
+        layers, for which the batches are then slices of the laid out
+        array. The laid out copy is dropped when the design matrix is
+        replaced, e.g. by a preprocessor, and is not pickled.
+
+        Parameters
+        ----------
+        space : Conv2DSpace or None
+            The space of the batches, usually the input space of the model.
+            If None, the laid out copy is dropped.
+        path : str, optional
+            If given, the laid out array is saved to this .npy file and
+            memory-mapped rather than kept in memory. A fingerprint of the
+            design matrix, the view converter and the space is saved next
+            to it, in `path` + '.sha1', and the file is reused only if the
+            fingerprint matches.
+        """
+        if space is None:
+            self._topo_layout = None
+            return
+        if not isinstance(space, Conv2DSpace):
+            raise TypeError("The features can only be laid out in a "
+                            "Conv2DSpace, got %s." % space)
+        if self.view_converter is None:
+            raise ValueError("%s has no view converter, its features can not "
+                             "be laid out in %s." %
+                             (self.__class__.__name__, space))
+        dims = {'b': self.X.shape[0],
+                'c': space.num_channels,
+                0: space.shape[0],
+                1: space.shape[1]}
+        shape = tuple(dims[axis] for axis in space.axes)
+        topo = None
+        if path is not None:
+            fingerprint = self._topo_fingerprint(space)
+            fingerprint_path = path + '.sha1'
+            if os.path.exists(path) and os.path.exists(fingerprint_path):
+                with open(fingerprint_path) as f:
+                    if f.read() == fingerprint:
+                        topo = np.load(path, mmap_mode='r')
+                        assert topo.shape == shape
+        if topo is None:
+            topo = self.view_converter.get_formatted_batch(
+                self.get_design_matrix(), space)
+            topo = np.ascontiguousarray(topo)
+            if path is not None:
+                # The fingerprint is written last, so that an interrupted
+                # save is not reused
+                if os.path.exists(fingerprint_path):
+                    os.remove(fingerprint_path)
+                np.save(path, topo)
+                with open(fingerprint_path, 'w') as f:
+                    f.write(fingerprint)
+                topo = np.load(path, mmap_mode='r')
+        self._topo_layout = (self.X, space, topo)
+
+    def _topo_fingerprint(self, space):
+        """
+        Returns a fingerprint of the design matrix laid out in a space,
+        which changes when the laid out array would.
+
+        Parameters
+        ----------
+        space : Conv2DSpace
+
+        Returns
+        -------
+        fingerprint : str
+            A SHA-1 hash of the design matrix, the view converter and the
+            space.
+        """
+        X = self.get_design_matrix()
+        description = (X.shape, str(X.dtype),
+                       tuple(self.view_converter.shape),
+                       tuple(self.view_converter.axes),
+                       tuple(space.shape), space.num_channels,
+                       tuple(space.axes), str(space.dtype))
+        h = hashlib.sha1(repr(description).encode('utf-8'))
+        h.update(np.ascontiguousarray(X).data)
+        return h.hexdigest()
 
     def get_data(self):
         """
@@ -394,10 +682,14 @@ class DenseDesignMatrix(Dataset):
             WRITEME
         """
         rval = copy.copy(self.__dict__)
+        # The laid out copy of the features is only kept in memory
+        rval.pop('_topo_layout', None)
         # TODO: Not sure this should be implemented as something a base dataset
         # does. Perhaps as a mixin that specific datasets (i.e. CIFAR10)
         # inherit from.
-        if self.compress:
+        # A compact design matrix is already made of small codes, which are
+        # pickled as they are, with their scale and offset
+        if self.compress and self._get_compact() is None:
             rval['compress_min'] = rval['X'].min(axis=0)
             # important not to do -= on this line, as that will modify the
             # original object
@@ -428,7 +720,7 @@ class DenseDesignMatrix(Dataset):
             else:
                 d['X'] = None
 
-        if d['compress']:
+        if 'compress_max' in d:
             X = d['X']
             mx = d['compress_max']
             mn = d['compress_min']
@@ -688,7 +980,7 @@ class DenseDesignMatrix(Dataset):
             raise Exception("Tried to call get_topological_view on a dataset "
                             "that has no view converter")
         if mat is None:
-            mat = self.X
+            mat = self.get_design_matrix()
         return self.view_converter.design_mat_to_topo_view(mat)
 
     def get_formatted_view(self, mat, dspace):
@@ -824,6 +1116,9 @@ class DenseDesignMatrix(Dataset):
                                 "view converter")
             return self.view_converter.topo_view_to_design_mat(topo)
 
+        compact = self._get_compact()
+        if compact is not None:
+            return decode_compact(self.X, compact[1], compact[2])
         return self.X
 
     def set_design_matrix(self, X):
@@ -840,6 +1135,7 @@ class DenseDesignMatrix(Dataset):
         assert len(X.shape) == 2
         assert not contains_nan(X)
         self.X = X
+        self._compact = None
 
     def get_targets(self):
         """
@@ -886,6 +1182,9 @@ class DenseDesignMatrix(Dataset):
                                       (batch_size, self.X.shape[0])))
             raise
         rx = self.X[idx:idx + batch_size, :]
+        compact = self._get_compact()
+        if compact is not None:
+            rx = decode_compact(rx, compact[1], compact[2])
         if include_labels:
             if self.y is None:
                 return rx, None
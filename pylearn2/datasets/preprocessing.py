@@ -1878,3 +1878,41 @@ class ShuffleAndSplit(Preprocessor):
         dataset.X = X[start:stop, :]
         if y is not None:
             dataset.y = y[start:stop, :]
+
+
+class CompactStorage(Preprocessor):
+    """
+    Stores the design matrix of a DenseDesignMatrix in a compact dtype,
+    using `DenseDesignMatrix.set_compact_storage`. Since any preprocessor
+    setting a new design matrix goes back to floatX storage, this should
+    be the last item of a Pipeline.
+
+    Parameters
+    ----------
+    dtype : str, optional
+        One of 'uint8', 'int8', 'uint16', 'int16' and 'float16'.
+    per_feature : bool, optional
+        Use a scale and an offset per feature rather than global ones.
+    reuse_buffer : bool, optional
+        Decode the batches of each iterator into the same array.
+    """
+
+    def __init__(self, dtype='uint8', per_feature=False, reuse_buffer=False):
+        self.dtype = dtype
+        self.per_feature = per_feature
+        self.reuse_buffer = reuse_buffer
+
+    def apply(self, dataset, can_fit=False):
+        """
+        Encodes the design matrix of the dataset.
+
+        Parameters
+        ----------
+        dataset : DenseDesignMatrix
+            The dataset to act on.
+        can_fit : bool, optional
+            Not used: the scale and offset are always computed from the
+            dataset.
+        """
+        dataset.set_compact_storage(self.dtype, self.per_feature,
+                                    self.reuse_buffer)
@@ -0,0 +1,339 @@
+"""
+Registry of datasets shared in memory between processes.
+
+When many jobs are launched on the same machine (e.g. a hyperparameter
+sweep), each of them usually loads and preprocesses its own copy of the
+same dataset. With this module, the first job to load a dataset writes its
+design matrix and targets as .npy files in a shared memory directory
+(/dev/shm by default), keyed by the YAML description of the dataset, and
+the other jobs memory-map them read-only instead of loading the dataset
+again, so that a single copy of the data sits in RAM.
+
+In a YAML file, the dataset to share is given as a string:
+
+.. code-block:: none
+
+    dataset: !obj:pylearn2.datasets.shared_memory.load_shared {
+        yaml_src: "!obj:pylearn2.datasets.mnist.MNIST {which_set: 'train'}"
+    }
+
+Each process using a shared dataset holds a readlock on it, like the local
+dataset cache does, which is released when the process exits. The files of
+a dataset are removed when its last reader releases it.
+
+The directory can be changed with the environment variable
+PYLEARN2_SHARED_DATA_PATH.
+"""
+import atexit
+from contextlib import contextmanager
+import copy
+import errno
+import fcntl
+import glob
+import hashlib
+import logging
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from pylearn2.datasets.dense_design_matrix import DenseDesignMatrix
+from pylearn2.utils import serial
+from pylearn2.utils.string_utils import preprocess
+
+
+log = logging.getLogger(__name__)
+
+
+def default_directory():
+    """
+    Returns the directory in which datasets are shared by default.
+
+    Returns
+    -------
+    directory : str
+        The value of PYLEARN2_SHARED_DATA_PATH if it is set, otherwise a
+        directory in /dev/shm if it exists, or in the temporary directory.
+    """
+    directory = os.environ.get('PYLEARN2_SHARED_DATA_PATH')
+    if directory is not None:
+        return directory
+    if os.path.isdir('/dev/shm'):
+        root = '/dev/shm'
+    else:
+        root = tempfile.gettempdir()
+    return os.path.join(root, 'pylearn2_shared_data')
+
+
+def _is_alive(pid):
+    """
+    Returns whether a process is running on this machine.
+
+    Parameters
+    ----------
+    pid : int
+        Process id.
+
+    Returns
+    -------
+    rval : bool
+    """
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno != errno.ESRCH
+    return True
+
+
+@contextmanager
+def _locked(path):
+    """
+    Holds an exclusive lock on a file for the duration of a with block.
+
+    The lock is not the one of the Theano compile directory, which cannot
+    be held while Theano compiles, as loading a dataset may do.
+
+    Parameters
+    ----------
+    path : str
+        Path of the lock file. It is created if needed, and left behind
+        for the processes that may be waiting on it.
+    """
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class SharedDatasetRegistry(object):
+    """
+    Shares DenseDesignMatrix datasets between the processes of a machine.
+
+    Parameters
+    ----------
+    directory : str, optional
+        Directory of the shared datasets. It should be on a tmpfs (e.g.
+        /dev/shm) for the data not to be written to disk. Defaults to
+        `default_directory()`.
+    """
+
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = default_directory()
+        self.directory = directory
+        self.pid = os.getpid()
+        self.readlocks = {}
+        atexit.register(self.release_all)
+
+    def key(self, yaml_src):
+        """
+        Returns the key under which a dataset is shared.
+
+        Parameters
+        ----------
+        yaml_src : str
+            YAML description of the dataset.
+
+        Returns
+        -------
+        key : str
+            A hash of the description, after the environment variables it
+            refers to are expanded.
+        """
+        return hashlib.sha1(preprocess(yaml_src).encode('utf-8')).hexdigest()
+
+    def path(self, key, name):
+        """
+        Returns the path of a file of a shared dataset.
+
+        Parameters
+        ----------
+        key : str
+            Key of the dataset.
+        name : str
+            'X', 'y' or 'meta'.
+
+        Returns
+        -------
+        path : str
+        """
+        extension = '.pkl' if name == 'meta' else '.npy'
+        return os.path.join(self.directory, key + '.' + name + extension)
+
+    def readers(self, key):
+        """
+        Returns the readlocks held on a dataset by running processes, and
+        removes the ones left by processes that died.
+
+        Parameters
+        ----------
+        key : str
+            Key of the dataset.
+
+        Returns
+        -------
+        readlocks : list
+            Paths of the readlocks.
+        """
+        readlocks = []
+        pattern = os.path.join(self.directory, key + '.readlock.*')
+        for readlock in glob.glob(pattern):
+            pid = int(readlock.split('.')[-2])
+            if _is_alive(pid):
+                readlocks.append(readlock)
+            elif os.path.isdir(readlock):
+                os.rmdir(readlock)
+        return readlocks
+
+    def materialize(self, key, yaml_src):
+        """
+        Loads a dataset and writes its design matrix and targets in the
+        shared directory. The caller must hold the lock of the dataset.
+
+        Parameters
+        ----------
+        key : str
+            Key of the dataset.
+        yaml_src : str
+            YAML description of the dataset.
+        """
+        from pylearn2.config import yaml_parse
+        dataset = yaml_parse.load(yaml_src)
+        if not isinstance(dataset, DenseDesignMatrix):
+            raise TypeError("Only DenseDesignMatrix datasets can be shared, "
+                            "got %s." % type(dataset))
+        if not isinstance(dataset.X, np.ndarray):
+            raise TypeError("Only datasets whose design matrix is a numpy "
+                            "array can be shared, got %s." % type(dataset.X))
+        log.info("Sharing dataset %s in %s", key, self.directory)
+        for name in ['X', 'y']:
+            value = getattr(dataset, name)
+            if value is None:
+                continue
+            # Written under a temporary name, so that an interrupted
+            # process does not leave a truncated array behind
+            tmp_path = self.path(key, name) + '.tmp'
+            np.save(tmp_path, value)
+            os.rename(tmp_path + '.npy', self.path(key, name))
+        # Everything but the arrays, which are memory-mapped on loading.
+        # The metadata file is written last, as it marks the dataset as
+        # complete.
+        meta = copy.copy(dataset)
+        meta.X = None
+        meta.y = None
+        tmp_path = self.path(key, 'meta') + '.tmp'
+        serial.save(tmp_path, meta)
+        os.rename(tmp_path, self.path(key, 'meta'))
+
+    def attach(self, key):
+        """
+        Returns a shared dataset, whose arrays are read-only memory maps of
+        the shared files.
+
+        Parameters
+        ----------
+        key : str
+            Key of the dataset.
+
+        Returns
+        -------
+        dataset : DenseDesignMatrix
+        """
+        dataset = serial.load(self.path(key, 'meta'))
+        dataset.X = np.load(self.path(key, 'X'), mmap_mode='r')
+        if os.path.exists(self.path(key, 'y')):
+            dataset.y = np.load(self.path(key, 'y'), mmap_mode='r')
+        return dataset
+
+    def load(self, yaml_src):
+        """
+        Returns a dataset shared between the processes of this machine,
+        loading it first if no other process did.
+
+        Parameters
+        ----------
+        yaml_src : str
+            YAML description of the dataset.
+
+        Returns
+        -------
+        dataset : DenseDesignMatrix
+            The dataset. Its design matrix and targets are read-only.
+        """
+        key = self.key(yaml_src)
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                # Created by another process in the meantime
+                if not os.path.isdir(self.directory):
+                    raise
+        with _locked(os.path.join(self.directory, key + '.lock')):
+            if not os.path.exists(self.path(key, 'meta')):
+                self.materialize(key, yaml_src)
+            dataset = self.attach(key)
+            if key not in self.readlocks:
+                timestamp = int(time.time() * 1e6)
+                readlock = os.path.join(self.directory, '%s.readlock.%i.%i' %
+                                        (key, self.pid, timestamp))
+                os.mkdir(readlock)
+                self.readlocks[key] = readlock
+        return dataset
+
+    def release(self, key):
+        """
+        Releases the readlock of this process on a dataset, and removes the
+        files of the dataset if no other process uses it. The arrays
+        already memory-mapped remain valid.
+
+        Parameters
+        ----------
+        key : str
+            Key of the dataset.
+        """
+        readlock = self.readlocks.pop(key, None)
+        if readlock is None:
+            return
+        with _locked(os.path.join(self.directory, key + '.lock')):
+            if os.path.isdir(readlock):
+                os.rmdir(readlock)
+            if len(self.readers(key)) == 0:
+                log.info("Removing shared dataset %s", key)
+                for name in ['meta', 'X', 'y']:
+                    if os.path.exists(self.path(key, name)):
+                        os.remove(self.path(key, name))
+
+    def release_all(self):
+        """
+        Releases all the datasets used by this process.
+        """
+        if os.getpid() != self.pid:
+            # Forked child: the readlocks belong to the parent
+            return
+        for key in list(self.readlocks.keys()):
+            self.release(key)
+
+
+registry = SharedDatasetRegistry()
+
+
+def load_shared(yaml_src):
+    """
+    Returns a dataset shared in memory between the processes of this
+    machine, using the default registry.
+
+    Parameters
+    ----------
+    yaml_src : str
+        YAML description of a DenseDesignMatrix dataset. Processes passing
+        the same description share the same copy of the data.
+
+    Returns
+    -------
+    dataset : DenseDesignMatrix
+        The dataset. Its design matrix and targets are read-only.
+    """
+    return registry.load(yaml_src)
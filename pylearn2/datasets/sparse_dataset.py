@@ -25,6 +25,7 @@ from pylearn2.utils.iteration import (
     FiniteDatasetIterator,
     resolve_iterator_class
 )
+from pylearn2.utils.rng import make_np_rng
 
 
 class SparseDataset(Dataset):
@@ -46,10 +47,21 @@ class SparseDataset(Dataset):
         used only when load_path is specified.
         indicates whether the input matrix is zipped or not.
         defaults to True.
+    rng : object, optional
+        A random number generator used for picking random indices into the
+        design matrix when choosing minibatches.
+
+    Notes
+    -----
+    The examples are stored as a CSR matrix, whose rows can be sliced
+    without densifying them, and the iterators yield CSR minibatches.
     """
 
+    _default_seed = (17, 2, 946)
+
     def __init__(self, load_path=None,
-                 from_scipy_sparse_dataset=None, zipped_npy=True):
+                 from_scipy_sparse_dataset=None, zipped_npy=True,
+                 rng=_default_seed):
 
         self.load_path = load_path
         self.y = None
@@ -70,6 +82,11 @@ class SparseDataset(Dataset):
                 msg = "from_scipy_sparse_dataset is not sparse : %s" \
                       % type(self.X)
                 raise TypeError(msg)
+            if not scipy.sparse.isspmatrix_csr(self.X):
+                self.X = self.X.tocsr()
+
+        self.rng = make_np_rng(rng, which_method="random_integers")
+        self._iter_subset_class = resolve_iterator_class('sequential')
 
         X_space = VectorSpace(dim=self.X.shape[1], sparse=True)
         self.X_space = X_space
@@ -89,9 +106,15 @@ class SparseDataset(Dataset):
     @wraps(Dataset.get_batch_design)
     def get_batch_design(self, batch_size, include_labels=False):
         """Method inherited from Dataset"""
-        self.iterator(mode='shuffled_sequential',
-                      batch_size=batch_size, num_batches=None)
-        return self.next()
+        try:
+            idx = self.rng.randint(self.X.shape[0] - batch_size + 1)
+        except ValueError:
+            if batch_size > self.X.shape[0]:
+                reraise_as(ValueError("Requested %d examples from a dataset "
+                                      "containing only %d." %
+                                      (batch_size, self.X.shape[0])))
+            raise
+        return self.X[idx:idx + batch_size]
 
     @wraps(Dataset.get_batch_topo)
     def get_batch_topo(self, batch_size):
@@ -106,3 +106,102 @@ def test_from_dataset():
     assert slice_d.X.shape[1] == d3.X.shape[1]
     assert slice_d.X.shape[0] == 5
     assert slice_d.y.shape[0] == 5
+
+
+def test_set_topo_layout():
+    """
+    Tests that the batches served from the laid out features are the same
+    as the converted ones, contiguous, that the layout is dropped when the
+    design matrix is replaced, and that a saved layout is only reused for
+    the same data.
+    """
+    import os
+    import shutil
+    import tempfile
+    from pylearn2.space import Conv2DSpace
+
+    rng = np.random.RandomState([2015, 5, 3])
+    topo_view = rng.randn(13, 4, 5, 3).astype('float32')
+    d = DenseDesignMatrix(topo_view=topo_view)
+    space = Conv2DSpace(shape=(4, 5), num_channels=3,
+                        axes=('c', 0, 1, 'b'), dtype='float32')
+    expected = [b.copy() for b in
+                d.iterator(mode='sequential', batch_size=4,
+                           data_specs=(space, 'features'))]
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for path in [None, os.path.join(tmp_dir, 'c01b.npy')]:
+            d.set_topo_layout(space, path)
+            batches = list(d.iterator(mode='sequential', batch_size=4,
+                                      data_specs=(space, 'features')))
+            assert len(batches) == len(expected)
+            for batch, e in zip(batches, expected):
+                assert batch.flags.c_contiguous
+                assert np.all(batch == e)
+        assert os.path.exists(path)
+        mtime = os.path.getmtime(path)
+        d.set_topo_layout(space, path)
+        assert os.path.getmtime(path) == mtime
+
+        d.set_design_matrix(d.X * 2.)
+        batch = next(d.iterator(mode='sequential', batch_size=4,
+                                data_specs=(space, 'features')))
+        assert np.allclose(batch, 2. * expected[0])
+        d.set_topo_layout(space, path)
+        batch = next(d.iterator(mode='sequential', batch_size=4,
+                                data_specs=(space, 'features')))
+        assert np.allclose(batch, 2. * expected[0])
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_compact_storage():
+    """
+    Tests that compactly stored datasets serve decoded batches, exactly for
+    integer data in range, and approximately otherwise, also once pickled
+    with compression.
+    """
+    from theano import config
+    from theano.compat.six.moves import cPickle
+    from pylearn2.space import Conv2DSpace, VectorSpace
+
+    rng = np.random.RandomState([2015, 5, 4])
+    topo_view = rng.randint(0, 256, size=(10, 4, 5, 3)).astype(config.floatX)
+    d = DenseDesignMatrix(topo_view=topo_view)
+    X = d.X.copy()
+    d.set_compact_storage('uint8')
+    assert d.X.dtype == 'uint8'
+    assert np.all(d.get_design_matrix() == X)
+    assert np.all(d.get_topological_view() == topo_view)
+    space = Conv2DSpace(shape=(4, 5), num_channels=3, axes=('b', 'c', 0, 1))
+    for batch, expected in zip(
+            d.iterator(mode='sequential', batch_size=4,
+                       data_specs=(space, 'features')),
+            [topo_view[:4], topo_view[4:8], topo_view[8:]]):
+        assert batch.dtype == config.floatX
+        assert np.all(batch == expected.transpose(0, 3, 1, 2))
+
+    d.enable_compression()
+    loaded = cPickle.loads(cPickle.dumps(d))
+    assert loaded.X.dtype == 'uint8'
+    assert np.all(loaded.get_design_matrix() == X)
+
+    X = rng.randn(12, 6).astype(config.floatX)
+    X[:, 2] *= 100.
+    for dtype, per_feature, tol in [('int16', True, 1e-2),
+                                    ('uint8', False, 2.),
+                                    ('float16', False, .5)]:
+        d = DenseDesignMatrix(X=X)
+        d.set_compact_storage(dtype, per_feature, reuse_buffer=True)
+        it = d.iterator(mode='sequential', batch_size=6,
+                        data_specs=(VectorSpace(6), 'features'))
+        first = next(it)
+        assert np.allclose(first, X[:6], atol=tol)
+        second = next(it)
+        assert second is first
+        assert np.allclose(second, X[6:], atol=tol)
+
+    d.set_design_matrix(X)
+    assert d.X is X
+    assert d.get_design_matrix() is X
@@ -0,0 +1,86 @@
+"""
+Tests for pylearn2.datasets.shared_memory
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import theano
+from theano import tensor
+
+from pylearn2.datasets.preprocessing import Preprocessor
+from pylearn2.datasets.shared_memory import SharedDatasetRegistry
+
+
+class Double(Preprocessor):
+    """
+    Doubles the design matrix with a Theano function.
+    """
+    def apply(self, dataset, can_fit=False):
+        """
+        Doubles the design matrix of a dataset.
+
+        Parameters
+        ----------
+        dataset : DenseDesignMatrix
+        can_fit : bool
+            Not used.
+        """
+        X = tensor.matrix(dtype=dataset.X.dtype)
+        f = theano.function([X], 2 * X)
+        dataset.X = f(dataset.X)
+
+
+def test_shared_dataset():
+    """
+    Tests that a dataset is loaded once, that the other readers memory-map
+    it read-only, and that it is removed when its last reader releases it.
+    """
+    yaml_src = ("!obj:pylearn2.testing.datasets.ArangeDataset "
+                "{num_examples: 10}")
+    directory = tempfile.mkdtemp()
+    try:
+        first = SharedDatasetRegistry(directory)
+        second = SharedDatasetRegistry(directory)
+        key = first.key(yaml_src)
+
+        dataset = first.load(yaml_src)
+        assert os.path.exists(first.path(key, 'meta'))
+        assert np.all(dataset.X[:, 0] == np.arange(10))
+        assert isinstance(dataset.X, np.memmap)
+        assert not dataset.X.flags.writeable
+
+        # The second reader does not load the dataset again
+        mtime = os.path.getmtime(first.path(key, 'X'))
+        other = second.load(yaml_src)
+        assert os.path.getmtime(first.path(key, 'X')) == mtime
+        assert np.all(other.X == dataset.X)
+        assert len(first.readers(key)) == 2
+
+        first.release(key)
+        assert os.path.exists(first.path(key, 'X'))
+        second.release_all()
+        assert not os.path.exists(first.path(key, 'X'))
+        assert not os.path.exists(first.path(key, 'meta'))
+        assert np.all(other.X[:, 0] == np.arange(10))
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_compiling_preprocessor():
+    """
+    Tests that a dataset whose loading compiles a Theano function can be
+    shared.
+    """
+    yaml_src = ("!obj:pylearn2.datasets.dense_design_matrix.DenseDesignMatrix "
+                "{X: !obj:numpy.ones {shape: [4, 3]}, preprocessor: "
+                "!obj:pylearn2.datasets.tests.test_shared_memory.Double {}}")
+    directory = tempfile.mkdtemp()
+    try:
+        registry = SharedDatasetRegistry(directory)
+        dataset = registry.load(yaml_src)
+        assert np.all(dataset.X == 2.)
+        registry.release_all()
+    finally:
+        shutil.rmtree(directory)
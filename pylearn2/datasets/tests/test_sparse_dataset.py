@@ -8,7 +8,7 @@ from pylearn2.train import Train
 from pylearn2.models.model import Model
 from pylearn2.space import VectorSpace
 from pylearn2.termination_criteria import EpochCounter
-from scipy.sparse import csr_matrix
+from scipy.sparse import csr_matrix, csc_matrix, isspmatrix_csr
 from pylearn2.costs.cost import Cost, DefaultDataSpecsMixin
 from pylearn2.training_algorithms.sgd import SGD
 from pylearn2.utils import sharedX
@@ -105,6 +105,22 @@ def test_iterator():
     it.next()
 
 
+def test_csr_batches():
+    """
+    Tests that the minibatches are CSR matrices, whatever the format of
+    the data and the iteration mode.
+    """
+    x = csc_matrix([[1, 2, 0], [0, 0, 3], [4, 0, 5], [0, 6, 0]])
+    ds = SparseDataset(from_scipy_sparse_dataset=x)
+    for mode in ['sequential', 'shuffled_sequential', 'random_uniform']:
+        for batch in ds.iterator(mode=mode, batch_size=2, num_batches=2):
+            assert isspmatrix_csr(batch)
+            assert batch.shape == (2, 3)
+    batch = ds.get_batch_design(3)
+    assert isspmatrix_csr(batch)
+    assert batch.shape == (3, 3)
+
+
 def test_training_a_model():
     """
     tests wether SparseDataset can be trained
@@ -607,6 +607,7 @@ whitelist_docstrings.extend([
 whitelist_docstrings.extend([
     'sandbox/rnn/models/mlp_hook.py',
     'training_algorithms/tests/test_learning_rule.py',
+    'training_algorithms/tests/test_schedule.py',
     'models/pca.py',
     'datasets/tests/test_hdf5.py',
     'linear/tests/test_conv2d_c01b.py',
@@ -5,6 +5,9 @@
 """
 import numpy
 import theano
+from theano.compat.six.moves import xrange
+
+from pylearn2.utils.forked_pool import ForkedPool
 T = theano.tensor
 
 
@@ -62,13 +65,23 @@ class ParzenWindows(object):
         See description for make_lpdf
     """
     def __init__(self, samples, sigma):
-        # just keeping these for debugging/examination, not needed
+        # the samples and sigma are all get_ll needs
         self._samples = samples
         self._sigma = sigma
+        self._lpdf = None
 
-        self.lpdf = make_lpdf(samples, sigma)
+    @property
+    def lpdf(self):
+        """
+        The theano function returned by `make_lpdf` for the samples and
+        sigma of the estimator, compiled the first time it is used.
+        `get_ll` does not use it.
+        """
+        if getattr(self, '_lpdf', None) is None:
+            self._lpdf = make_lpdf(self._samples, self._sigma)
+        return self._lpdf
 
-    def get_ll(self, x, batch_size=10):
+    def get_ll(self, x, batch_size=None, max_memory=2 ** 27, num_workers=1):
         """
         Evaluates the log likelihood of a set of datapoints with respect to the
         probability distribution.
@@ -78,12 +91,207 @@ class ParzenWindows(object):
         x : numpy matrix
             The set of points for which you want to evaluate the log \
             likelihood.
+        batch_size : int, optional
+            Maximum number of points of `x` per block. See
+            `parzen_log_likelihoods`.
+        max_memory : int, optional
+            See `parzen_log_likelihoods`.
+        num_workers : int, optional
+            See `parzen_log_likelihoods`.
+
+        Returns
+        -------
+        ll : float
+            The mean log likelihood of the points.
         """
-        inds = range(x.shape[0])
-        n_batches = int(numpy.ceil(float(len(inds)) / batch_size))
+        lls = parzen_log_likelihoods(self._samples, x, [self._sigma],
+                                     batch_size=batch_size,
+                                     max_memory=max_memory,
+                                     num_workers=num_workers)
+        return lls[0].mean()
+
+
+def _tile_sizes(num_points, num_samples, batch_size, max_memory):
+    """
+    Chooses the numbers of points and of samples per block, so that a
+    block of squared distances and its temporaries fit in `max_memory`
+    bytes.
+
+    Parameters
+    ----------
+    num_points : int
+        Number of points to evaluate.
+    num_samples : int
+        Number of samples of the estimator.
+    batch_size : int or None
+        If not None, maximum number of points per block.
+    max_memory : int
+        Memory budget of a block, in bytes.
+
+    Returns
+    -------
+    points_per_block, samples_per_block : int
+    """
+    # A block of distances and one temporary of the same size, in float64
+    max_elems = max(1, max_memory // 16)
+    points_per_block = min(num_points, max(1, int(numpy.sqrt(max_elems))))
+    if batch_size is not None:
+        points_per_block = min(points_per_block, batch_size)
+    samples_per_block = min(num_samples,
+                            max(1, max_elems // points_per_block))
+    return points_per_block, samples_per_block
+
+
+def _log_likelihoods_range(job, bounds):
+    """
+    Computes the log densities of a range of the points of an evaluation
+    job for all its sigmas.
+
+    The points are processed in blocks, and for each block of points the
+    samples are processed in blocks too, the log-sum-exp over the samples
+    being accumulated on the fly with a running maximum.
+
+    Parameters
+    ----------
+    job : dict
+        The arguments of the evaluation.
+    bounds : tuple
+        Range (start, stop) of the points to evaluate.
+
+    Returns
+    -------
+    lls : numpy.ndarray
+        Matrix of shape (len(sigmas), stop - start).
+    """
+    start, stop = bounds
+    samples = job['samples']
+    samples_sq = job['samples_sq']
+    x = job['x']
+    sigmas = job['sigmas']
+    points_per_block = job['points_per_block']
+    samples_per_block = job['samples_per_block']
+    num_samples, dim = samples.shape
+    coeffs = -0.5 / sigmas ** 2
+
+    lls = numpy.empty((len(sigmas), stop - start))
+    for i in xrange(start, stop, points_per_block):
+        x_block = numpy.asarray(x[i:min(i + points_per_block, stop)],
+                                dtype='float64')
+        x_sq = (x_block ** 2).sum(axis=1)
+        max_ = numpy.empty((len(sigmas), x_block.shape[0]))
+        max_.fill(-numpy.inf)
+        sum_ = numpy.zeros_like(max_)
+        for j in xrange(0, num_samples, samples_per_block):
+            mu = samples[j:j + samples_per_block]
+            # Squared distances, shared by all the sigmas
+            sq_dist = numpy.dot(x_block, -2. * mu.T)
+            sq_dist += x_sq[:, None]
+            sq_dist += samples_sq[None, j:j + samples_per_block]
+            numpy.maximum(sq_dist, 0., out=sq_dist)
+            min_sq_dist = sq_dist.min(axis=1)
+            for k, coeff in enumerate(coeffs):
+                new_max = numpy.maximum(max_[k], coeff * min_sq_dist)
+                exps = numpy.exp(coeff * sq_dist - new_max[:, None])
+                sum_[k] = (sum_[k] * numpy.exp(max_[k] - new_max) +
+                           exps.sum(axis=1))
+                max_[k] = new_max
+        lls[:, i - start:i - start + x_block.shape[0]] = max_ + numpy.log(sum_)
+
+    log_norm = numpy.log(num_samples) + \
+        dim * numpy.log(sigmas * numpy.sqrt(numpy.pi * 2))
+    return lls - log_norm[:, None]
+
+
+def parzen_log_likelihoods(samples, x, sigmas, batch_size=None,
+                           max_memory=2 ** 27, num_workers=1):
+    """
+    Computes the log densities of points under Parzen windows estimators
+    with Gaussian kernels centered on `samples`, for several values of the
+    standard deviation of the kernels.
+
+    Rather than building a (points, samples, dim) tensor, the squared
+    distances are computed as ||x||^2 - 2 x.mu + ||mu||^2 in blocks of
+    points and samples whose size is bounded by `max_memory`, and each
+    block of distances is reused for all the sigmas. The points can be
+    split across several processes.
+
+    Parameters
+    ----------
+    samples : numpy matrix
+        The samples the estimators are built from, one per row.
+    x : numpy matrix
+        The points to evaluate, one per row.
+    sigmas : list of floats
+        The standard deviations of the kernels.
+    batch_size : int, optional
+        If not None, maximum number of points per block.
+    max_memory : int, optional
+        Approximate memory used by the blocks of each process, in bytes.
+    num_workers : int, optional
+        Number of processes evaluating disjoint shards of the points.
+
+    Returns
+    -------
+    lls : numpy.ndarray
+        Matrix of shape (len(sigmas), len(x)), the log density of each
+        point for each sigma.
+    """
+    samples = numpy.asarray(samples, dtype='float64')
+    sigmas = numpy.asarray(sigmas, dtype='float64')
+    num_points = x.shape[0]
+    points_per_block, samples_per_block = _tile_sizes(num_points,
+                                                      samples.shape[0],
+                                                      batch_size, max_memory)
+    job = {'samples': samples,
+           'samples_sq': (samples ** 2).sum(axis=1),
+           'x': x,
+           'sigmas': sigmas,
+           'points_per_block': points_per_block,
+           'samples_per_block': samples_per_block}
+    if num_workers <= 1:
+        return _log_likelihoods_range(job, (0, num_points))
+    bounds = numpy.linspace(0, num_points, num_workers + 1).astype('int64')
+    tasks = [(bounds[i], bounds[i + 1]) for i in xrange(num_workers)
+             if bounds[i] < bounds[i + 1]]
+    # The workers are forked, so they inherit the samples and the points
+    # without pickling them
+    with ForkedPool(lambda task: _log_likelihoods_range(job, task),
+                    num_workers) as pool:
+        lls = pool.map(tasks)
+    return numpy.concatenate(lls, axis=1)
+
+
+def cross_validate_sigma(samples, x, sigmas, batch_size=None,
+                         max_memory=2 ** 27, num_workers=1):
+    """
+    Selects the standard deviation of the kernels of a Parzen windows
+    estimator that maximizes the mean log likelihood of validation points.
+    All the sigmas are evaluated with the same blocks of distances.
 
-        lls = []
-        for i in range(n_batches):
-            lls.extend(self.lpdf(x[inds[i::n_batches]]))
+    Parameters
+    ----------
+    samples : numpy matrix
+        The samples the estimators are built from, one per row.
+    x : numpy matrix
+        The validation points, one per row.
+    sigmas : list of floats
+        The grid of standard deviations to try.
+    batch_size : int, optional
+        See `parzen_log_likelihoods`.
+    max_memory : int, optional
+        See `parzen_log_likelihoods`.
+    num_workers : int, optional
+        See `parzen_log_likelihoods`.
 
-        return numpy.array(lls).mean()
+    Returns
+    -------
+    best_sigma : float
+        The sigma with the highest mean log likelihood.
+    mean_lls : numpy.ndarray
+        The mean log likelihood of the points for each sigma.
+    """
+    lls = parzen_log_likelihoods(samples, x, sigmas, batch_size=batch_size,
+                                 max_memory=max_memory,
+                                 num_workers=num_workers)
+    mean_lls = lls.mean(axis=1)
+    return sigmas[int(numpy.argmax(mean_lls))], mean_lls
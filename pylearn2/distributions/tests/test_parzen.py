@@ -0,0 +1,54 @@
+"""
+Tests for pylearn2.distributions.parzen
+"""
+import numpy as np
+from theano import config
+
+from pylearn2.distributions.parzen import (make_lpdf, ParzenWindows,
+                                           parzen_log_likelihoods,
+                                           cross_validate_sigma)
+
+
+def test_parzen_log_likelihoods():
+    """
+    Tests that the blocked evaluation matches the theano estimator, for
+    several sigmas, tile sizes and numbers of workers.
+    """
+    rng = np.random.RandomState([2015, 4, 26])
+    samples = rng.randn(100, 6).astype(config.floatX)
+    x = rng.randn(23, 6).astype(config.floatX)
+    sigmas = [.5, 1., 2.]
+    expected = [make_lpdf(samples, sigma)(x) for sigma in sigmas]
+
+    for batch_size, max_memory, num_workers in [(None, 2 ** 27, 1),
+                                                (4, 16 * 30, 1),
+                                                (None, 16 * 50, 3)]:
+        lls = parzen_log_likelihoods(samples, x, sigmas,
+                                     batch_size=batch_size,
+                                     max_memory=max_memory,
+                                     num_workers=num_workers)
+        assert lls.shape == (len(sigmas), x.shape[0])
+        for ll, e in zip(lls, expected):
+            assert np.allclose(ll, e, rtol=1e-4)
+
+    pw = ParzenWindows(samples, 1.)
+    assert np.allclose(pw.get_ll(x), expected[1].mean(), rtol=1e-4)
+    assert pw._lpdf is None
+    assert np.allclose(pw.lpdf(x), expected[1])
+
+
+def test_cross_validate_sigma():
+    """
+    Tests that cross-validation picks the sigma with the best mean log
+    likelihood.
+    """
+    rng = np.random.RandomState([2015, 4, 27])
+    samples = (.3 * rng.randn(200, 2)).astype(config.floatX)
+    x = (.3 * rng.randn(50, 2)).astype(config.floatX)
+    sigmas = [.01, .1, 10.]
+    best_sigma, mean_lls = cross_validate_sigma(samples, x, sigmas,
+                                                max_memory=16 * 500)
+    assert best_sigma == .1
+    for sigma, mean_ll in zip(sigmas, mean_lls):
+        assert np.allclose(mean_ll, make_lpdf(samples, sigma)(x).mean(),
+                           rtol=1e-4)
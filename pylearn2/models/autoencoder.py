@@ -9,6 +9,7 @@ import operator
 import numpy
 import theano
 from theano import tensor
+import theano.sparse
 from theano.compat.six.moves import zip as izip, reduce
 
 # Local imports
@@ -140,10 +141,15 @@ class Autoencoder(AbstractAutoencoder):
     rng : RandomState object or seed, optional
         NumPy random number generator object (or seed to create one) used
         to initialize the model parameters.
+    sparse_input : bool, optional
+        If `True`, the model expects CSR minibatches, such as those of a
+        `SparseDataset`. They are encoded with a structured dot product,
+        without being densified.
     """
 
     def __init__(self, nvis, nhid, act_enc, act_dec,
-                 tied_weights=False, irange=1e-3, rng=9001):
+                 tied_weights=False, irange=1e-3, rng=9001,
+                 sparse_input=False):
         """
         WRITEME
         """
@@ -151,7 +157,7 @@ class Autoencoder(AbstractAutoencoder):
         assert nvis > 0, "Number of visible units must be non-negative"
         assert nhid > 0, "Number of hidden units must be positive"
 
-        self.input_space = VectorSpace(nvis)
+        self.input_space = VectorSpace(nvis, sparse=sparse_input)
         self.output_space = VectorSpace(nhid)
 
         # Save a few parameters needed for resizing
@@ -333,6 +339,9 @@ class Autoencoder(AbstractAutoencoder):
         y : tensor_like
             (Symbolic) input flowing into the hidden layer nonlinearity.
         """
+        if isinstance(x, theano.sparse.SparseVariable):
+            return self.hidbias + theano.sparse.structured_dot(x,
+                                                               self.weights)
         return self.hidbias + tensor.dot(x, self.weights)
 
     def upward_pass(self, inputs):
@@ -400,6 +409,52 @@ class Autoencoder(AbstractAutoencoder):
         else:
             return [self.decode(v) for v in hiddens]
 
+    def decode_entries(self, hiddens, rows, cols):
+        """
+        Computes the input to the decoder nonlinearity for some entries of
+        the reconstruction only, without computing the full reconstruction.
+
+        Parameters
+        ----------
+        hiddens : tensor_like
+            Theano symbolic representing the hidden units of a minibatch.
+        rows : tensor_like
+            Integer vector, the example of each entry.
+        cols : tensor_like
+            Integer vector, the visible unit of each entry.
+
+        Returns
+        -------
+        entries : tensor_like
+            Theano vector containing, for each i, the input to the decoder
+            nonlinearity of visible unit `cols[i]` of example `rows[i]`.
+        """
+        w_prime = self.w_prime.T
+        return (self.visbias[cols] +
+                (hiddens[rows] * w_prime[cols]).sum(axis=1))
+
+    def reconstruct_entries(self, inputs, rows, cols):
+        """
+        Encodes a minibatch and computes the input to the decoder
+        nonlinearity for some entries of its reconstruction only.
+
+        Parameters
+        ----------
+        inputs : tensor_like
+            Theano symbolic representing the input minibatch, which may be
+            sparse.
+        rows : tensor_like
+            Integer vector, the example of each entry.
+        cols : tensor_like
+            Integer vector, the visible unit of each entry.
+
+        Returns
+        -------
+        entries : tensor_like
+            Theano vector, see `decode_entries`.
+        """
+        return self.decode_entries(self.encode(inputs), rows, cols)
+
     def get_weights(self, borrow=False):
         """
         .. todo::
@@ -437,6 +492,8 @@ class DenoisingAutoencoder(Autoencoder):
         WRITEME
     irange : WRITEME
     rng : WRITEME
+    sparse_input : bool, optional
+        Whether the model expects CSR minibatches.
 
     Notes
     -----
@@ -445,7 +502,8 @@ class DenoisingAutoencoder(Autoencoder):
     for details.
     """
     def __init__(self, corruptor, nvis, nhid, act_enc, act_dec,
-                 tied_weights=False, irange=1e-3, rng=9001):
+                 tied_weights=False, irange=1e-3, rng=9001,
+                 sparse_input=False):
         super(DenoisingAutoencoder, self).__init__(
             nvis,
             nhid,
@@ -453,7 +511,8 @@ class DenoisingAutoencoder(Autoencoder):
             act_dec,
             tied_weights,
             irange,
-            rng
+            rng,
+            sparse_input
         )
         self.corruptor = corruptor
 
@@ -479,6 +538,30 @@ class DenoisingAutoencoder(Autoencoder):
         corrupted = self.corruptor(inputs)
         return super(DenoisingAutoencoder, self).reconstruct(corrupted)
 
+    def reconstruct_entries(self, inputs, rows, cols):
+        """
+        Corrupts and encodes a minibatch and computes the input to the
+        decoder nonlinearity for some entries of its reconstruction only.
+
+        Parameters
+        ----------
+        inputs : tensor_like
+            Theano symbolic representing the input minibatch, which may be
+            sparse if the corruptor supports it.
+        rows : tensor_like
+            Integer vector, the example of each entry.
+        cols : tensor_like
+            Integer vector, the visible unit of each entry.
+
+        Returns
+        -------
+        entries : tensor_like
+            Theano vector, see `Autoencoder.decode_entries`.
+        """
+        corrupted = self.corruptor(inputs)
+        return super(DenoisingAutoencoder, self).reconstruct_entries(
+            corrupted, rows, cols)
+
 
 class ContractiveAutoencoder(Autoencoder):
     """
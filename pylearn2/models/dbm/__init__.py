@@ -233,6 +233,34 @@ def flatten(l):
         return [l]
     return rval
 
+
+def unflatten(l, template):
+    """
+    Inverse of `flatten`: arranges the objects of a flat list with the
+    same nesting of lists and tuples as `template`.
+
+    Parameters
+    ----------
+    l : list
+        Flat list of objects, as returned by `flatten(template)`.
+    template : list, tuple or other object
+        The nested structure to reproduce.
+
+    Returns
+    -------
+    rval : list, tuple or other object
+        The objects of `l`, nested like `template`.
+    """
+    elems = iter(l)
+
+    def rebuild(elem):
+        if isinstance(elem, (list, tuple)):
+            return type(elem)(rebuild(sub_elem) for sub_elem in elem)
+        return next(elems)
+
+    return rebuild(template)
+
+
 def block(l):
     """
     .. todo::
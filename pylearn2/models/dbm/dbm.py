@@ -551,8 +551,9 @@ class DBM(Model):
         all the odd-indexed layers.
         """
 
-        updated = self.sampling_procedure.sample(layer_to_state, theano_rng,
-                                                 layer_to_clamp, num_steps)
+        updated, procedure_updates = \
+            self.sampling_procedure.sample_with_updates(
+                layer_to_state, theano_rng, layer_to_clamp, num_steps)
 
         rval = OrderedDict()
 
@@ -584,6 +585,12 @@ class DBM(Model):
             else:
                 add_updates(old, new)
 
+        # State kept by the sampling procedure itself, e.g. the tempered
+        # replicas of ParallelTempering
+        for key, value in procedure_updates.items():
+            assert key not in rval
+            rval[key] = value
+
         assert isinstance(self.hidden_layers, list)
 
         if return_layer_to_updated:
@@ -617,6 +624,15 @@ class DBM(Model):
             for key in ch:
                 rval['mf_' + layer.layer_name + '_' + key] = ch[key]
 
+        ch = self.sampling_procedure.get_monitoring_channels()
+        for key in ch:
+            rval[key] = ch[key]
+
+        # e.g. the number of mean field iterations run in a scan loop
+        ch = self.inference_procedure.get_monitoring_channels()
+        for key in ch:
+            rval[key] = ch[key]
+
         if len(history) > 1:
             prev_q = history[-2]
 
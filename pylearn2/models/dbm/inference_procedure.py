@@ -11,12 +11,15 @@ import functools
 import logging
 
 from theano.compat.six.moves import xrange
+from theano import config
 from theano import gof
 import theano.tensor as T
 import theano
 from theano.gof.op import get_debug_values
+from theano.ifelse import ifelse
 
-from pylearn2.models.dbm import block, flatten
+from pylearn2.compat import OrderedDict
+from pylearn2.models.dbm import block, flatten, unflatten
 from pylearn2.models.dbm.layer import Softmax
 from pylearn2.utils import safe_izip, block_gradient, safe_zip
 
@@ -32,8 +35,35 @@ class InferenceProcedure(object):
     Different subclasses can implement different specific procedures, such as
     updating the layers in different orders, or using different strategies to
     initialize the mean field expectations.
+
+    By default, `mf` unrolls all of its iterations into the graph. With
+    `use_scan`, the iterations after the first one run in a theano scan
+    loop instead, so the size of the compiled graph does not depend on the
+    number of iterations, and the loop stops early once the batch has
+    converged to within `tol`. `return_history` then only returns the last
+    two states, and `block_grad` is not supported.
+
+    Parameters
+    ----------
+    use_scan : bool, optional
+        Whether to run the mean field iterations in a scan loop.
+    tol : float, optional
+        Only used with `use_scan`. If not None, inference stops as soon as
+        no variational parameter of the batch changes by more than `tol`
+        in one iteration. Leave it None to backpropagate through mean
+        field, so that all the batches get the same number of iterations.
     """
 
+    use_scan = False
+    tol = None
+    _niter_used = None
+
+    def __init__(self, use_scan=False, tol=None):
+        if tol is not None and not use_scan:
+            raise ValueError("tol is only supported with use_scan=True.")
+        self.use_scan = use_scan
+        self.tol = tol
+
     def set_dbm(self, dbm):
         """
         Associates the InferenceProcedure with a specific DBM.
@@ -81,6 +111,178 @@ class InferenceProcedure(object):
         """
         raise NotImplementedError(str(type(self)) + " does not implement mf.")
 
+    def get_monitoring_channels(self):
+        """
+        Returns monitoring channels about the last call to `mf`. With
+        `use_scan`, this is the number of mean field iterations that were
+        actually run.
+
+        Returns
+        -------
+        channels : OrderedDict
+            Maps channel names to theano expressions.
+        """
+        rval = OrderedDict()
+        if self._niter_used is not None:
+            rval['mf_niter_used'] = self._niter_used
+        return rval
+
+    def _update_layers(self, V, Y, H_hat, order):
+        """
+        Updates the mean field parameters of the hidden layers one at a
+        time.
+
+        Parameters
+        ----------
+        V : Input space batch
+            The values of the input features modeled by the DBM.
+        Y : Target space batch or None
+            If not None, the last hidden layer is clamped to `Y` and is not
+            updated.
+        H_hat : list
+            The current mean field state of each hidden layer.
+        order : iterable
+            The indices of the layers to update, in order.
+
+        Returns
+        -------
+        H_hat : list
+            The new mean field state of each hidden layer.
+        """
+        dbm = self.dbm
+        H_hat = list(H_hat)
+        for j in order:
+            if Y is not None and j == len(H_hat) - 1:
+                continue
+            if j == 0:
+                state_below = dbm.visible_layer.upward_state(V)
+            else:
+                state_below = dbm.hidden_layers[
+                    j - 1].upward_state(H_hat[j - 1])
+            if j == len(H_hat) - 1:
+                state_above = None
+                layer_above = None
+            else:
+                state_above = dbm.hidden_layers[
+                    j + 1].downward_state(H_hat[j + 1])
+                layer_above = dbm.hidden_layers[j + 1]
+            H_hat[j] = dbm.hidden_layers[j].mf_update(
+                state_below=state_below,
+                state_above=state_above,
+                layer_above=layer_above)
+        return H_hat
+
+    def _mf_iteration(self, V, Y, H_hat, i):
+        """
+        Performs one iteration of mean field inference. The default updates
+        the even layers, then the odd layers.
+
+        Parameters
+        ----------
+        V : Input space batch
+            The values of the input features modeled by the DBM.
+        Y : Target space batch or None
+            If not None, the last hidden layer is clamped to `Y`.
+        H_hat : list
+            The current mean field state of each hidden layer.
+        i : int or theano scalar
+            The index of the iteration, symbolic inside a scan loop.
+
+        Returns
+        -------
+        H_hat : list
+            The new mean field state of each hidden layer.
+        """
+        num_layers = len(H_hat)
+        order = list(xrange(0, num_layers, 2)) + \
+            list(xrange(1, num_layers, 2))
+        return self._update_layers(V, Y, H_hat, order)
+
+    def _scan_mf(self, V, Y, H_hat, niter, return_history, block_grad):
+        """
+        Runs the iterations of mean field inference that follow the first
+        one in a scan loop, stopping early if `self.tol` is not None.
+
+        Parameters
+        ----------
+        V : Input space batch
+            The values of the input features modeled by the DBM.
+        Y : Target space batch or None
+            If not None, the last hidden layer is clamped to `Y`.
+        H_hat : list
+            The mean field state after the first iteration.
+        niter : int
+            The maximum number of iterations, including the first one.
+        return_history : bool
+            If True, returns the last two states rather than the last one.
+        block_grad : int or None
+            Must be None.
+
+        Returns
+        -------
+        result : list
+            The final mean field state, or if `return_history`, a list
+            containing the previous and the final states.
+        """
+        if block_grad is not None:
+            raise NotImplementedError("block_grad is not supported when "
+                                      "mean field runs in a scan loop.")
+        dbm = self.dbm
+        history = [list(H_hat)]
+
+        if niter > 1 and len(H_hat) > 1:
+            # The state clamped to Y is not a loop variable
+            if Y is not None:
+                free = H_hat[:-1]
+            else:
+                free = H_hat
+            flat = flatten(free)
+
+            def step(i, *flat_prev):
+                prev = list(unflatten(flat_prev, free))
+                if Y is not None:
+                    prev.append(Y)
+                new = self._mf_iteration(V, Y, prev, i)
+                if Y is not None:
+                    new = new[:-1]
+                flat_new = flatten(new)
+                if self.tol is None:
+                    return flat_new
+                diff = functools.reduce(
+                    T.maximum,
+                    [abs(new_elem - prev_elem).max()
+                     for new_elem, prev_elem in safe_zip(flat_new, flat_prev)])
+                return flat_new, theano.scan_module.until(diff < self.tol)
+
+            outputs, _ = theano.scan(step,
+                                     sequences=T.arange(1, niter),
+                                     outputs_info=flat)
+            if not isinstance(outputs, list):
+                outputs = [outputs]
+
+            H_hat = list(unflatten([output[-1] for output in outputs], free))
+            # The iteration before the last one may be the first one
+            prev = [T.concatenate([T.shape_padleft(elem), output])[-2]
+                    for elem, output in safe_zip(flat, outputs)]
+            prev = list(unflatten(prev, free))
+            if Y is not None:
+                H_hat.append(Y)
+                prev.append(Y)
+            history = [prev, H_hat]
+            niter_used = 1 + outputs[0].shape[0]
+        else:
+            niter_used = 1
+        self._niter_used = T.cast(niter_used, config.floatX)
+
+        for layer, state in safe_izip(dbm.hidden_layers, H_hat):
+            upward_state = layer.upward_state(state)
+            layer.get_output_space().validate(upward_state)
+
+        if return_history:
+            return history
+        else:
+            return H_hat
+
     def set_batch_size(self, batch_size):
         """
         If the inference procedure is dependent on a batch size at all, makes
@@ -192,6 +394,13 @@ class WeightDoubling(InferenceProcedure):
     lack of top-down input on the first pass. This approach is
     described in "Deep Boltzmann Machines", Salakhutdinov and
     Hinton, 2008.
+
+    Parameters
+    ----------
+    use_scan : bool, optional
+        See `InferenceProcedure`.
+    tol : float, optional
+        See `InferenceProcedure`.
     """
 
     @functools.wraps(InferenceProcedure.mf)
@@ -256,6 +465,10 @@ class WeightDoubling(InferenceProcedure):
             # Last layer is clamped to Y
             H_hat[-1] = Y
 
+        if self.use_scan:
+            return self._scan_mf(V, Y, H_hat, niter, return_history,
+                                 block_grad)
+
         if block_grad == 1:
             H_hat = block(H_hat)
 
@@ -264,46 +477,7 @@ class WeightDoubling(InferenceProcedure):
         # we only need recurrent inference if there are multiple layers
         if len(H_hat) > 1:
             for i in xrange(1, niter):
-                for j in xrange(0, len(H_hat), 2):
-                    if j == 0:
-                        state_below = dbm.visible_layer.upward_state(V)
-                    else:
-                        state_below = dbm.hidden_layers[
-                            j - 1].upward_state(H_hat[j - 1])
-                    if j == len(H_hat) - 1:
-                        state_above = None
-                        layer_above = None
-                    else:
-                        state_above = dbm.hidden_layers[
-                            j + 1].downward_state(H_hat[j + 1])
-                        layer_above = dbm.hidden_layers[j + 1]
-                    H_hat[j] = dbm.hidden_layers[j].mf_update(
-                        state_below=state_below,
-                        state_above=state_above,
-                        layer_above=layer_above)
-
-                if Y is not None:
-                    H_hat[-1] = Y
-
-                for j in xrange(1, len(H_hat), 2):
-                    state_below = dbm.hidden_layers[
-                        j - 1].upward_state(H_hat[j - 1])
-                    if j == len(H_hat) - 1:
-                        state_above = None
-                        state_above = None
-                    else:
-                        state_above = dbm.hidden_layers[
-                            j + 1].downward_state(H_hat[j + 1])
-                        layer_above = dbm.hidden_layers[j + 1]
-                    H_hat[j] = dbm.hidden_layers[j].mf_update(
-                        state_below=state_below,
-                        state_above=state_above,
-                        layer_above=layer_above)
-                    # end ifelse
-                # end for odd layer
-
-                if Y is not None:
-                    H_hat[-1] = Y
+                H_hat = self._mf_iteration(V, Y, H_hat, i)
 
                 if block_grad == i:
                     H_hat = block(H_hat)
@@ -705,6 +879,13 @@ class MoreConsistent(WeightDoubling):
     does weight doubling.
     This class makes the two more consistent by just implementing mf as
     calling inpainting with Y masked out.
+
+    Parameters
+    ----------
+    use_scan : bool, optional
+        See `InferenceProcedure`.
+    tol : float, optional
+        See `InferenceProcedure`.
     """
 
     @functools.wraps(InferenceProcedure.mf)
@@ -758,6 +939,13 @@ class MoreConsistent2(WeightDoubling):
     Makes `do_inpainting` even more consistent with `mf` than in the
     `MoreConsistent` class. TODO-- look up exactly which inconsistency
     was removed.
+
+    Parameters
+    ----------
+    use_scan : bool, optional
+        See `InferenceProcedure`.
+    tol : float, optional
+        See `InferenceProcedure`.
     """
 
     @functools.wraps(InferenceProcedure.do_inpainting)
@@ -934,6 +1122,13 @@ class BiasInit(InferenceProcedure):
     based on the biases in the model. This InferenceProcedure uses
     the same weights at every iteration, rather than doubling the
     weights on the first pass.
+
+    Parameters
+    ----------
+    use_scan : bool, optional
+        See `InferenceProcedure`.
+    tol : float, optional
+        See `InferenceProcedure`.
     """
 
     @functools.wraps(InferenceProcedure.mf)
@@ -963,47 +1158,13 @@ class BiasInit(InferenceProcedure):
         # we only need recurrent inference if there are multiple layers
         assert (niter > 1) == (len(dbm.hidden_layers) > 1)
 
-        for i in xrange(niter):
-            for j in xrange(0, len(H_hat), 2):
-                if j == 0:
-                    state_below = dbm.visible_layer.upward_state(V)
-                else:
-                    state_below = dbm.hidden_layers[
-                        j - 1].upward_state(H_hat[j - 1])
-                if j == len(H_hat) - 1:
-                    state_above = None
-                    layer_above = None
-                else:
-                    state_above = dbm.hidden_layers[
-                        j + 1].downward_state(H_hat[j + 1])
-                    layer_above = dbm.hidden_layers[j + 1]
-                H_hat[j] = dbm.hidden_layers[j].mf_update(
-                    state_below=state_below,
-                    state_above=state_above,
-                    layer_above=layer_above)
+        if self.use_scan:
+            H_hat = self._mf_iteration(V, Y, H_hat, 0)
+            return self._scan_mf(V, Y, H_hat, niter, return_history,
+                                 block_grad)
 
-            if Y is not None:
-                H_hat[-1] = Y
-
-            for j in xrange(1, len(H_hat), 2):
-                state_below = dbm.hidden_layers[
-                    j - 1].upward_state(H_hat[j - 1])
-                if j == len(H_hat) - 1:
-                    state_above = None
-                    state_above = None
-                else:
-                    state_above = dbm.hidden_layers[
-                        j + 1].downward_state(H_hat[j + 1])
-                    layer_above = dbm.hidden_layers[j + 1]
-                H_hat[j] = dbm.hidden_layers[j].mf_update(
-                    state_below=state_below,
-                    state_above=state_above,
-                    layer_above=layer_above)
-                # end ifelse
-            # end for odd layer
-
-            if Y is not None:
-                H_hat[-1] = Y
+        for i in xrange(niter):
+            H_hat = self._mf_iteration(V, Y, H_hat, i)
 
             for i, elem in enumerate(H_hat):
                 if elem is Y:
@@ -1241,6 +1402,13 @@ class UpDown(InferenceProcedure):
     based on the biases in the model, then alternates between updating
     each of the layers bottom-to-top
     and updating each of the layers top-to-bottom.
+
+    Parameters
+    ----------
+    use_scan : bool, optional
+        See `InferenceProcedure`.
+    tol : float, optional
+        See `InferenceProcedure`.
     """
 
     @functools.wraps(InferenceProcedure.mf)
@@ -1275,39 +1443,13 @@ class UpDown(InferenceProcedure):
         # we only need recurrent inference if there are multiple layers
         assert (niter > 1) == (len(dbm.hidden_layers) > 1)
 
-        for i in xrange(niter):
-            # Determine whether to go up or down on this iteration
-            if i % 2 == 0:
-                start = 0
-                stop = len(H_hat)
-                inc = 1
-            else:
-                start = len(H_hat) - 1
-                stop = -1
-                inc = -1
-            # Do the mean field updates
-            for j in xrange(start, stop, inc):
-                if j == 0:
-                    state_below = dbm.visible_layer.upward_state(V)
-                else:
-                    state_below = dbm.hidden_layers[
-                        j - 1].upward_state(H_hat[j - 1])
-                if j == len(H_hat) - 1:
-                    state_above = None
-                    layer_above = None
-                else:
-                    state_above = dbm.hidden_layers[
-                        j + 1].downward_state(H_hat[j + 1])
-                    layer_above = dbm.hidden_layers[j + 1]
-                H_hat[j] = dbm.hidden_layers[j].mf_update(
-                    state_below=state_below,
-                    state_above=state_above,
-                    layer_above=layer_above)
-                if Y is not None:
-                    H_hat[-1] = Y
+        if self.use_scan:
+            H_hat = self._mf_iteration(V, Y, H_hat, 0)
+            return self._scan_mf(V, Y, H_hat, niter, return_history,
+                                 block_grad)
 
-            if Y is not None:
-                H_hat[-1] = Y
+        for i in xrange(niter):
+            H_hat = self._mf_iteration(V, Y, H_hat, i)
 
             if block_grad == i + 1:
                 H_hat = block(H_hat)
@@ -1328,6 +1470,40 @@ class UpDown(InferenceProcedure):
         else:
             return H_hat
 
+    def _mf_iteration(self, V, Y, H_hat, i):
+        """
+        Performs one iteration of mean field inference, updating the layers
+        bottom-to-top on even iterations and top-to-bottom on odd ones.
+
+        Parameters
+        ----------
+        V : Input space batch
+            The values of the input features modeled by the DBM.
+        Y : Target space batch or None
+            If not None, the last hidden layer is clamped to `Y`.
+        H_hat : list
+            The current mean field state of each hidden layer.
+        i : int or theano scalar
+            The index of the iteration, symbolic inside a scan loop.
+
+        Returns
+        -------
+        H_hat : list
+            The new mean field state of each hidden layer.
+        """
+        up = list(xrange(len(H_hat)))
+        down = up[::-1]
+        if not isinstance(i, theano.Variable):
+            # Determine whether to go up or down on this iteration
+            if i % 2 == 0:
+                return self._update_layers(V, Y, H_hat, up)
+            return self._update_layers(V, Y, H_hat, down)
+        # Only the branch that is taken gets computed
+        H_up = self._update_layers(V, Y, H_hat, up)
+        H_down = self._update_layers(V, Y, H_hat, down)
+        flat = ifelse(T.eq(i % 2, 0), flatten(H_up), flatten(H_down))
+        return list(unflatten(flat, H_hat))
+
     def do_inpainting(self, V, Y=None, drop_mask=None, drop_mask_Y=None,
                       return_history=False, noise=False, niter=None,
                       block_grad=None):
@@ -7,8 +7,13 @@ __credits__ = ["Ian Goodfellow"]
 __license__ = "3-clause BSD"
 __maintainer__ = "LISA Lab"
 
+import numpy as np
+import theano
 from theano.compat.six.moves import xrange
 from pylearn2.compat import OrderedDict
+from pylearn2.models.tempering import (TemperatureLadder, flatten_nested,
+                                       join_replicas, map_nested,
+                                       split_replicas, temper)
 from pylearn2.utils import py_integer_types
 
 
@@ -58,6 +63,48 @@ class SamplingProcedure(object):
         raise NotImplementedError(str(type(self))+" does not implement " +
                                   "sample.")
 
+    def sample_with_updates(self, layer_to_state, theano_rng,
+                            layer_to_clamp=None, num_steps=1):
+        """
+        Samples like `sample`, and also returns the updates of the state
+        kept by the sampling procedure itself (as opposed to the samples
+        passed to `sample`). `DBM.get_sampling_updates` includes them in
+        its updates.
+
+        Parameters
+        ----------
+        layer_to_state : dict
+            See `sample`.
+        theano_rng : theano.sandbox.rng_mrg.MRG_RandomStreams
+            Random number generator
+        layer_to_clamp : dict, optional
+            See `sample`.
+        num_steps : int, optional
+            See `sample`.
+
+        Returns
+        -------
+        layer_to_updated_state : dict
+            See `sample`.
+        updates : OrderedDict
+            Maps shared variables to their new values. Empty in the base
+            class.
+        """
+        return (self.sample(layer_to_state, theano_rng, layer_to_clamp,
+                            num_steps),
+                OrderedDict())
+
+    def get_monitoring_channels(self):
+        """
+        Returns monitoring channels describing the sampling procedure.
+
+        Returns
+        -------
+        channels : OrderedDict
+            Maps channel names to theano expressions.
+        """
+        return OrderedDict()
+
 
 class GibbsEvenOdd(SamplingProcedure):
     """
@@ -211,3 +258,211 @@ class GibbsEvenOdd(SamplingProcedure):
                     layer_to_clamp[layer] for layer in layer_to_state])
 
         return layer_to_updated
+
+
+class ParallelTempering(SamplingProcedure):
+    """
+    Parallel tempering: the chains are accompanied by tempered replicas,
+    sampling from the DBM with its energy multiplied by decreasing inverse
+    temperatures, which exchange their states with their neighbours after
+    each call to `sample`.
+
+    The chains passed to `sample` form the replica at inverse temperature 1.
+    The other replicas are kept by the sampling procedure, in one batched
+    shared variable per layer, which is created from copies of the chains
+    the first time the layer is sampled. Their updates, and those of the
+    ladder, are returned by `sample_with_updates`. Tempering
+    scales the parameters of the DBM, so it is only valid when the energy
+    is linear in the parameters, as with binary layers.
+
+    Parameters
+    ----------
+    num_replicas : int, optional
+        Number of replicas, including the one at inverse temperature 1.
+    min_beta : float, optional
+        Inverse temperature of the hottest replica.
+    adapt_rate : float, optional
+        Step size of the adaptation of the inverse temperatures, which
+        tends to equalize the acceptance rates of the exchanges. 0 keeps
+        them fixed.
+    swap_rate_decay : float, optional
+        Decay of the moving averages of the acceptance rates of the
+        exchanges, reported as monitoring channels.
+    sampling_procedure : SamplingProcedure, optional
+        The procedure used to sample each replica. Defaults to
+        `GibbsEvenOdd`.
+    """
+
+    def __init__(self, num_replicas=4, min_beta=0.2, adapt_rate=0.,
+                 swap_rate_decay=0.99, sampling_procedure=None):
+        self.ladder = TemperatureLadder(num_replicas, min_beta, adapt_rate,
+                                        swap_rate_decay)
+        if sampling_procedure is None:
+            sampling_procedure = GibbsEvenOdd()
+        self.sampling_procedure = sampling_procedure
+        self._tempered = OrderedDict()
+
+    def set_dbm(self, dbm):
+        """
+        Associates the SamplingProcedure with a specific DBM.
+
+        Parameters
+        ----------
+        dbm : pylearn2.models.dbm.DBM instance
+            The model to perform sampling from.
+        """
+        super(ParallelTempering, self).set_dbm(dbm)
+        self.sampling_procedure.set_dbm(dbm)
+        self._tempered = OrderedDict()
+
+    def _get_tempered(self, layer, chains, num_chains):
+        """
+        Returns the shared variables holding the tempered replicas of the
+        chains of a layer. They are created from copies of the chains the
+        first time, and again if the number of chains changes.
+
+        Parameters
+        ----------
+        layer : Layer
+            A layer of the DBM.
+        chains : shared variable or nested tuple of shared variables
+            The state of the chains of the layer.
+        num_chains : int
+            Number of chains.
+
+        Returns
+        -------
+        tempered : shared variable or nested tuple of shared variables
+            Same structure as `chains`, with `num_replicas - 1` times as
+            many rows.
+        """
+        num_rows = (self.ladder.num_replicas - 1) * num_chains
+        tempered = self._tempered.get(layer)
+        if tempered is None or \
+                flatten_nested(tempered)[0].get_value().shape[0] != num_rows:
+            def make_tempered(state):
+                value = np.concatenate([state.get_value()] *
+                                       (self.ladder.num_replicas - 1))
+                return theano.shared(value, name='tempered_%s' % state.name)
+            tempered = map_nested(make_tempered, chains)
+            self._tempered[layer] = tempered
+        return tempered
+
+    def sample(self, layer_to_state, theano_rng, layer_to_clamp=None,
+               num_steps=1):
+        """
+        Samples from self.dbm using `layer_to_state` as starting values.
+
+        Each replica does `num_steps` steps of the underlying sampling
+        procedure, then neighbouring replicas exchange their states. The
+        tempered replicas only advance with the updates returned by
+        `sample_with_updates`.
+
+        Parameters
+        ----------
+        layer_to_state : dict
+            Maps the DBM's Layer instances to shared variables containing
+            batches of samples of them.
+        theano_rng : theano.sandbox.rng_mrg.MRG_RandomStreams
+            Random number generator
+        layer_to_clamp : dict, optional
+            Clamping is not supported by parallel tempering.
+        num_steps : int, optional
+            Steps of the underlying sampling procedure between exchanges.
+
+        Returns
+        -------
+        layer_to_updated_state : dict
+            Maps the DBM's Layer instances to theano variables representing
+            the updated samples of the replica at inverse temperature 1.
+        """
+        return self.sample_with_updates(layer_to_state, theano_rng,
+                                        layer_to_clamp, num_steps)[0]
+
+    def sample_with_updates(self, layer_to_state, theano_rng,
+                            layer_to_clamp=None, num_steps=1):
+        """
+        Samples like `sample`, and also returns the updates of the tempered
+        replicas and of the inverse temperature ladder.
+
+        Parameters
+        ----------
+        layer_to_state : dict
+            See `sample`.
+        theano_rng : theano.sandbox.rng_mrg.MRG_RandomStreams
+            Random number generator
+        layer_to_clamp : dict, optional
+            See `sample`.
+        num_steps : int, optional
+            See `sample`.
+
+        Returns
+        -------
+        layer_to_updated_state : dict
+            See `sample`.
+        updates : OrderedDict
+            Maps shared variables to their new values.
+        """
+        if layer_to_clamp is not None and any(layer_to_clamp.values()):
+            raise NotImplementedError("ParallelTempering does not support "
+                                      "clamped layers.")
+        layers = [self.dbm.visible_layer] + self.dbm.hidden_layers
+        num_replicas = self.ladder.num_replicas
+        betas = self.ladder.betas
+        params = self.dbm.get_params()
+
+        leaves = flatten_nested(list(layer_to_state.values()))
+        if not all(hasattr(leaf, 'get_value') for leaf in leaves):
+            raise TypeError("ParallelTempering needs the states of the "
+                            "chains to be shared variables.")
+        num_chains = leaves[0].get_value().shape[0]
+        tempered = OrderedDict(
+            (layer, self._get_tempered(layer, layer_to_state[layer],
+                                       num_chains))
+            for layer in layers)
+
+        # Sample each replica, at its own temperature
+        replicas = []
+        for r in xrange(num_replicas):
+            if r == 0:
+                replica = OrderedDict((layer, layer_to_state[layer])
+                                      for layer in layers)
+            else:
+                replica = OrderedDict(
+                    (layer, split_replicas(tempered[layer], num_replicas - 1,
+                                           num_chains)[r - 1])
+                    for layer in layers)
+            updated = self.sampling_procedure.sample(replica, theano_rng,
+                                                     num_steps=num_steps)
+            updated = [updated[layer] for layer in layers]
+            if r > 0:
+                updated = temper(updated, params, betas[r])
+            replicas.append(updated)
+        state = join_replicas(replicas)
+
+        # Exchange the states of neighbouring replicas
+        energy = self.dbm.energy(state[0], state[1:])
+        energy = energy.reshape((num_replicas, num_chains))
+        log_accept = ((betas[:-1] - betas[1:]).dimshuffle(0, 'x') *
+                      (energy[:-1] - energy[1:]))
+        index, updates = self.ladder.swap(log_accept, theano_rng)
+        state = map_nested(lambda s: s[index], state)
+
+        chains = map_nested(lambda s: s[:num_chains], state)
+        hot = map_nested(lambda s: s[num_chains:], state)
+        for old, new in zip(flatten_nested([tempered[l] for l in layers]),
+                            flatten_nested(hot)):
+            updates[old] = new
+        return OrderedDict(zip(layers, chains)), updates
+
+    def get_monitoring_channels(self):
+        """
+        Returns the acceptance rates of the exchanges between neighbouring
+        replicas and the inverse temperature of the hottest replica.
+
+        Returns
+        -------
+        channels : OrderedDict
+            Maps channel names to theano expressions.
+        """
+        return self.ladder.get_monitoring_channels()
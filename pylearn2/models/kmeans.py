@@ -2,27 +2,251 @@
 
 import logging
 import numpy
+from scipy import sparse
 from theano.compat.six.moves import xrange
 from pylearn2.blocks import Block
 from pylearn2.models.model import Model
 from pylearn2.space import VectorSpace
 from pylearn2.utils import sharedX
-from pylearn2.utils.mem import improve_memory_error_message
 from pylearn2.utils import wraps
 from pylearn2.utils import contains_nan
+from pylearn2.utils.rng import make_np_rng
 import warnings
 
+try:
+    from pylearn2.models._kmeans import kmeans as cython_kmeans
+except ImportError:
+    cython_kmeans = None
+
 try:
     import milk
 except ImportError:
     milk = None
-    warnings.warn(""" Install milk ( http://packages.python.org/milk/ )
-                    It has a better k-means implementation. Falling back to
-                    our own really slow implementation. """)
+    if cython_kmeans is None:
+        warnings.warn(""" Install milk ( http://packages.python.org/milk/ )
+                        or build pylearn2/models/_kmeans.pyx. They have
+                        better k-means implementations. Falling back to
+                        our own slower implementation. """)
 
 logger = logging.getLogger(__name__)
 
 
+def squared_distances(X, mu, X_sqnorm=None):
+    """
+    Computes the squared euclidean distance between every example and
+    every mean using the expansion ||x||^2 - 2 x.mu + ||mu||^2, so that
+    the bulk of the work is a single matrix product.
+
+    Parameters
+    ----------
+    X : numpy.ndarray
+        Matrix of examples of shape (n, d)
+    mu : numpy.ndarray
+        Matrix of means of shape (k, d)
+    X_sqnorm : numpy.ndarray, optional
+        The squared norms of the rows of `X`, if they are already known.
+
+    Returns
+    -------
+    dists : numpy.ndarray
+        Matrix of shape (n, k) of squared distances. Small negative values
+        caused by rounding errors are clipped to 0.
+    """
+    if X_sqnorm is None:
+        X_sqnorm = numpy.square(X).sum(axis=1)
+    dists = numpy.dot(X, mu.T)
+    dists *= -2.
+    dists += X_sqnorm[:, numpy.newaxis]
+    dists += numpy.square(mu).sum(axis=1)[numpy.newaxis, :]
+    numpy.maximum(dists, 0., out=dists)
+    return dists
+
+
+def _sample_index(weights, rng):
+    """
+    Samples an index with probability proportional to its weight.
+
+    Parameters
+    ----------
+    weights : numpy.ndarray
+        Non-negative weights, which do not all equal zero.
+    rng : numpy.random.RandomState
+        Random number generator used for sampling
+
+    Returns
+    -------
+    idx : int
+    """
+    cdf = numpy.cumsum(weights)
+    idx = numpy.searchsorted(cdf, rng.uniform() * cdf[-1], side='right')
+    return min(int(idx), len(weights) - 1)
+
+
+def kmeans_plus_plus(X, k, rng, weights=None):
+    """
+    Chooses initial means with the k-means++ seeding procedure of
+    "k-means++: The Advantages of Careful Seeding", David Arthur and
+    Sergei Vassilvitskii.
+
+    Parameters
+    ----------
+    X : numpy.ndarray
+        Matrix of candidate examples of shape (n, d)
+    k : int
+        Number of means to choose
+    rng : numpy.random.RandomState
+        Random number generator used for sampling
+    weights : numpy.ndarray, optional
+        Non-negative weight of each example. Defaults to uniform weights.
+
+    Returns
+    -------
+    mu : numpy.ndarray
+        Matrix of shape (k, d) of initial means, chosen among the rows of
+        `X`.
+    """
+    n = X.shape[0]
+    if weights is None:
+        weights = numpy.ones(n)
+    X_sqnorm = numpy.square(X).sum(axis=1)
+    indices = [_sample_index(weights, rng)]
+    min_dists = squared_distances(X, X[indices], X_sqnorm)[:, 0]
+    for i in xrange(1, k):
+        probs = weights * min_dists
+        total = probs.sum()
+        if total > 0:
+            idx = _sample_index(probs, rng)
+        else:
+            # All the candidates coincide with a chosen mean.
+            idx = rng.randint(n)
+        indices.append(idx)
+        new_dists = squared_distances(X, X[idx:idx + 1], X_sqnorm)[:, 0]
+        numpy.minimum(min_dists, new_dists, out=min_dists)
+    return X[indices].copy()
+
+
+def kmeans_parallel(X, k, rng, oversampling=2., rounds=5):
+    """
+    Chooses initial means with the scalable k-means++ (k-means||) seeding
+    procedure of "Scalable K-Means++", Bahman Bahmani et al.
+
+    A few rounds of oversampling build a small weighted set of candidates,
+    which is then reduced to `k` means with k-means++.
+
+    Parameters
+    ----------
+    X : numpy.ndarray
+        Matrix of examples of shape (n, d)
+    k : int
+        Number of means to choose
+    rng : numpy.random.RandomState
+        Random number generator used for sampling
+    oversampling : float, optional
+        Expected number of candidates drawn on each round, as a multiple
+        of `k`.
+    rounds : int, optional
+        Number of oversampling rounds.
+
+    Returns
+    -------
+    mu : numpy.ndarray
+        Matrix of shape (k, d) of initial means, chosen among the rows of
+        `X`.
+    """
+    n = X.shape[0]
+    X_sqnorm = numpy.square(X).sum(axis=1)
+    chosen = numpy.zeros(n, dtype=bool)
+    chosen[rng.randint(n)] = True
+    min_dists = squared_distances(X, X[chosen], X_sqnorm)[:, 0]
+    for r in xrange(rounds):
+        total = min_dists.sum()
+        if total == 0:
+            break
+        probs = numpy.minimum(oversampling * k * min_dists / total, 1.)
+        new = (rng.uniform(size=n) < probs) & ~chosen
+        if not numpy.any(new):
+            continue
+        chosen |= new
+        new_dists = squared_distances(X, X[new], X_sqnorm).min(axis=1)
+        numpy.minimum(min_dists, new_dists, out=min_dists)
+    candidates = X[chosen]
+    if candidates.shape[0] < k:
+        # Not enough candidates, fall back to plain k-means++.
+        return kmeans_plus_plus(X, k, rng)
+    # Weight each candidate by the number of examples closest to it.
+    closest = squared_distances(X, candidates, X_sqnorm).argmin(axis=1)
+    weights = numpy.bincount(closest, minlength=candidates.shape[0])
+    return kmeans_plus_plus(candidates, k, rng, weights.astype('float64'))
+
+
+def cluster_sums(X, assign, k):
+    """
+    Computes the sum and the number of the examples assigned to each
+    cluster, without a Python loop over clusters.
+
+    Parameters
+    ----------
+    X : numpy.ndarray
+        Matrix of examples of shape (n, d)
+    assign : numpy.ndarray
+        Vector of length n of cluster indices
+    k : int
+        Number of clusters
+
+    Returns
+    -------
+    sums : numpy.ndarray
+        Matrix of shape (k, d) of per-cluster sums
+    counts : numpy.ndarray
+        Vector of length k of per-cluster counts
+    """
+    n = X.shape[0]
+    counts = numpy.bincount(assign, minlength=k)
+    one_hot = sparse.csr_matrix((numpy.ones(n, dtype=X.dtype),
+                                 (assign, numpy.arange(n))), shape=(k, n))
+    sums = numpy.asarray(one_hot.dot(X))
+    return sums, counts
+
+
+def nearest_means(X, mu, X_sqnorm=None, max_elements=2 ** 22):
+    """
+    Finds the closest mean to every example, computing the distances by
+    blocks of examples so that memory use is bounded independently of the
+    number of examples.
+
+    Parameters
+    ----------
+    X : numpy.ndarray
+        Matrix of examples of shape (n, d)
+    mu : numpy.ndarray
+        Matrix of means of shape (k, d)
+    X_sqnorm : numpy.ndarray, optional
+        The squared norms of the rows of `X`, if they are already known.
+    max_elements : int, optional
+        Maximum number of entries of the blocks of the distance matrix.
+
+    Returns
+    -------
+    min_dists : numpy.ndarray
+        Vector of length n of squared distances to the closest mean
+    assign : numpy.ndarray
+        Vector of length n of indices of the closest mean
+    """
+    n = X.shape[0]
+    if X_sqnorm is None:
+        X_sqnorm = numpy.square(X).sum(axis=1)
+    min_dists = numpy.empty(n)
+    assign = numpy.empty(n, dtype='int64')
+    block = max(1, max_elements // mu.shape[0])
+    for start in xrange(0, n, block):
+        stop = min(start + block, n)
+        dists = squared_distances(X[start:stop], mu, X_sqnorm[start:stop])
+        assign[start:stop] = dists.argmin(axis=1)
+        min_dists[start:stop] = dists[numpy.arange(stop - start),
+                                      assign[start:stop]]
+    return min_dists, assign
+
+
 class KMeans(Block, Model):
     """
     Block that outputs a vector of probabilities that a sample belong
@@ -38,13 +262,37 @@ class KMeans(Block, Model):
         Threshold of distance to clusters under which k-means stops
         iterating.
     max_iter : int, optional
-        Maximum number of iterations. Defaults to infinity.
+        Maximum number of iterations (passes over the dataset in
+        mini-batch mode). Defaults to infinity.
     verbose : bool
         WRITEME
+    batch_size : int, optional
+        If specified, run mini-batch k-means ("Web-Scale K-Means
+        Clustering", D. Sculley) on batches of this size streamed from
+        `dataset.iterator`, instead of loading the whole design matrix.
+        Memory use is then O(batch_size * k) rather than O(n * k).
+    init : str, optional
+        How to choose the initial means when they are not given to
+        `train_all`: 'random' (random examples), 'k-means++' or
+        'k-means||' (scalable k-means++). In mini-batch mode, the
+        initialization is computed on a sample of `init_size` examples.
+    init_size : int, optional
+        Number of examples drawn from the dataset to initialize the means
+        in mini-batch mode. Defaults to max(3 * k, batch_size).
+    rng : RandomState object or seed, optional
+        Random number generator used for initialization and for
+        shuffling the batches.
+
+    Notes
+    -----
+    In full-batch mode, the Cython implementation in `_kmeans.pyx` is used
+    when it has been built, then milk if it is installed, and finally a
+    numpy implementation.
     """
 
     def __init__(self, k, nvis, convergence_th=1e-6, max_iter=None,
-                 verbose=False):
+                 verbose=False, batch_size=None, init='random',
+                 init_size=None, rng=None):
         Block.__init__(self)
         Model.__init__(self)
 
@@ -62,6 +310,55 @@ class KMeans(Block, Model):
 
         self.verbose = verbose
 
+        if init not in ('random', 'k-means++', 'k-means||'):
+            raise ValueError("KMeans init: init should be 'random', "
+                             "'k-means++' or 'k-means||', got " + str(init))
+        self.batch_size = batch_size
+        self.init = init
+        if init_size is None and batch_size is not None:
+            init_size = max(3 * k, batch_size)
+        self.init_size = init_size
+        self.rng = make_np_rng(rng, [2015, 4, 17],
+                               which_method=['randint', 'uniform',
+                                             'random_integers'])
+
+    def _init_means(self, X):
+        """
+        Chooses initial means among the examples of `X` according to
+        `self.init`.
+
+        Parameters
+        ----------
+        X : numpy.ndarray
+            Matrix of examples of shape (n, d)
+
+        Returns
+        -------
+        mu : numpy.ndarray
+            Matrix of shape (k, d) of initial means
+        """
+        if self.init == 'k-means++':
+            return kmeans_plus_plus(X, self.k, self.rng)
+        elif self.init == 'k-means||':
+            return kmeans_parallel(X, self.k, self.rng)
+        indices = self.rng.randint(X.shape[0], size=self.k)
+        return X[indices].copy()
+
+    def _check_means(self, mu):
+        """
+        Checks that user-provided initial means have the right number of
+        clusters.
+
+        Parameters
+        ----------
+        mu : numpy.ndarray
+            Initial means
+        """
+        if not len(mu) == self.k:
+            raise Exception("You gave %i clusters"
+                            ", but k=%i were expected"
+                            % (len(mu), self.k))
+
     def train_all(self, dataset, mu=None):
         """
         Process kmeans algorithm on the input to localize clusters.
@@ -79,12 +376,40 @@ class KMeans(Block, Model):
 
         # TODO-- why does this sometimes return X and sometimes return nothing?
 
+        if mu is not None:
+            self._check_means(mu)
+
+        if self.batch_size is not None:
+            mu = self._train_minibatch(dataset, mu)
+            self.mu = sharedX(mu)
+            self._params = [self.mu]
+            return
+
         X = dataset.get_design_matrix()
 
         n, m = X.shape
         k = self.k
 
-        if milk is not None:
+        if mu is None and self.init != 'random':
+            mu = self._init_means(X)
+
+        if cython_kmeans is not None:
+            # The Cython implementation only supports float32 data, and
+            # overwrites the initial means it is given.
+            data = numpy.asarray(X, dtype='float32')
+            max_iter = self.max_iter
+            if max_iter == float('inf'):
+                max_iter = 1000
+            if mu is None:
+                cluster_ids, mu, iters, converged = cython_kmeans(
+                    data, k, int(max_iter), rng=self.rng)
+            else:
+                cluster_ids, mu, iters, converged = cython_kmeans(
+                    data, k, int(max_iter),
+                    init=numpy.array(mu, dtype='float32'), rng=None)
+            logger.info('kmeans ran {0} iterations, converged: {1}'.format(
+                iters, converged))
+        elif milk is not None:
             # use the milk implementation of k-means if it's available
             cluster_ids, mu = milk.kmeans(X, k)
         else:
@@ -92,22 +417,12 @@ class KMeans(Block, Model):
 
             # taking random inputs as initial clusters if user does not provide
             # them.
-            if mu is not None:
-                if not len(mu) == k:
-                    raise Exception("You gave %i clusters"
-                                    ", but k=%i were expected"
-                                    % (len(mu), k))
+            if mu is None:
+                mu = self._init_means(X)
             else:
-                indices = numpy.random.randint(X.shape[0], size=k)
-                mu = X[indices]
+                mu = numpy.array(mu)
 
-            try:
-                dists = numpy.zeros((n, k))
-            except MemoryError as e:
-                improve_memory_error_message(e, "dying trying to allocate "
-                                                "dists matrix for {0} "
-                                                "examples and {1} "
-                                                "means".format(n, k))
+            X_sqnorm = numpy.square(X).sum(axis=1)
 
             old_kills = {}
 
@@ -117,21 +432,16 @@ class KMeans(Block, Model):
                 if self.verbose:
                     logger.info('kmeans iter {0}'.format(iter))
 
-                # print 'iter:',iter,' conv crit:',abs(mmd-prev_mmd)
-                # if numpy.sum(numpy.isnan(mu)) > 0:
                 if contains_nan(mu):
                     logger.info('nan found')
                     return X
 
-                # computing distances
-                for i in xrange(k):
-                    dists[:, i] = numpy.square((X - mu[i, :])).sum(axis=1)
+                # computing distances, by blocks of examples
+                min_dists, min_dist_inds = nearest_means(X, mu, X_sqnorm)
 
                 if iter > 0:
                     prev_mmd = mmd
 
-                min_dists = dists.min(axis=1)
-
                 # mean minimum distance:
                 mmd = min_dists.mean()
 
@@ -142,49 +452,30 @@ class KMeans(Block, Model):
                     # converged
                     break
 
-                # finding minimum distances
-                min_dist_inds = dists.argmin(axis=1)
-
                 # computing means
-                i = 0
-                blacklist = []
+                sums, counts = cluster_sums(X, min_dist_inds, k)
                 new_kills = {}
-                while i < k:
-                    b = min_dist_inds == i
-                    if not numpy.any(b):
-                        killed_on_prev_iter = True
-                        # initializes empty cluster to be the mean of the d
-                        # data points farthest from their corresponding means
-                        if i in old_kills:
-                            d = old_kills[i] - 1
-                            if d == 0:
-                                d = 50
-                            new_kills[i] = d
-                        else:
-                            d = 5
-                        mu[i, :] = 0
-                        for j in xrange(d):
-                            idx = numpy.argmax(min_dists)
-                            min_dists[idx] = 0
-                            # chose point idx
-                            mu[i, :] += X[idx, :]
-                            blacklist.append(idx)
-                        mu[i, :] /= float(d)
-                        # cluster i was empty, reset it to d far out data
-                        # points recomputing distances for this cluster
-                        dists[:, i] = numpy.square((X - mu[i, :])).sum(axis=1)
-                        min_dists = dists.min(axis=1)
-                        for idx in blacklist:
-                            min_dists[idx] = 0
-                        min_dist_inds = dists.argmin(axis=1)
-                        # done
-                        i += 1
+                for i in numpy.flatnonzero(counts == 0):
+                    # initializes empty cluster to be the mean of the d
+                    # data points farthest from their corresponding means
+                    if i in old_kills:
+                        d = old_kills[i] - 1
+                        if d == 0:
+                            d = 50
+                        new_kills[i] = d
                     else:
-                        mu[i, :] = numpy.mean(X[b, :], axis=0)
-                        if contains_nan(mu):
-                            logger.info('nan found at {0}'.format(i))
-                            return X
-                        i += 1
+                        d = 5
+                    d = min(d, n)
+                    far = numpy.argsort(min_dists)[n - d:]
+                    mu[i, :] = X[far].mean(axis=0)
+                    # do not choose these points again for another cluster
+                    min_dists[far] = 0
+                nonempty = counts > 0
+                mu[nonempty] = (sums[nonempty] /
+                                counts[nonempty, numpy.newaxis])
+                if contains_nan(mu):
+                    logger.info('nan found')
+                    return X
 
                 old_kills = new_kills
 
@@ -193,6 +484,105 @@ class KMeans(Block, Model):
         self.mu = sharedX(mu)
         self._params = [self.mu]
 
+    def _draw_init_sample(self, dataset):
+        """
+        Draws `init_size` random examples from the dataset iterator.
+
+        Parameters
+        ----------
+        dataset : Dataset
+            The dataset to sample from.
+
+        Returns
+        -------
+        X : numpy.ndarray
+            Matrix of at least k examples
+        """
+        sample = []
+        num_examples = 0
+        iterator = dataset.iterator(mode='shuffled_sequential',
+                                    batch_size=self.batch_size,
+                                    data_specs=(self.input_space,
+                                                'features'),
+                                    rng=self.rng)
+        for X in iterator:
+            sample.append(X)
+            num_examples += X.shape[0]
+            if num_examples >= self.init_size:
+                break
+        X = numpy.concatenate(sample, axis=0)[:self.init_size]
+        if X.shape[0] < self.k:
+            raise ValueError("Cannot initialize %i clusters with only %i "
+                             "examples." % (self.k, X.shape[0]))
+        return X
+
+    def _train_minibatch(self, dataset, mu=None):
+        """
+        Runs mini-batch k-means on batches streamed from the dataset.
+
+        Each mean is the running average of all the examples assigned to
+        it so far, i.e. it is moved towards the examples of each batch with
+        a per-cluster learning rate of 1 / (number of examples assigned).
+
+        Parameters
+        ----------
+        dataset : Dataset
+            The dataset to cluster.
+        mu : numpy.ndarray, optional
+            Initial means. If not specified, they are chosen according to
+            `self.init` on a sample of the dataset.
+
+        Returns
+        -------
+        mu : numpy.ndarray
+            Matrix of shape (k, d) of means
+        """
+        k = self.k
+        if mu is None:
+            mu = self._init_means(self._draw_init_sample(dataset))
+        mu = numpy.array(mu, dtype='float64')
+        counts = numpy.zeros(k)
+
+        epoch = 0
+        mmd = prev_mmd = float('inf')
+        while True:
+            if self.verbose:
+                logger.info('mini-batch kmeans epoch {0}'.format(epoch))
+            iterator = dataset.iterator(mode='shuffled_sequential',
+                                        batch_size=self.batch_size,
+                                        data_specs=(self.input_space,
+                                                    'features'),
+                                        rng=self.rng)
+            total_dist = 0.
+            num_examples = 0
+            for X in iterator:
+                min_dists, assign = nearest_means(X, mu)
+                total_dist += min_dists.sum()
+                num_examples += X.shape[0]
+
+                sums, batch_counts = cluster_sums(X, assign, k)
+                counts += batch_counts
+                hit = batch_counts > 0
+                mu[hit] += ((sums[hit] - batch_counts[hit, numpy.newaxis] *
+                             mu[hit]) / counts[hit, numpy.newaxis])
+
+            # Clusters that never got any example are moved to random
+            # examples of the last batch.
+            dead = numpy.flatnonzero(counts == 0)
+            if len(dead) > 0:
+                mu[dead] = X[self.rng.randint(X.shape[0], size=len(dead))]
+
+            prev_mmd = mmd
+            mmd = total_dist / num_examples
+            logger.info('cost: {0}'.format(mmd))
+
+            epoch += 1
+            if (epoch >= self.max_iter or
+                    abs(mmd - prev_mmd) < self.convergence_th):
+                break
+
+        return mu
+
     @wraps(Model.continue_learning)
     def continue_learning(self):
         # One call to train_all currently trains the model fully,
@@ -226,12 +616,10 @@ class KMeans(Block, Model):
         -------
         WRITEME
         """
-        n, m = X.shape
-        k = self.k
         mu = self.mu
-        dists = numpy.zeros((n, k))
-        for i in xrange(k):
-            dists[:, i] = numpy.square((X - mu[i, :])).sum(axis=1)
+        if hasattr(mu, 'get_value'):
+            mu = mu.get_value(borrow=True)
+        dists = squared_distances(X, mu)
         return dists / dists.sum(axis=1).reshape(-1, 1)
 
     def get_weights(self):
@@ -17,6 +17,7 @@ import numpy as np
 from theano.compat import six
 from theano.compat.six.moves import reduce, xrange
 from theano import config
+from theano import scalar
 from theano.gof.op import get_debug_values
 from theano.sandbox.rng_mrg import MRG_RandomStreams
 from theano.tensor.signal.downsample import max_pool_2d
@@ -422,6 +423,20 @@ class MLP(Layer):
         If true, includes monitoring channels that are functions of the
         targets. This can be disabled to allow monitoring on monitoring
         datasets that do not include targets.
+    activation_dtypes : str or dict, optional
+        Mixed-precision policy. Either a dtype (e.g. 'float16') in which
+        the outputs of all the layers are stored, or a dictionary mapping
+        layer names to such dtypes, the other layers keeping the dtype of
+        their output space. The output of each layer is cast to its dtype
+        in `fprop`, and the dtype of its output space is set accordingly,
+        so that the next layer expects it. The parameters keep the dtype
+        of `sharedX` (i.e. floatX), so with floatX=float32 the weights and
+        the learning rule accumulators stay in float32, and only the
+        activations passed between layers are stored in float16. The input
+        data can be stored in float16 too by giving a dtype to
+        `input_space`. It is usually best to keep the last layer, whose
+        output goes into the cost, in float32; see also the `loss_scale`
+        argument of `SGD`.
     kwargs : dict
         Passed on to the superclass.
     """
@@ -429,7 +444,7 @@ class MLP(Layer):
     def __init__(self, layers, batch_size=None, input_space=None,
                  input_source='features', target_source='targets',
                  nvis=None, seed=None, layer_name=None, monitor_targets=True,
-                 **kwargs):
+                 activation_dtypes=None, **kwargs):
         super(MLP, self).__init__(**kwargs)
 
         self.seed = seed
@@ -453,6 +468,23 @@ class MLP(Layer):
 
         self.layers = layers
 
+        if isinstance(activation_dtypes, dict):
+            for name in activation_dtypes:
+                if name not in self.layer_names:
+                    raise ValueError("MLP.__init__ given an activation dtype "
+                                     "for %s, which is not the name of one "
+                                     "of its layers." % name)
+            dtypes = set(activation_dtypes.values())
+        else:
+            dtypes = set([activation_dtypes])
+        supported = [t.dtype for t in scalar.all_types]
+        for dtype in dtypes.difference([None]):
+            if dtype not in supported:
+                raise ValueError("MLP.__init__ given the activation dtype "
+                                 "%s, which this version of Theano does not "
+                                 "support." % dtype)
+        self.activation_dtypes = activation_dtypes
+
         self.batch_size = batch_size
         self.force_batch_size = batch_size
 
@@ -557,8 +589,66 @@ class MLP(Layer):
                             str(self.get_input_space()) +
                             " of type " + str(type(self.get_input_space())) +
                             "). Original exception: " + str(e))
+        self._set_activation_dtype(layers[0])
         for i in xrange(1, len(layers)):
             layers[i].set_input_space(layers[i - 1].get_output_space())
+            self._set_activation_dtype(layers[i])
+
+    def get_activation_dtype(self, layer):
+        """
+        Returns the dtype in which the output of a layer is stored.
+
+        Parameters
+        ----------
+        layer : Layer
+            One of the layers of this MLP.
+
+        Returns
+        -------
+        dtype : str or None
+            The dtype given for this layer by `activation_dtypes`, or None
+            if the output of the layer is left as it is.
+        """
+        # MLPs pickled before activation_dtypes existed have no policy
+        activation_dtypes = getattr(self, 'activation_dtypes', None)
+        if isinstance(activation_dtypes, dict):
+            return activation_dtypes.get(layer.layer_name)
+        return activation_dtypes
+
+    def _set_activation_dtype(self, layer):
+        """
+        Sets the dtype of the output space of a layer to its activation
+        dtype, if it has one.
+
+        Parameters
+        ----------
+        layer : Layer
+            One of the layers of this MLP, whose input space is set.
+        """
+        dtype = self.get_activation_dtype(layer)
+        if dtype is not None:
+            layer.get_output_space().dtype = dtype
+
+    def _fprop_layer(self, layer, state_below):
+        """
+        Returns the output of a layer, cast to its activation dtype.
+
+        Parameters
+        ----------
+        layer : Layer
+            One of the layers of this MLP.
+        state_below : member of layer.input_space
+            A minibatch of states of the layer below.
+
+        Returns
+        -------
+        state : member of layer.output_space
+        """
+        state = layer.fprop(state_below)
+        dtype = self.get_activation_dtype(layer)
+        if dtype is None:
+            return state
+        return _cast_state(state, dtype)
 
     def add_layers(self, layers):
         """
@@ -578,6 +668,7 @@ class MLP(Layer):
             # been initialized
             if not self._nested or hasattr(self, 'input_space'):
                 layer.set_input_space(existing_layers[-1].get_output_space())
+                self._set_activation_dtype(layer)
             existing_layers.append(layer)
             assert layer.layer_name not in self.layer_names
             self.layer_names.add(layer.layer_name)
@@ -622,7 +713,7 @@ class MLP(Layer):
         for layer in self.layers:
             # We don't go through all the inner layers recursively
             state_below = state
-            state = layer.fprop(state)
+            state = self._fprop_layer(layer, state)
             args = [state_below, state]
             if layer is self.layers[-1] and targets is not None:
                 args.append(targets)
@@ -842,7 +933,7 @@ class MLP(Layer):
                 input_space=layer.get_input_space(),
                 per_example=per_example
             )
-            state_below = layer.fprop(state_below)
+            state_below = self._fprop_layer(layer, state_below)
 
         return state_below
 
@@ -936,7 +1027,7 @@ class MLP(Layer):
                 else:
                     state_below = T.switch(s_mask, state_below * scale,
                                            layer.dropout_input_mask_value)
-            state_below = layer.fprop(state_below)
+            state_below = self._fprop_layer(layer, state_below)
 
         return state_below
 
@@ -979,12 +1070,12 @@ class MLP(Layer):
         if not hasattr(self, "input_space"):
             raise AttributeError("Input space has not been provided.")
 
-        rval = self.layers[0].fprop(state_below)
+        rval = self._fprop_layer(self.layers[0], state_below)
 
         rlist = [rval]
 
         for layer in self.layers[1:]:
-            rval = layer.fprop(rval)
+            rval = self._fprop_layer(layer, rval)
             rlist.append(rval)
 
         if return_all:
@@ -3421,6 +3512,28 @@ class ConvRectifiedLinear(ConvElemwise):
                                                   monitor_style=monitor_style)
 
 
+def _cast_state(state, dtype):
+    """
+    Casts a (nested tuple of) symbolic batch(es) to a dtype.
+
+    Parameters
+    ----------
+    state : theano.gof.Variable or tuple
+        The batch(es). None components are left as they are.
+    dtype : str
+        The dtype to cast to.
+
+    Returns
+    -------
+    rval : theano.gof.Variable or tuple
+    """
+    if isinstance(state, tuple):
+        return tuple(_cast_state(component, dtype) for component in state)
+    if state is None or state.dtype == dtype:
+        return state
+    return T.cast(state, dtype)
+
+
 def max_pool(bc01, pool_shape, pool_stride, image_shape):
     """
     Theano's max pooling op only supports pool_stride = pool_shape
@@ -545,9 +545,10 @@ class Model(object):
             1-D array of all parameter values.
         """
 
-        values = self.get_param_values()
-        values = [value.reshape(value.size) for value in values]
-        return np.concatenate(values, axis=0)
+        # Borrowing avoids one copy per parameter: np.concatenate copies
+        # everything into the output vector anyway.
+        values = self.get_param_values(borrow=True)
+        return np.concatenate([value.ravel() for value in values], axis=0)
 
     def set_param_vector(self, vector):
         """
@@ -561,13 +562,13 @@ class Model(object):
         """
 
         params = self.get_params()
-        cur_values = self.get_param_values()
+        cur_values = self.get_param_values(borrow=True)
 
         pos = 0
         for param, value in safe_zip(params, cur_values):
             size = value.size
             new_value = vector[pos:pos + size]
-            param.set_value(new_value.reshape(*value.shape))
+            param.set_value(new_value.reshape(value.shape))
             pos += size
         assert pos == vector.size
 
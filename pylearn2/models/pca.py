@@ -52,7 +52,9 @@ except ImportError:
 
 # Local imports
 from pylearn2.blocks import Block
+from pylearn2.space import VectorSpace
 from pylearn2.utils import sharedX
+from pylearn2.utils.forked_pool import ForkedPool
 
 
 logger = logging.getLogger()
@@ -126,6 +128,25 @@ class _PCABase(Block):
         # Compute eigen{values,vectors} of the covariance matrix.
         v, W = self._cov_eigen(X)
 
+        self._set_eigen(v, W, mean)
+
+    def _set_eigen(self, v, W, mean):
+        """
+        Stores the result of training in shared variables and discards the
+        unwanted components.
+
+        Parameters
+        ----------
+        v : numpy.ndarray
+            Eigenvalues of the covariance matrix, in decreasing order
+        W : numpy.ndarray
+            Matrix containing the corresponding eigenvectors in its columns
+        mean : numpy.ndarray
+            Feature means of shape (d,)
+        """
+        if self.num_components is None:
+            self.num_components = W.shape[0]
+
         # Build Theano shared variables
         # For the moment, I do not use borrow=True because W and v are
         # subtensors, and I want the original memory to be freed
@@ -508,6 +529,252 @@ class SVDPCA(_PCABase):
         return s ** 2, Vh.T
 
 
+class CovarianceSketch(object):
+    """
+    Mergeable sufficient statistics (number of examples, mean and scatter
+    matrix) for the covariance of a stream of examples.
+
+    Batches are combined with the pairwise update of "Updating Formulae and
+    a Pairwise Algorithm for Computing Sample Variances", Chan, Golub and
+    LeVeque, which is numerically stable and lets sketches computed on
+    disjoint parts of a dataset (e.g. in different processes) be merged
+    exactly.
+
+    Parameters
+    ----------
+    dim : int
+        Dimension of the examples
+    """
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.n = 0
+        self.mean = numpy.zeros(dim)
+        self.scatter = numpy.zeros((dim, dim))
+
+    def update(self, X):
+        """
+        Adds a batch of examples to the sketch.
+
+        Parameters
+        ----------
+        X : numpy.ndarray
+            Matrix of shape (n, d) of examples
+        """
+        X = numpy.asarray(X, dtype='float64')
+        if X.shape[0] == 0:
+            return
+        batch = CovarianceSketch(self.dim)
+        batch.n = X.shape[0]
+        batch.mean = X.mean(axis=0)
+        centered = X - batch.mean
+        batch.scatter = numpy.dot(centered.T, centered)
+        self.merge(batch)
+
+    def merge(self, other):
+        """
+        Adds the statistics of another sketch to this one.
+
+        Parameters
+        ----------
+        other : CovarianceSketch
+            A sketch of examples disjoint from those of this sketch
+        """
+        if other.dim != self.dim:
+            raise ValueError("Cannot merge sketches of dimensions %d and %d"
+                             % (self.dim, other.dim))
+        if other.n == 0:
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.scatter += other.scatter
+        weight = self.n * other.n / float(n)
+        self.scatter += weight * numpy.outer(delta, delta)
+        self.mean += delta * (other.n / float(n))
+        self.n = n
+
+    def covariance(self):
+        """
+        Returns the unbiased estimate of the covariance matrix, as computed
+        by `numpy.cov`.
+        """
+        if self.n < 2:
+            raise ValueError("At least two examples are needed to estimate "
+                             "a covariance, got %d." % self.n)
+        return self.scatter / (self.n - 1.)
+
+
+def _sketch_range(dataset, start, stop, batch_size):
+    """
+    Computes the covariance sketch of a contiguous range of the examples
+    of a dataset.
+
+    Parameters
+    ----------
+    dataset : Dataset
+        The dataset, whose design matrix is sliced.
+    start, stop : int
+        The range of the examples.
+    batch_size : int
+        Number of examples added to the sketch at once.
+
+    Returns
+    -------
+    sketch : CovarianceSketch
+    """
+    X = dataset.get_design_matrix()
+    sketch = CovarianceSketch(X.shape[1])
+    for i in xrange(start, stop, batch_size):
+        sketch.update(X[i:min(i + batch_size, stop)])
+    return sketch
+
+
+class IncrementalPCA(_PCABase):
+    """
+    PCA computed from mergeable covariance sketches, so that it can be fit
+    incrementally on batches that never need to be in memory all at once.
+
+    Use `partial_fit` on successive batches (or `fit_dataset` to stream
+    the batches of a `Dataset`), then `finalize` to compute the
+    components. `train` keeps the interface of the other PCA classes.
+    Memory use is O(d^2), independently of the number of examples.
+
+    Parameters
+    ----------
+    batch_size : int, optional
+        Number of examples processed at once by `train` and
+        `fit_dataset`.
+    num_workers : int, optional
+        Number of processes used by `fit_dataset`. With more than one
+        worker, each process sketches a contiguous range of the design
+        matrix (which may be a memmap or an HDF5 array) and the sketches
+        are merged. This requires the 'fork' start method of
+        multiprocessing.
+    kwargs : dict
+        Passed on to the superclass.
+    """
+
+    def __init__(self, batch_size=1000, num_workers=1, **kwargs):
+        super(IncrementalPCA, self).__init__(**kwargs)
+        self.batch_size = batch_size
+        self.num_workers = num_workers
+        self.sketch = None
+
+    def partial_fit(self, X):
+        """
+        Updates the covariance sketch with a batch of examples.
+
+        Parameters
+        ----------
+        X : numpy.ndarray
+            Matrix of shape (n, d) of examples
+
+        Returns
+        -------
+        self : IncrementalPCA
+        """
+        if self.sketch is None:
+            self.sketch = CovarianceSketch(X.shape[1])
+        self.sketch.update(X)
+        return self
+
+    def merge(self, other):
+        """
+        Adds the examples seen by another, partially fit, IncrementalPCA.
+
+        Parameters
+        ----------
+        other : IncrementalPCA or CovarianceSketch
+            The estimator (or sketch) fit on examples disjoint from those
+            seen by this one
+
+        Returns
+        -------
+        self : IncrementalPCA
+        """
+        if isinstance(other, IncrementalPCA):
+            other = other.sketch
+        if self.sketch is None:
+            self.sketch = CovarianceSketch(other.dim)
+        self.sketch.merge(other)
+        return self
+
+    def fit_dataset(self, dataset):
+        """
+        Fits the PCA on all the features of a dataset, streamed in batches.
+
+        Parameters
+        ----------
+        dataset : Dataset
+            The dataset. It is accessed through `iterator`, or through
+            slices of `get_design_matrix()` when `num_workers` > 1.
+
+        Returns
+        -------
+        self : IncrementalPCA
+        """
+        self.sketch = None
+        if self.num_workers > 1:
+            num_examples = dataset.get_num_examples()
+            bounds = numpy.linspace(0, num_examples,
+                                    self.num_workers + 1).astype('int64')
+            tasks = [(bounds[i], bounds[i + 1])
+                     for i in xrange(self.num_workers)]
+            # The workers are forked, so they inherit the dataset without
+            # pickling the data
+            with ForkedPool(lambda task: _sketch_range(
+                    dataset, task[0], task[1], self.batch_size),
+                    self.num_workers) as pool:
+                for sketch in pool.map(tasks):
+                    self.merge(sketch)
+        else:
+            dim = dataset.get_design_matrix().shape[1]
+            iterator = dataset.iterator(mode='sequential',
+                                        batch_size=self.batch_size,
+                                        data_specs=(VectorSpace(dim),
+                                                    'features'))
+            for X in iterator:
+                self.partial_fit(X)
+        self.finalize()
+        return self
+
+    def finalize(self):
+        """
+        Computes the principal components from the examples seen so far.
+        More examples may still be added afterwards, followed by another
+        call to `finalize`.
+        """
+        if self.sketch is None:
+            raise ValueError("finalize called before any example was seen.")
+        v, W = linalg.eigh(self.sketch.covariance())
+        # The resulting components are in *ascending* order of eigenvalue, and
+        # W contains eigenvectors in its *columns*, so we simply reverse both.
+        self._set_eigen(v[::-1], W[:, ::-1], self.sketch.mean)
+
+    def train(self, X, mean=None):
+        """
+        Compute the PCA transformation matrix, processing `X` in batches.
+
+        Parameters
+        ----------
+        X : numpy.ndarray
+            Matrix of shape (n, d) on which to train PCA. It may be a
+            memmap.
+        mean : numpy.ndarray, optional
+            Feature means of shape (d,). If provided, the covariance is
+            computed around it rather than around the empirical mean.
+        """
+        self.sketch = None
+        for i in xrange(0, X.shape[0], self.batch_size):
+            self.partial_fit(X[i:i + self.batch_size])
+        if mean is not None:
+            # Move the scatter matrix to be around the given mean.
+            delta = self.sketch.mean - mean
+            self.sketch.scatter += self.sketch.n * numpy.outer(delta, delta)
+            self.sketch.mean = numpy.asarray(mean, dtype='float64')
+        self.finalize()
+
+
 class SparsePCA(_PCABase):
     """
     .. todo::
@@ -18,10 +18,12 @@ T = tensor
 from theano.tensor import nnet
 
 # Local imports
+from pylearn2.compat import OrderedDict
 from pylearn2.costs.cost import Cost
 from pylearn2.blocks import Block, StackedBlocks
 from pylearn2.utils import as_floatX, safe_update, sharedX
 from pylearn2.models import Model
+from pylearn2.models.tempering import TemperatureLadder, split_replicas, temper
 from pylearn2.expr.nnet import inverse_sigmoid_numpy
 from pylearn2.linear.matrixmul import MatrixMul
 from pylearn2.space import VectorSpace
@@ -126,6 +128,18 @@ class Sampler(object):
         """
         raise NotImplementedError()
 
+    def get_monitoring_channels(self):
+        """
+        Returns channels describing the state of the sampler.
+
+        Returns
+        -------
+        channels : OrderedDict
+            Maps channel names to theano expressions. Empty in the
+            `Sampler` base class.
+        """
+        return OrderedDict()
+
 
 class BlockGibbsSampler(Sampler):
     """
@@ -206,6 +220,125 @@ class BlockGibbsSampler(Sampler):
         }
 
 
+class ParallelTemperingSampler(Sampler):
+    """
+    Implements persistent Markov chains with parallel tempering, for use
+    with Persistent Contrastive Divergence, as described in [1].
+
+    The particles are accompanied by tempered replicas sampling from the
+    RBM with its energy multiplied by decreasing inverse temperatures.
+    All the replicas do `steps` steps of block Gibbs sampling, then
+    neighbouring replicas exchange their states. The tempered replicas are
+    stored together in `tempered_particles`, so `particles` remains the
+    state of the chains at inverse temperature 1. Tempering scales the
+    parameters of the RBM, so it is only valid when the energy is linear in
+    the parameters, as for binary-binary RBMs.
+
+    .. [1] G. Desjardins, A. Courville, Y. Bengio, P. Vincent and O.
+       Delalleau. "Parallel Tempering for Training of Restricted Boltzmann
+       Machines". Proceedings of the 13th International Conference on
+       Artificial Intelligence and Statistics, 2010.
+
+    Parameters
+    ----------
+    rbm : object
+        An instance of `RBM` or a derived class, or one implementing
+        the `gibbs_step_for_v` and `free_energy_given_v` interface.
+    particles : ndarray
+        An initial state for the set of persistent Markov chain particles
+        that will be updated at every step of learning. The tempered
+        replicas start from copies of it.
+    rng : RandomState object
+        NumPy random number generator object used to initialize a
+        RandomStreams object used in training.
+    num_replicas : int, optional
+        Number of replicas, including the one at inverse temperature 1.
+    min_beta : float, optional
+        Inverse temperature of the hottest replica.
+    steps : int, optional
+        Number of Gibbs steps to run the Markov chains for between
+        exchanges.
+    adapt_rate : float, optional
+        Step size of the adaptation of the inverse temperatures, which
+        tends to equalize the acceptance rates of the exchanges. 0 keeps
+        them fixed.
+    swap_rate_decay : float, optional
+        Decay of the moving averages of the acceptance rates of the
+        exchanges, reported by `get_monitoring_channels`.
+    """
+    def __init__(self, rbm, particles, rng, num_replicas=4, min_beta=0.2,
+                 steps=1, adapt_rate=0., swap_rate_decay=0.99):
+        super(ParallelTemperingSampler, self).__init__(rbm, particles, rng)
+        self.steps = steps
+        self.ladder = TemperatureLadder(num_replicas, min_beta, adapt_rate,
+                                        swap_rate_decay)
+        self.tempered_particles = sharedX(
+            numpy.concatenate([particles] * (num_replicas - 1)),
+            name='tempered_particles')
+
+    def updates(self):
+        """
+        Get the dictionary of updates for the sampler's persistent state
+        at each step.
+
+        Returns
+        -------
+        updates : dict
+            Dictionary with shared variable instances as keys and symbolic
+            expressions indicating how they should be updated as values.
+        """
+        num_replicas = self.ladder.num_replicas
+        num_chains = self.particles.get_value().shape[0]
+        betas = self.ladder.betas
+        params = self.rbm.get_params()
+
+        replicas = [self.particles] + split_replicas(
+            self.tempered_particles, num_replicas - 1, num_chains)
+        for r in xrange(num_replicas):
+            particles = replicas[r]
+            for i in xrange(self.steps):
+                particles, _locals = self.rbm.gibbs_step_for_v(particles,
+                                                               self.s_rng)
+            assert particles.type.dtype == self.particles.type.dtype
+            if r > 0:
+                particles = temper(particles, params, betas[r])
+            replicas[r] = particles
+
+        # Log acceptance ratio of exchanging the particles of replicas r
+        # and r + 1, from their free energies at both temperatures. The
+        # free energy is tempered before being applied to the particles,
+        # whose expressions already contain tempered parameters.
+        v = self.particles.type('pt_v')
+        fe = self.rbm.free_energy_given_v(v)
+        log_accept = []
+        for r in xrange(num_replicas - 1):
+            pair = tensor.concatenate([replicas[r], replicas[r + 1]])
+            fe_r = fe if r == 0 else temper(fe, params, betas[r])
+            fe_r1 = temper(fe, params, betas[r + 1])
+            fe_r, fe_r1 = theano.clone([fe_r, fe_r1], replace={v: pair})
+            log_accept.append(fe_r[:num_chains] + fe_r1[num_chains:] -
+                              fe_r[num_chains:] - fe_r1[:num_chains])
+        index, updates = self.ladder.swap(tensor.stack(*log_accept),
+                                          self.s_rng)
+        particles = tensor.concatenate(replicas)[index]
+
+        updates[self.particles] = particles[:num_chains]
+        updates[self.tempered_particles] = particles[num_chains:]
+        return updates
+
+    def get_monitoring_channels(self):
+        """
+        Returns the acceptance rates of the exchanges between neighbouring
+        replicas and the inverse temperature of the hottest replica.
+
+        Returns
+        -------
+        channels : OrderedDict
+            Maps channel names to theano expressions.
+        """
+        return self.ladder.get_monitoring_channels()
+
+
 class RBM(Block, Model):
     """
     A base interface for RBMs, implementing the binary-binary case.
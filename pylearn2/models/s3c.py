@@ -16,18 +16,21 @@ import numpy as np
 from theano.compat.six.moves import input, xrange
 from theano import config, function
 from theano import scan
+from theano.scan_module import until
 from theano.gof.op import get_debug_values, debug_error_message, debug_assert
 import theano.tensor as T
 
 from pylearn2.compat import OrderedDict
 from pylearn2.utils import make_name, sharedX, as_floatX
 from pylearn2.blocks import Block
+from pylearn2.datasets.dense_design_matrix import DenseDesignMatrix
 from pylearn2.expr.information_theory import entropy_binary_vector
 from pylearn2.models import Model
 from pylearn2.space import VectorSpace
 from pylearn2.utils.rng import make_np_rng
 from pylearn2.utils import contains_nan
 from pylearn2.utils import isfinite
+from pylearn2.utils.feature_extraction import extract_features
 from pylearn2.expr.basic import (full_min,
         full_max, numpy_norms, theano_norms)
 
@@ -2429,3 +2432,279 @@ class E_Step_Scan(E_Step):
                 'var_s0_hat' : var_s0_hat,
                 'var_s1_hat': var_s1_hat,
                 }
+
+
+class E_Step_Batched(E_Step):
+    """
+    A high throughput version of the heuristic E step, meant for feature
+    extraction with large batches.
+
+    All the damped updates run in a single scan loop, and the terms that
+    only depend on V are computed once, outside of it. Each example is
+    updated until none of its variational parameters moves by more than
+    `tol` in one step, after which it stays frozen, so that its features do
+    not depend on the other examples of its batch. The loop stops as soon
+    as every example of the batch has converged, or when the schedule runs
+    out.
+
+    Parameters
+    ----------
+    tol : float
+        Convergence threshold on the largest change of H_hat and S_hat of
+        an example in one damped update. 0 runs the full schedule.
+    kwargs : dict
+        Passed on to E_Step. `h_new_coeff_schedule` must be specified.
+    """
+
+    def __init__(self, tol=1e-4, **kwargs):
+        super(E_Step_Batched, self).__init__(**kwargs)
+
+        if not self.autonomous:
+            raise ValueError("E_Step_Batched needs an h_new_coeff_schedule")
+
+        self.tol = as_floatX(float(tol))
+
+    def _infer(self, V):
+        """
+        Runs the damped updates.
+
+        Parameters
+        ----------
+        V : tensor_like
+            A batch of examples.
+
+        Returns
+        -------
+        H_hat, S_hat : tensor_like
+            The initial variational parameters.
+        H_hats, S_hats : tensor_like
+            The variational parameters after each update that was run,
+            stacked along a new first axis.
+        num_updates : tensor_like
+            Vector containing the number of updates applied to each
+            example.
+        """
+        model = self.model
+
+        alpha = model.alpha
+        w = model.w
+        mu = model.mu
+        W = model.W
+        half = as_floatX(.5)
+
+        BW = model.B.dimshuffle(0, 'x') * W
+        # Loop invariants
+        VBW = T.dot(V, BW)
+        s_numer_const = mu * alpha + VBW
+        s_denom = alpha + w
+        h_const = (model.bias_hid - half * alpha * T.sqr(mu) -
+                   half * T.log(alpha + w) + half * T.log(alpha))
+
+        H_hat = self.init_H_hat(V)
+        S_hat = self.init_S_hat(V)
+        active = T.ones_like(V[:, 0])
+        num_updates = T.zeros_like(V[:, 0])
+
+        def inner_function(new_H_coeff, new_S_coeff, H_hat, S_hat, active,
+                           num_updates):
+
+            # Same as infer_S_hat
+            HS = H_hat * S_hat
+            new_S_hat = (s_numer_const - T.dot(T.dot(HS, W.T), BW) +
+                         w * HS) / s_denom
+            if self.clip_reflections:
+                new_S_hat = reflection_clip(S_hat=S_hat, new_S_hat=new_S_hat,
+                                            rho=self.rho)
+            new_S_hat = damp(old=S_hat, new=new_S_hat, new_coeff=new_S_coeff)
+
+            # Same as infer_H_hat_presigmoid, using the new S_hat
+            HS = H_hat * new_S_hat
+            sq_S = T.sqr(new_S_hat)
+            arg_to_sigmoid = ((VBW - T.dot(T.dot(HS, W.T), BW)) * new_S_hat +
+                              w * H_hat * sq_S - half * w * sq_S -
+                              half * alpha * sq_S +
+                              alpha * new_S_hat * mu + h_const)
+            new_H_hat = damp(old=H_hat, new=T.nnet.sigmoid(arg_to_sigmoid),
+                             new_coeff=new_H_coeff)
+
+            mask = active.dimshuffle(0, 'x')
+            new_S_hat = T.switch(mask, new_S_hat, S_hat)
+            new_H_hat = T.switch(mask, new_H_hat, H_hat)
+
+            change = T.maximum(abs(new_H_hat - H_hat).max(axis=1),
+                               abs(new_S_hat - S_hat).max(axis=1))
+            new_num_updates = num_updates + active
+            new_active = active * T.cast(change > self.tol, active.dtype)
+
+            return ([new_H_hat, new_S_hat, new_active, new_num_updates],
+                    until(T.eq(new_active.sum(), 0)))
+
+        schedules = [T.as_tensor_variable(as_floatX(np.asarray(schedule)))
+                     for schedule in [self.h_new_coeff_schedule,
+                                      self.s_new_coeff_schedule]]
+        (H_hats, S_hats, _, num_updates), _ = scan(
+            fn=inner_function,
+            sequences=schedules,
+            outputs_info=[H_hat, S_hat, active, num_updates])
+
+        return H_hat, S_hat, H_hats, S_hats, num_updates[-1]
+
+    def infer(self, V, return_history=False):
+        """
+        Runs the E step.
+
+        Parameters
+        ----------
+        V : tensor_like
+            A batch of examples.
+        return_history : bool
+            If True, returns a list with one dictionary of variational
+            parameters per step of the schedule, plus one for the initial
+            values. The steps after the loop stopped repeat its final
+            values.
+            If False, returns a dictionary containing the final variational
+            parameters.
+
+        Returns
+        -------
+        obs : dict or list
+            The variational parameters, or their history.
+        """
+        var_s0_hat = 1. / self.model.alpha
+        var_s1_hat = self.infer_var_s1_hat()
+
+        H_hat, S_hat, H_hats, S_hats, _ = self._infer(V)
+
+        def make_dict(H_hat, S_hat):
+            return {
+                'H_hat': H_hat,
+                'S_hat': S_hat,
+                'var_s0_hat': var_s0_hat,
+                'var_s1_hat': var_s1_hat,
+            }
+
+        if return_history:
+            num_run = H_hats.shape[0]
+            history = [make_dict(H_hat, S_hat)]
+            for i in xrange(len(self.h_new_coeff_schedule)):
+                idx = T.minimum(i, num_run - 1)
+                history.append(make_dict(H_hats[idx], S_hats[idx]))
+            return history
+
+        return make_dict(H_hats[-1], S_hats[-1])
+
+    def get_monitoring_channels(self, V):
+        """
+        Adds the mean and the maximum over the examples of the number of
+        updates run before convergence to the channels of E_Step.
+
+        Parameters
+        ----------
+        V : tensor_like
+            A batch of examples.
+
+        Returns
+        -------
+        rval : dict
+            Maps channel names to theano expressions.
+        """
+        rval = super(E_Step_Batched, self).get_monitoring_channels(V)
+
+        num_updates = self._infer(V)[-1]
+        rval['e_step_mean_num_updates'] = num_updates.mean()
+        rval['e_step_max_num_updates'] = num_updates.max()
+
+        return rval
+
+
+class _FeatureBlock(Block):
+    """
+    Computes S3C features with an E step, for `stream_features`.
+
+    Parameters
+    ----------
+    e_step : E_Step
+        The E step, registered with its model.
+    feature : str
+        See `stream_features`.
+    """
+
+    def __init__(self, e_step, feature):
+        super(_FeatureBlock, self).__init__()
+        self.e_step = e_step
+        self.feature = feature
+
+    def __call__(self, V):
+        """
+        Returns the features of a batch of examples.
+
+        Parameters
+        ----------
+        V : tensor_like
+            A batch of examples.
+
+        Returns
+        -------
+        features : tensor_like
+        """
+        obs = self.e_step.infer(V)
+        if self.feature == 'h':
+            return obs['H_hat']
+        return obs['H_hat'] * obs['S_hat']
+
+
+def stream_features(model, X, save_path, batch_size=1000, chunk_size=10000,
+                    feature='hs', e_step=None, num_workers=1):
+    """
+    Extracts S3C features from a design matrix that may be too large for
+    memory, writing them to a .npy file one chunk at a time, with
+    `pylearn2.utils.feature_extraction.extract_features`.
+
+    The chunks done are recorded in `save_path + '.progress'` after being
+    flushed to disk. If the extraction gets interrupted, calling this
+    function again with the same arguments resumes it with the chunks that
+    are not done. Once it is complete, calling it again just returns the
+    features.
+
+    Parameters
+    ----------
+    model : S3C
+        The model to extract features with.
+    X : numpy.ndarray
+        The design matrix. It can itself be a memmap.
+    save_path : str
+        Path of the .npy file to write the features to.
+    batch_size : int, optional
+        Number of examples processed by each call to the compiled E step.
+    chunk_size : int, optional
+        Number of examples between two checkpoints.
+    feature : str, optional
+        'h' for the expectations of the spike variables, 'hs' for the
+        expectations of the products of the spikes and the slabs.
+    e_step : E_Step, optional
+        An E step to use instead of the one of the model, e.g. an
+        E_Step_Batched.
+    num_workers : int, optional
+        Number of worker processes, see `extract_features`.
+
+    Returns
+    -------
+    features : numpy.memmap
+        The features, of shape (X.shape[0], model.nhid).
+    """
+    if feature not in ['h', 'hs']:
+        raise ValueError("feature should be 'h' or 'hs', got " + str(feature))
+    if model.recycle_q:
+        raise ValueError("stream_features does not support models with "
+                         "recycle_q, which need a fixed batch size.")
+    if e_step is None:
+        e_step = model.e_step
+    if e_step.model is not model:
+        e_step.register_model(model)
+    if not hasattr(model, 'w'):
+        model.make_pseudoparams()
+
+    extract_features(_FeatureBlock(e_step, feature), DenseDesignMatrix(X=X),
+                     save_path, batch_size=batch_size, chunk_size=chunk_size,
+                     num_workers=num_workers)
+    return np.load(save_path, mmap_mode='r')
@@ -0,0 +1,278 @@
+"""
+Building blocks for parallel tempering (replica exchange) samplers.
+
+Several replicas of a set of persistent chains are run at once, replica r
+sampling from the model with its energy multiplied by an inverse
+temperature betas[r], with betas[0] = 1 > betas[1] > ... The replicas are
+stored in a single batched tensor, replica r occupying rows
+r * num_chains to (r + 1) * num_chains, and neighbouring replicas
+regularly exchange their states, so that the chains at inverse
+temperature 1 benefit from the faster mixing of the hotter ones.
+
+See "Parallel Tempering for Training of Restricted Boltzmann Machines",
+Desjardins, Courville, Bengio, Vincent and Delalleau, AISTATS 2010.
+"""
+import numpy as np
+import theano
+from theano import config
+from theano import tensor as T
+from theano.compat.six.moves import xrange
+from theano.tensor.extra_ops import cumsum
+
+from pylearn2.compat import OrderedDict
+from pylearn2.utils import sharedX
+
+
+def map_nested(fn, *structures):
+    """
+    Applies a function to the leaves of nested lists or tuples.
+
+    Parameters
+    ----------
+    fn : callable
+        Function taking one leaf of each structure.
+    structures : lists, tuples or leaves
+        Structures with the same nesting.
+
+    Returns
+    -------
+    rval : list, tuple or leaf
+        A structure with the same nesting, containing the results.
+    """
+    first = structures[0]
+    if isinstance(first, (list, tuple)):
+        return type(first)(map_nested(fn, *elems)
+                           for elems in zip(*structures))
+    return fn(*structures)
+
+
+def flatten_nested(structure):
+    """
+    Returns the leaves of nested lists or tuples, in order.
+
+    Parameters
+    ----------
+    structure : list, tuple or leaf
+        The nested structure.
+
+    Returns
+    -------
+    leaves : list
+    """
+    if isinstance(structure, (list, tuple)):
+        return [leaf for elem in structure for leaf in flatten_nested(elem)]
+    return [structure]
+
+
+def temper(outputs, params, beta):
+    """
+    Rewrites expressions of a model as expressions of the model with its
+    energy multiplied by `beta`, by replacing each parameter by
+    `beta * param`.
+
+    This is only valid when the energy is linear in the parameters, as for
+    RBMs and DBMs with binary units. Random number generators are shared
+    with the original expressions, which are meant to be discarded.
+
+    Parameters
+    ----------
+    outputs : nested lists or tuples of theano variables
+        Expressions (e.g. samples or free energies) of the model.
+    params : list of theano shared variables
+        Parameters of the model.
+    beta : theano scalar
+        Inverse temperature.
+
+    Returns
+    -------
+    tempered : nested lists or tuples of theano variables
+        The tempered expressions, with the same nesting as `outputs`.
+    """
+    flat = flatten_nested(outputs)
+    replace = OrderedDict((param, T.cast(beta * param, param.dtype))
+                          for param in params)
+    flat = iter(theano.clone(flat, replace=replace))
+    return map_nested(lambda output: next(flat), outputs)
+
+
+def split_replicas(state, num_replicas, num_chains):
+    """
+    Splits the batched tensors of a state into one state per replica.
+
+    Parameters
+    ----------
+    state : nested lists or tuples of theano variables
+        State of all the replicas, with `num_replicas * num_chains` rows.
+    num_replicas : int
+        Number of replicas.
+    num_chains : int
+        Number of chains of each replica.
+
+    Returns
+    -------
+    replicas : list
+        The states of each replica.
+    """
+    return [map_nested(lambda s: s[r * num_chains:(r + 1) * num_chains],
+                       state)
+            for r in xrange(num_replicas)]
+
+
+def join_replicas(replicas):
+    """
+    Concatenates the states of the replicas into batched tensors.
+
+    Parameters
+    ----------
+    replicas : list
+        The states of each replica, as returned by `split_replicas`.
+
+    Returns
+    -------
+    state : nested lists or tuples of theano variables
+        State of all the replicas.
+    """
+    return map_nested(lambda *states: T.concatenate(states, axis=0),
+                      *replicas)
+
+
+class TemperatureLadder(object):
+    """
+    The inverse temperatures of the replicas of a parallel tempering
+    sampler, and the exchange moves between neighbouring replicas.
+
+    Exchanges are attempted between replicas 2i and 2i+1 and between
+    replicas 2i+1 and 2i+2 on alternate calls, for all the chains at once.
+    An exponential moving average of the acceptance rate of each pair is
+    kept and reported by `get_monitoring_channels`. It can also be used to
+    adapt the ladder: the log inverse temperature gaps between replicas
+    that exchange more often than average are widened, and the others
+    narrowed, keeping the lowest inverse temperature fixed.
+
+    Parameters
+    ----------
+    num_replicas : int
+        Number of replicas, including the one at inverse temperature 1.
+    min_beta : float, optional
+        Inverse temperature of the hottest replica. The initial ladder is
+        geometric between 1 and `min_beta`.
+    adapt_rate : float, optional
+        Step size of the adaptation of the ladder. 0 keeps the ladder
+        fixed.
+    swap_rate_decay : float, optional
+        Decay of the moving averages of the acceptance rates.
+    """
+
+    def __init__(self, num_replicas, min_beta=0.2, adapt_rate=0.,
+                 swap_rate_decay=0.99):
+        if num_replicas < 2:
+            raise ValueError("Parallel tempering needs at least 2 replicas, "
+                             "got %d." % num_replicas)
+        if not 0. < min_beta < 1.:
+            raise ValueError("min_beta should be in (0, 1), got %f."
+                             % min_beta)
+        self.num_replicas = num_replicas
+        self.adapt_rate = adapt_rate
+        self.swap_rate_decay = swap_rate_decay
+        self.betas = sharedX(np.exp(np.linspace(0., np.log(min_beta),
+                                                num_replicas)),
+                             name='pt_betas')
+        self.swap_rates = sharedX(np.zeros(num_replicas - 1),
+                                  name='pt_swap_rates')
+        self.parity = sharedX(0, name='pt_parity', dtype='int64')
+
+    def swap(self, log_accept, theano_rng):
+        """
+        Returns the permutation of the rows of the batched state that
+        performs an exchange move, and the updates of the ladder.
+
+        Parameters
+        ----------
+        log_accept : theano matrix
+            Matrix of shape (num_replicas - 1, num_chains), the log of the
+            Metropolis acceptance ratio of exchanging the states of
+            replicas r and r + 1 for each chain.
+        theano_rng : MRG_RandomStreams
+            Random number generator.
+
+        Returns
+        -------
+        index : theano vector
+            Row i of the new batched state is row index[i] of the old one.
+        updates : OrderedDict
+            Updates of the parity, the acceptance rates and, if adaptive,
+            the inverse temperatures.
+        """
+        num_replicas = self.num_replicas
+        num_chains = log_accept.shape[1]
+
+        pairs = T.arange(num_replicas - 1)
+        active = T.eq(pairs % 2, self.parity)
+        u = theano_rng.uniform(size=log_accept.shape, dtype=config.floatX)
+        accept = T.and_(T.lt(T.log(u), log_accept),
+                        active.dimshuffle(0, 'x'))
+        accept = T.cast(accept, 'int64')
+
+        # Replica r takes the state of replica r + 1 if pair r swaps, and
+        # that of replica r - 1 if pair r - 1 swaps.
+        no_swap = T.zeros_like(accept[:1])
+        source = (T.arange(num_replicas).dimshuffle(0, 'x') +
+                  T.concatenate([accept, no_swap]) -
+                  T.concatenate([no_swap, accept]))
+        index = (source * num_chains +
+                 T.arange(num_chains).dimshuffle('x', 0)).flatten()
+
+        rates = T.cast(T.mean(accept, axis=1), config.floatX)
+        decay = np.cast[config.floatX](self.swap_rate_decay)
+        keep = np.cast[config.floatX](1. - self.swap_rate_decay)
+        swap_rates = T.switch(active,
+                              decay * self.swap_rates + keep * rates,
+                              self.swap_rates)
+
+        updates = OrderedDict()
+        updates[self.parity] = 1 - self.parity
+        updates[self.swap_rates] = swap_rates
+        if self.adapt_rate > 0.:
+            updates[self.betas] = self._adapt(swap_rates)
+        return index, updates
+
+    def _adapt(self, swap_rates):
+        """
+        Returns the adapted inverse temperatures.
+
+        Parameters
+        ----------
+        swap_rates : theano vector
+            Acceptance rates of the pairs of neighbouring replicas.
+
+        Returns
+        -------
+        betas : theano vector
+            The new inverse temperatures.
+        """
+        log_betas = T.log(self.betas)
+        gaps = log_betas[:-1] - log_betas[1:]
+        gaps = gaps * T.exp(self.adapt_rate *
+                            (swap_rates - T.mean(swap_rates)))
+        gaps = gaps * (log_betas[0] - log_betas[-1]) / T.sum(gaps)
+        new_log_betas = T.concatenate([log_betas[:1],
+                                       log_betas[0] - cumsum(gaps)])
+        return T.cast(T.exp(new_log_betas), self.betas.dtype)
+
+    def get_monitoring_channels(self):
+        """
+        Returns monitoring channels for the acceptance rates of the
+        exchanges between each pair of neighbouring replicas and the
+        inverse temperature of the hottest replica.
+
+        Returns
+        -------
+        channels : OrderedDict
+            Maps channel names to theano expressions.
+        """
+        rval = OrderedDict()
+        for i in xrange(self.num_replicas - 1):
+            rval['pt_swap_rate_%d' % i] = self.swap_rates[i]
+        rval['pt_min_swap_rate'] = T.min(self.swap_rates)
+        rval['pt_min_beta'] = self.betas[-1]
+        return rval
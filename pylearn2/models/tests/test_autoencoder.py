@@ -4,13 +4,15 @@ Tests for the pylearn2 autoencoder module.
 import os.path
 
 import numpy as np
+import scipy.sparse
 import theano
 import theano.tensor as tensor
 from theano import config
 from pylearn2.models.autoencoder import Autoencoder, \
     HigherOrderContractiveAutoencoder, DeepComposedAutoencoder, \
-    UntiedAutoencoder
+    UntiedAutoencoder, DenoisingAutoencoder
 from pylearn2.corruption import BinomialCorruptor
+from pylearn2.costs.autoencoder import SparseSampledMeanBinaryCrossEntropy
 from pylearn2.config import yaml_parse
 from theano.tensor.basic import _allclose
 
@@ -121,3 +123,66 @@ def test_dcae():
 
     data = np.random.randn(10, 5).astype(config.floatX)
     model.perform(data)
+
+
+def test_sparse_autoencoder_entries():
+    """
+    Tests the sparse encoding, the sparse corruption and the sampled
+    reconstruction cost against numpy.
+    """
+    rng = np.random.RandomState([2015, 4, 28])
+    data = scipy.sparse.rand(10, 6, density=.3, format='csr',
+                             random_state=rng).astype(config.floatX)
+    dense = data.toarray()
+    ae = Autoencoder(6, 4, act_enc='sigmoid', act_dec='sigmoid',
+                     sparse_input=True)
+    ae.visbias.set_value(rng.randn(6).astype(config.floatX))
+    X = ae.get_input_space().make_theano_batch()
+
+    h = 1. / (1. + np.exp(-ae.hidbias.get_value() -
+                          np.dot(dense, ae.weights.get_value())))
+    r = 1. / (1. + np.exp(-ae.visbias.get_value() -
+                          np.dot(h, ae.w_prime.get_value())))
+    assert _allclose(theano.function([X], ae.encode(X))(data), h)
+
+    # Without sampled entries, only the nonzero entries are scored
+    cost = SparseSampledMeanBinaryCrossEntropy(num_samples=0)
+    ce = -(dense * np.log(r) + (1. - dense) * np.log(1. - r))
+    expected = (ce * (dense != 0)).sum() / 10.
+    assert np.allclose(theano.function([X], cost.expr(ae, X))(data),
+                       expected, rtol=1e-4)
+
+    # The sampled entries hitting nonzero entries get no weight, the others
+    # share the number of zero entries of their example
+    cost = SparseSampledMeanBinaryCrossEntropy(num_samples=5)
+    rows, cols, target, weights = theano.function(
+        [X], cost.get_entries(X))(data)
+    nnz = data.nnz
+    assert np.all(weights[:nnz] == 1)
+    sampled = slice(nnz, None)
+    hits = dense[rows[sampled], cols[sampled]] != 0
+    assert np.all(weights[sampled][hits] == 0)
+    assert np.all(target[sampled] == 0)
+    for i in range(10):
+        misses = (rows[sampled] == i) & ~hits
+        if misses.any():
+            assert np.allclose(weights[sampled][misses].sum(),
+                               (dense[i] == 0).sum())
+
+    # With many samples, the cost approaches the cost of all the entries
+    cost = SparseSampledMeanBinaryCrossEntropy(num_samples=2000)
+    assert np.allclose(theano.function([X], cost.expr(ae, X))(data),
+                       ce.sum() / 10., rtol=.05)
+
+    cost = SparseSampledMeanBinaryCrossEntropy(num_samples=3)
+    grads = theano.grad(cost.expr(ae, X), ae.get_params())
+    for grad in theano.function([X], grads)(data):
+        assert np.all(np.isfinite(grad))
+
+    dae = DenoisingAutoencoder(BinomialCorruptor(.5), 6, 4, 'sigmoid',
+                               'sigmoid', sparse_input=True)
+    corrupted = theano.function([X], dae.corruptor(X))(data)
+    assert scipy.sparse.isspmatrix_csr(corrupted)
+    assert np.all(corrupted.indices == data.indices)
+    assert np.all((corrupted.data == 0) | (corrupted.data == data.data))
+    theano.function([X], cost.expr(dae, X))(data)
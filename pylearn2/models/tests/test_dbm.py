@@ -2,6 +2,9 @@ from __future__ import print_function
 
 from pylearn2.models.dbm.dbm import DBM
 from pylearn2.models.dbm.layer import BinaryVector, BinaryVectorMaxPool, Softmax, GaussianVisLayer
+from pylearn2.models.dbm.sampling_procedure import ParallelTempering
+from pylearn2.models.dbm.inference_procedure import (WeightDoubling,
+                                                     BiasInit, UpDown)
 
 __authors__ = "Ian Goodfellow"
 __copyright__ = "Copyright 2012, Universite de Montreal"
@@ -1196,6 +1199,93 @@ def test_variational_cd():
     grads, updates = cost.get_gradients(model, nested_args)
 
 
+def test_parallel_tempering():
+    # Tests that a DBM using ParallelTempering keeps binary chains and
+    # tempered replicas of the right shapes, and updates its ladder
+    num_chains = 7
+    visible_layer = BinaryVector(nvis=5)
+    hidden_layer = BinaryVectorMaxPool(detector_layer_dim=4,
+                                       pool_size=1,
+                                       layer_name='h',
+                                       irange=1.)
+    sampling_procedure = ParallelTempering(num_replicas=3, min_beta=.5)
+    model = DBM(visible_layer=visible_layer,
+                hidden_layers=[hidden_layer],
+                batch_size=num_chains,
+                niter=1,
+                sampling_procedure=sampling_procedure)
+    theano_rng = MRG_RandomStreams(2015+4+23)
+
+    layer_to_state = model.make_layer_to_state(num_chains)
+    updates = model.get_sampling_updates(layer_to_state, theano_rng,
+                                         num_steps=2)
+    tempered = [key for key in updates
+                if key.name is not None and
+                key.name.startswith('tempered_')]
+    assert len(tempered) == 3
+
+    f = function([], [], updates=updates)
+    for i in xrange(10):
+        f()
+
+    for state in tempered:
+        value = state.get_value()
+        assert value.shape[0] == 2 * num_chains
+        assert is_binary(value)
+
+    # Building the updates again keeps sampling the same tempered replicas
+    values = [state.get_value() for state in tempered]
+    updates = model.get_sampling_updates(layer_to_state, theano_rng)
+    assert all(state in updates for state in tempered)
+    assert all(np.all(state.get_value() == value)
+               for state, value in zip(tempered, values))
+    for state in [layer_to_state[visible_layer]] + \
+            list(layer_to_state[hidden_layer]):
+        assert is_binary(state.get_value())
+    swap_rates = sampling_procedure.ladder.swap_rates.get_value()
+    assert np.all((swap_rates >= 0) & (swap_rates <= 1))
+    assert sampling_procedure.ladder.parity.get_value() == 0
+
+
+def test_scan_mf():
+    # Tests that mean field in a scan loop gives the same result as the
+    # unrolled one, and that early stopping reports the iterations it used
+    batch_size = 5
+    niter = 6
+    visible_layer = BinaryVector(nvis=4)
+    hidden_layers = [BinaryVectorMaxPool(detector_layer_dim=3,
+                                         pool_size=1,
+                                         layer_name='h%d' % i,
+                                         irange=.5)
+                     for i in xrange(3)]
+    model = DBM(visible_layer=visible_layer,
+                hidden_layers=hidden_layers,
+                batch_size=batch_size,
+                niter=niter)
+    rng = np.random.RandomState([2015, 4, 24])
+    V = rng.uniform(size=(batch_size, 4)).astype(config.floatX)
+    X = T.matrix()
+
+    def infer(inference_procedure):
+        inference_procedure.set_dbm(model)
+        model.inference_procedure = inference_procedure
+        outputs = [state[0] for state in model.mf(X)]
+        channels = inference_procedure.get_monitoring_channels()
+        return function([X], outputs + list(channels.values()))(V)
+
+    for cls in [WeightDoubling, BiasInit, UpDown]:
+        expected = infer(cls())
+        actual = infer(cls(use_scan=True))
+        assert np.allclose(actual[-1], niter)
+        for e, a in safe_zip(expected, actual[:-1]):
+            assert np.allclose(e, a)
+
+        actual = infer(cls(use_scan=True, tol=1.))
+        assert np.allclose(actual[-1], 2)
+        actual = infer(cls(use_scan=True, tol=0.))
+        assert np.allclose(actual[-1], niter)
+
+
 def test_extra():
     """
     Test functionality that remains private, if available.
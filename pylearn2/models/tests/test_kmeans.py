@@ -9,6 +9,22 @@ from pylearn2.models.kmeans import KMeans
 from pylearn2.train import Train
 
 
+def cost(X, mu):
+    """
+    Returns the mean squared distance of the examples to their nearest
+    mean.
+
+    Parameters
+    ----------
+    X : numpy.ndarray
+        Matrix of examples.
+    mu : numpy.ndarray
+        Matrix of means.
+    """
+    dists = np.square(X[:, np.newaxis, :] - mu[np.newaxis, :, :]).sum(axis=2)
+    return dists.min(axis=1).mean()
+
+
 def test_kmeans():
     """
     Tests kmeans.Kmeans by using it as a model in a Train object.
@@ -26,3 +42,35 @@ def test_kmeans():
 
     train = Train(model=model, dataset=dataset)
     train.main_loop()
+
+
+def test_kmeans_minibatch():
+    """
+    Tests that mini-batch k-means, with each initialization, recovers well
+    separated clusters.
+    """
+    rng = np.random.RandomState([2015, 4, 17])
+    centers = 10. * np.eye(5)
+    X = centers[rng.randint(5, size=500)] + 0.1 * rng.randn(500, 5)
+    dataset = DenseDesignMatrix(X)
+
+    for init in ['random', 'k-means++', 'k-means||']:
+        model = KMeans(k=5, nvis=5, batch_size=50, init=init, max_iter=10,
+                       rng=rng)
+        model.train_all(dataset)
+        mu = model.get_weights().get_value()
+        dists = np.square(mu[:, np.newaxis, :] -
+                          centers[np.newaxis, :, :]).sum(axis=2)
+        if init != 'random':
+            # Careful seeding picks one example from each cluster, and the
+            # cost reaches that of the true centers, as full-batch k-means
+            # does
+            assert np.all(dists.min(axis=0) < 1.)
+            assert np.allclose(cost(X, mu), cost(X, centers), rtol=.1)
+        assert model(X).shape == (500, 5)
+
+    # Mini-batch k-means lowers the cost of random initial means
+    init_mu = X[rng.randint(500, size=5)]
+    model = KMeans(k=5, nvis=5, batch_size=50, max_iter=10, rng=rng)
+    model.train_all(dataset, mu=init_mu.copy())
+    assert cost(X, model.get_weights().get_value()) < .9 * cost(X, init_mu)
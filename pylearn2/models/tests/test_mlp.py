@@ -7,6 +7,7 @@ from theano.compat import six
 from theano.compat.six.moves import reduce, xrange
 import theano
 from theano import tensor, config
+from nose.plugins.skip import SkipTest
 from nose.tools import assert_raises
 
 from pylearn2.datasets.vector_spaces_dataset import VectorSpacesDataset
@@ -622,3 +623,36 @@ def test_mean_pool():
                          [9, 11]], dtype=theano.config.floatX)
     actual = f(X)
     assert np.allclose(expected, actual)
+
+
+def test_activation_dtypes():
+    """
+    Checks that the outputs of the layers given an activation dtype are
+    cast to it, while the parameters keep their dtype.
+    """
+    if 'float16' not in [t.dtype for t in theano.scalar.all_types]:
+        raise SkipTest("This version of Theano does not support float16.")
+    mlp = MLP(layers=[Linear(10, 'h0', 0.1), Linear(10, 'h1', 0.1),
+                      Softmax(3, 'y', 0.1)],
+              input_space=VectorSpace(10, dtype='float16'),
+              activation_dtypes={'h0': 'float16', 'h1': 'float16'})
+    assert mlp.layers[0].get_output_space().dtype == 'float16'
+    assert mlp.layers[2].get_output_space().dtype == config.floatX
+    for param in mlp.get_params():
+        assert param.dtype == config.floatX
+
+    X = mlp.get_input_space().make_theano_batch()
+    states = mlp.fprop(X, return_all=True)
+    assert [state.dtype for state in states] == ['float16', 'float16',
+                                                 config.floatX]
+    f = theano.function([X], states[-1])
+    Y = f(np.random.rand(5, 10).astype('float16'))
+    assert np.allclose(Y.sum(axis=1), 1., atol=1e-2)
+
+    mlp = MLP(layers=[Linear(10, 'h0', 0.1), Linear(10, 'h1', 0.1)],
+              nvis=10, activation_dtypes='float16')
+    X = mlp.get_input_space().make_theano_batch()
+    assert mlp.fprop(X).dtype == 'float16'
+
+    assert_raises(ValueError, MLP, layers=[Linear(10, 'h0', 0.1)], nvis=10,
+                  activation_dtypes={'h1': 'float16'})
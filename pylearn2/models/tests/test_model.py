@@ -3,8 +3,11 @@ Tests for functionality from model.py
 """
 
 import numpy as np
+from theano import config
+from theano.compat.six.moves import cPickle
 
 from pylearn2.models import Model
+from pylearn2.models.autoencoder import Autoencoder
 from pylearn2.utils import sharedX
 
 
@@ -53,3 +56,20 @@ def test_tag():
     assert 'bar' in x.tag
     assert 'baz' in x.tag['bar']
     assert len(x.tag.keys()) == 2
+
+
+def test_unpickle_does_not_compile():
+    """
+    Tests that the function compiled by Block.perform is not pickled, so
+    that unpickling a model does not compile it, and that it is compiled
+    again lazily.
+    """
+    model = Autoencoder(5, 3, 'sigmoid', 'linear')
+    data = np.random.RandomState([2015, 4, 29]).randn(4, 5)
+    data = data.astype(config.floatX)
+    expected = model.perform(data)
+    assert model.fn is not None
+
+    loaded = cPickle.loads(cPickle.dumps(model))
+    assert loaded.fn is None
+    assert np.allclose(loaded.perform(data), expected)
@@ -0,0 +1,82 @@
+"""
+Tests of ../pca.py
+"""
+
+import numpy as np
+
+from pylearn2.datasets.dense_design_matrix import DenseDesignMatrix
+from pylearn2.models.pca import CovEigPCA, IncrementalPCA
+
+
+def get_data(rng, num_examples=200, dim=6):
+    """
+    Returns correlated random data with distinct variances.
+
+    Parameters
+    ----------
+    rng : numpy.random.RandomState
+        Random number generator.
+    num_examples : int, optional
+        Number of examples.
+    dim : int, optional
+        Number of features.
+    """
+    mixing = rng.randn(dim, dim)
+    return np.dot(rng.randn(num_examples, dim), mixing) + rng.randn(dim)
+
+
+def check_components(pca, reference):
+    """
+    Checks that two trained PCA blocks have the same components, up to
+    their signs.
+
+    Parameters
+    ----------
+    pca : PCA
+        A trained PCA block.
+    reference : PCA
+        The PCA block it is compared to.
+    """
+    assert np.allclose(pca.v.get_value(), reference.v.get_value())
+    assert np.allclose(pca.mean.get_value(), reference.mean.get_value())
+    assert np.allclose(np.abs(pca.W.get_value()),
+                       np.abs(reference.W.get_value()), atol=1e-4)
+
+
+def test_incremental_pca():
+    """
+    Tests that IncrementalPCA gives the same components as CovEigPCA,
+    whether it sees the data in batches, as merged partial fits or through
+    a dataset.
+    """
+    rng = np.random.RandomState([2015, 4, 20])
+    X = get_data(rng)
+
+    reference = CovEigPCA(num_components=4)
+    reference.train(X)
+
+    pca = IncrementalPCA(num_components=4, batch_size=30)
+    pca.train(X)
+    check_components(pca, reference)
+
+    first = IncrementalPCA(num_components=4).partial_fit(X[:70])
+    second = IncrementalPCA(num_components=4)
+    for i in range(70, X.shape[0], 40):
+        second.partial_fit(X[i:i + 40])
+    first.merge(second)
+    first.finalize()
+    check_components(first, reference)
+
+    pca = IncrementalPCA(num_components=4, batch_size=64)
+    pca.fit_dataset(DenseDesignMatrix(X=X))
+    check_components(pca, reference)
+
+    # With a given mean, the covariance is computed around it.
+    mean = X.mean(axis=0) + 1.
+    pca = IncrementalPCA(batch_size=30)
+    pca.train(X, mean=mean)
+    centered = X - mean
+    expected = np.linalg.eigvalsh(np.dot(centered.T, centered) /
+                                  (X.shape[0] - 1.))[::-1]
+    assert np.allclose(pca.v.get_value(), expected, rtol=1e-4)
+    assert np.allclose(pca.mean.get_value(), mean)
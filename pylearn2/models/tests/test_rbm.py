@@ -4,9 +4,12 @@ import theano.sandbox.rng_mrg
 RandomStreams = theano.sandbox.rng_mrg.MRG_RandomStreams
 from theano import tensor as T
 
+from pylearn2.config import yaml_parse
 from pylearn2.datasets.dense_design_matrix import DenseDesignMatrix
-from pylearn2.models.rbm import RBM
+from pylearn2.models.rbm import RBM, ParallelTemperingSampler
+from pylearn2.termination_criteria import EpochCounter
 from pylearn2.training_algorithms.default import DefaultTrainingAlgorithm
+from pylearn2.training_algorithms.sgd import SGD
 from pylearn2.utils.rng import make_theano_rng
 
 
@@ -53,3 +56,59 @@ def test_train_batch():
     trainer = DefaultTrainingAlgorithm(batch_size=1, batches_per_iter=10)
     trainer.setup(rbm, train)
     trainer.train(train)
+
+
+def test_parallel_tempering_sampler():
+    # Tests that ParallelTemperingSampler keeps binary particles of the
+    # right shapes, a valid ladder of inverse temperatures and acceptance
+    # rates in [0, 1]
+
+    rng = np.random.RandomState([2015, 4, 23])
+    num_chains = 6
+    model = RBM(nvis=5, nhid=4, irange=1.)
+    particles = np.asarray(rng.uniform(size=(num_chains, 5)) > .5,
+                           dtype=theano.config.floatX)
+    sampler = ParallelTemperingSampler(model, particles, rng, num_replicas=3,
+                                       min_beta=.25, adapt_rate=.1)
+    f = theano.function([], [], updates=sampler.updates())
+    for i in range(20):
+        f()
+
+    for value, shape in [(sampler.particles.get_value(), (num_chains, 5)),
+                         (sampler.tempered_particles.get_value(),
+                          (2 * num_chains, 5))]:
+        assert value.shape == shape
+        assert np.all((value == 0) | (value == 1))
+    betas = sampler.ladder.betas.get_value()
+    assert np.allclose(betas[[0, -1]], [1., .25])
+    assert np.all(np.diff(betas) < 0)
+    swap_rates = sampler.ladder.swap_rates.get_value()
+    assert np.all((swap_rates >= 0) & (swap_rates <= 1))
+    assert 'pt_min_swap_rate' in sampler.get_monitoring_channels()
+
+
+def test_sml_parallel_tempering():
+    # Tests that the sampler of SML can be chosen from YAML, and that the
+    # acceptance rates of a ParallelTemperingSampler are monitored
+
+    rng = np.random.RandomState([2015, 4, 23])
+    X = np.asarray(rng.uniform(size=(20, 5)) > .5,
+                   dtype=theano.config.floatX)
+    dataset = DenseDesignMatrix(X=X)
+    model = RBM(nvis=5, nhid=4, irange=1.)
+    cost = yaml_parse.load("""
+    !obj:pylearn2.costs.ebm_estimation.SML {
+        batch_size: 5,
+        nsteps: 1,
+        sampler_class: !import pylearn2.models.rbm.ParallelTemperingSampler,
+        sampler_kwargs: {num_replicas: 3}
+    }
+    """)
+    algorithm = SGD(1e-2, cost, batch_size=5, monitoring_dataset=dataset,
+                    termination_criterion=EpochCounter(1))
+    algorithm.setup(model, dataset)
+    algorithm.train(dataset)
+
+    assert isinstance(cost.sampler, ParallelTemperingSampler)
+    assert cost.sampler.tempered_particles.get_value().shape == (10, 5)
+    assert 'pt_min_swap_rate' in model.monitor.channels
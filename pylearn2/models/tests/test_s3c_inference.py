@@ -4,9 +4,14 @@ from pylearn2.models.s3c import S3C
 from pylearn2.models.s3c import E_Step_Scan
 from pylearn2.models.s3c import Grad_M_Step
 from pylearn2.models.s3c import E_Step
+from pylearn2.models.s3c import E_Step_Batched
+from pylearn2.models.s3c import stream_features
 from pylearn2.utils import contains_nan
 from theano import function
 import numpy as np
+import os
+import shutil
+import tempfile
 from theano.compat.six.moves import xrange
 import theano.tensor as T
 from theano import config
@@ -115,6 +120,71 @@ class Test_S3C_Inference:
             assert np.allclose(outputs[i],outputs[i+1])
 
 
+    def test_batched_match_unrolled(self):
+        """ tests that the batched E step matches unrolled inference when it
+        runs the full schedule, and stays close to it when it stops early """
+
+        unrolled_e_step = E_Step(
+            h_new_coeff_schedule=self.h_new_coeff_schedule)
+        unrolled_e_step.register_model(self.model)
+
+        V = T.matrix()
+        unrolled_result = unrolled_e_step.infer(V)
+        outputs = [unrolled_result['H_hat'], unrolled_result['S_hat']]
+
+        for tol in [0., 1e-3]:
+            batched_e_step = E_Step_Batched(
+                tol=tol, h_new_coeff_schedule=self.h_new_coeff_schedule)
+            batched_e_step.register_model(self.model)
+            batched_result = batched_e_step.infer(V)
+            outputs.extend([batched_result['H_hat'],
+                            batched_result['S_hat']])
+
+        H, S, H_full, S_full, H_early, S_early = function([V],
+                                                          outputs)(self.X)
+
+        assert np.allclose(H, H_full)
+        assert np.allclose(S, S_full)
+        assert np.abs(H - H_early).max() < 1e-2
+        assert np.abs(S - S_early).max() < 1e-1
+
+    def test_stream_features(self):
+        """ tests that stream_features extracts the same features as the E
+        step, and resumes an interrupted extraction """
+
+        e_step = E_Step_Batched(
+            tol=0., h_new_coeff_schedule=self.h_new_coeff_schedule)
+        e_step.register_model(self.model)
+
+        V = T.matrix()
+        obs = e_step.infer(V)
+        expected = function([V], obs['H_hat'] * obs['S_hat'])(self.X)
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            save_path = os.path.join(tmp_dir, 'features.npy')
+            features = stream_features(self.model, self.X, save_path,
+                                       batch_size=128, chunk_size=300,
+                                       e_step=e_step)
+            assert np.allclose(features, expected)
+            del features
+
+            # Pretend the extraction stopped after the first chunk
+            features = np.lib.format.open_memmap(save_path, mode='r+')
+            features[300:] = 0.
+            features.flush()
+            del features
+            with open(save_path + '.progress', 'w') as f:
+                f.write('0 300\n')
+
+            features = stream_features(self.model, self.X, save_path,
+                                       batch_size=128, chunk_size=300,
+                                       e_step=e_step)
+            assert np.allclose(features, expected)
+            del features
+        finally:
+            shutil.rmtree(tmp_dir)
+
     def test_grad_s(self):
 
         "tests that the gradients with respect to s_i are 0 after doing a mean field update of s_i "
@@ -25,10 +25,14 @@ from theano.printing import var_descriptor
 from pylearn2.config import yaml_parse
 from pylearn2.datasets.dataset import Dataset
 from pylearn2.space import Space, CompositeSpace, NullSpace
-from pylearn2.utils import function, sharedX, safe_zip, safe_izip
+from pylearn2.utils import function, sharedX, safe_izip
 from pylearn2.utils.exc import reraise_as
 from pylearn2.utils.iteration import is_stochastic
 from pylearn2.utils.data_specs import DataSpecsMapping
+from pylearn2.utils.function_cache import (get_compile_count,
+                                           get_compile_times,
+                                           summarize_compile_times)
+from pylearn2.utils.graph_cache import GraphCache
 from pylearn2.utils.string_utils import number_aware_alphabetical_key
 from pylearn2.utils.timing import log_timing
 
@@ -379,6 +383,7 @@ class Monitor(object):
         that are shared between multiple channels.
         """
         self._dirty = False
+        compile_times_start = get_compile_count()
 
         # Recompute the data specs, since the channels may have changed.
         self._build_data_specs()
@@ -440,13 +445,18 @@ class Monitor(object):
                                  return_tuple=True))
         self.num_examples = [np.cast[config.floatX](float(i.num_examples))
                              for i in it]
+        # The numbers of examples are shared variables rather than
+        # constants, so that the accum functions of datasets of different
+        # sizes are structurally identical, and optimized only once
+        num_examples = [sharedX(n, 'monitor_num_examples[%d]' % i)
+                        for i, n in enumerate(self.num_examples)]
         givens = [OrderedDict() for d in self._datasets]
         updates = [OrderedDict() for d in self._datasets]
         for i, channel in enumerate(self.channels.values()):
             index = self._datasets.index(channel.dataset)
             d = self._datasets[index]
             g = givens[index]
-            cur_num_examples = self.num_examples[index]
+            cur_num_examples = num_examples[index]
             u = updates[index]
 
             # Flatten channel.graph_input and the appropriate part of
@@ -521,6 +531,8 @@ class Monitor(object):
                         mode.record.handle_line('accum output ' +
                                                 var_descriptor(elem) + '\n')
                 log.info("graph size: %d" % len(a.maker.fgraph.toposort()))
+        log.info('Compiled by the monitor: ' + summarize_compile_times(
+            get_compile_times(compile_times_start)))
         final_names = dir(self)
         self.register_names_to_del([name for name in final_names
                                     if name not in init_names])
@@ -794,7 +806,7 @@ class Monitor(object):
 
     def setup(self, dataset, cost, batch_size, num_batches=None,
               extra_costs=None, mode='sequential', obj_prereqs=None,
-              cost_monitoring_args=None):
+              cost_monitoring_args=None, graph_cache=None):
         """
         Sets up the monitor for a cost minimization problem.
         Adds channels defined by both the model and the cost for
@@ -829,6 +841,11 @@ class Monitor(object):
             Dictionary of kwargs that will be passed to
             `cost.get_monitoring_channels()`
             (but not for the extra_costs).
+        graph_cache : pylearn2.utils.graph_cache.GraphCache, optional
+            Symbolic batches and cost expressions already built by the
+            training algorithm, which are reused rather than built again.
+            In any case, the expression of each cost is built once and
+            shared by all the datasets.
         """
 
         if dataset is None:
@@ -872,17 +889,13 @@ class Monitor(object):
         nested_sources = tuple(sources)
 
         # Flatten this data_specs, so we build only one symbolic Theano
-        # variable for each of the unique (space, source) pairs.
-        mapping = DataSpecsMapping((nested_space, nested_sources))
-        space_tuple = mapping.flatten(nested_space, return_tuple=True)
-        source_tuple = mapping.flatten(nested_sources, return_tuple=True)
-        ipt = tuple(space.make_theano_batch(name='monitor_%s' % source,
-                                            batch_size=None)
-                    for (space, source) in safe_zip(space_tuple, source_tuple))
-
-        # Build a nested tuple from ipt, to dispatch the appropriate parts
-        # of the ipt batch to each cost
-        nested_ipt = mapping.nest(ipt)
+        # variable for each of the unique (space, source) pairs, and build
+        # a nested tuple from them, to dispatch the appropriate parts of
+        # the batch to each cost
+        if graph_cache is None:
+            graph_cache = GraphCache()
+        ipt, nested_ipt = graph_cache.batches(
+            (nested_space, nested_sources), 'monitor_%s')
 
         custom_channels = {}
         for i, cost_name in enumerate(cost_names):
@@ -936,7 +949,7 @@ class Monitor(object):
             for i, cost_name in enumerate(cost_names):
                 cost = costs[cost_name]
                 cost_ipt = nested_ipt[i]
-                cost_value = cost.expr(model, cost_ipt)
+                cost_value = graph_cache.cost_expr(cost, model, cost_ipt)
                 if cost_value is not None:
                     if cost_name == '':
                         name = dprefix + 'objective'
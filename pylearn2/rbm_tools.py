@@ -5,6 +5,7 @@ import theano
 from theano import tensor, config
 from theano.tensor import nnet
 from pylearn2.utils.exc import reraise_as
+from pylearn2.utils.forked_pool import ForkedPool
 from pylearn2.utils.rng import make_np_rng, make_theano_rng
 from pylearn2.utils.mem import improve_memory_error_message
 
@@ -91,6 +92,123 @@ def compute_log_z(rbm, free_energy_fn, max_bits=15):
     return log_z
 
 
+def _gray_code_table(columns):
+    """
+    Returns the sums of all the subsets of the columns of a matrix, in the
+    order of the reflected binary Gray code: row i holds the sum of the
+    columns selected by the bits of `i ^ (i >> 1)`. Each row is obtained
+    from a previous one by adding a single column.
+    """
+    table = numpy.zeros((1, columns.shape[0]), dtype=columns.dtype)
+    for j in xrange(columns.shape[1]):
+        table = numpy.vstack((table, table[::-1] + columns[:, j]))
+    return table
+
+
+def _lowest_set_bit(i):
+    """
+    Returns the index of the lowest set bit of a positive integer, e.g. 2
+    for 12. It does the same as `(i & -i).bit_length() - 1`, which needs
+    Python 2.7.
+    """
+    j = 0
+    while not i >> j & 1:
+        j += 1
+    return j
+
+
+def compute_log_z_gray(rbm_params, max_bits=15, num_threads=1):
+    """
+    Compute the log partition function of a binary-binary RBM by exact
+    enumeration of the states of its smaller layer, in Gray-code order.
+
+    The states of the `max_bits` least significant units are enumerated
+    at once, from a table of their contributions to the pre-activations
+    of the other layer. The states of the remaining (most significant)
+    units are then walked in Gray-code order, so that going from one
+    block of states to the next only adds or subtracts one column of the
+    weights, instead of recomputing the whole product with the weights as
+    `compute_log_z` does. The blocks are divided among `num_threads`
+    threads, numpy releasing the GIL during the computations.
+
+    Parameters
+    ----------
+    rbm_params : list or pylearn2.models.rbm.RBM
+        The RBM, or its parameters [weights, visbias, hidbias].
+    max_bits : int, optional
+        The (base-2) log of the number of states to compute the free
+        energy for at a time.
+    num_threads : int, optional
+        Number of threads among which the blocks of states are divided.
+
+    Returns
+    -------
+    log_z : float
+        The log partition function.
+
+    Notes
+    -----
+    This function enumerates a sum with exponentially many terms, and
+    its cost doubles with every unit of the smaller layer.
+    """
+    if not isinstance(rbm_params, (list, tuple)):
+        rbm_params = get_rbm_params(rbm_params)
+    (weights, visbias, hidbias) = [numpy.asarray(q, dtype='float64')
+                                   for q in rbm_params]
+
+    # Pick whether to iterate over visible or hidden states. The other
+    # layer is summed out analytically.
+    if weights.shape[0] < weights.shape[1]:
+        columns, enum_bias, other_bias = weights.T, visbias, hidbias
+    else:
+        columns, enum_bias, other_bias = weights, hidbias, visbias
+    width = columns.shape[1]
+    # The last row accumulates the linear term of the enumerated layer.
+    columns = numpy.vstack((columns, enum_bias))
+    offset = numpy.hstack((other_bias, 0.))
+
+    low_bits = min(width, max_bits)
+    table = _gray_code_table(columns[:, :low_bits])
+    high_columns = columns[:, low_bits:]
+    num_blocks = 2 ** (width - low_bits)
+
+    def log_z_range(bounds):
+        start, stop = bounds
+        state = start ^ (start >> 1)
+        bits = [j for j in xrange(high_columns.shape[1]) if state >> j & 1]
+        pre_act = offset + high_columns[:, bits].sum(axis=1)
+        log_z = -numpy.inf
+        for i in xrange(start, stop):
+            if i > start:
+                # going from i - 1 to i flips the lowest set bit of i
+                j = _lowest_set_bit(i)
+                if (i ^ (i >> 1)) >> j & 1:
+                    pre_act += high_columns[:, j]
+                else:
+                    pre_act -= high_columns[:, j]
+            act = table + pre_act
+            neg_fe = (act[:, -1] +
+                      numpy.logaddexp(0, act[:, :-1]).sum(axis=1))
+            log_z = numpy.logaddexp(log_z, _log_sum_exp(neg_fe))
+        return log_z
+
+    num_threads = max(1, min(num_threads, num_blocks))
+    bounds = numpy.linspace(0, num_blocks, num_threads + 1).astype('int64')
+    ranges = [(int(bounds[i]), int(bounds[i + 1]))
+              for i in xrange(num_threads)]
+    if num_threads > 1:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(num_threads)
+        try:
+            log_zs = pool.map(log_z_range, ranges)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        log_zs = [log_z_range(ranges[0])]
+    return float(numpy.logaddexp.reduce(log_zs))
+
+
 def compute_nll(rbm, data, log_z, free_energy_fn, bufsize=1000, preproc=None):
     """
     .. todo::
@@ -112,6 +230,58 @@ def compute_nll(rbm, data, log_z, free_energy_fn, bufsize=1000, preproc=None):
     return nll
 
 
+def rbm_base_rate_visbias(visbias, visbias_a=None, data=None):
+    """
+    Returns the visible biases of the base-rate model (the RBM with zero
+    weights and hidden biases) used as the first distribution of AIS.
+
+    Parameters
+    ----------
+    visbias : numpy.ndarray
+        Visible biases of the model whose partition function is estimated.
+    visbias_a : numpy.ndarray, optional
+        See `rbm_ais`
+    data : numpy.ndarray, optional
+        See `rbm_ais`
+
+    Returns
+    -------
+    visbias_a : numpy.ndarray
+        The visible biases of the base-rate model.
+    """
+    if data is None:
+        if visbias_a is None:
+            # configure base-rate biases to those supplied by user
+            visbias_a = visbias
+    else:
+        # set biases of base-rate model to ML solution
+        data = numpy.asarray(data, dtype=config.floatX)
+        data = numpy.mean(data, axis=0)
+        data = numpy.minimum(data, 1 - 1e-5)
+        data = numpy.maximum(data, 1e-5)
+        visbias_a = -numpy.log(1. / data - 1)
+    return visbias_a
+
+
+def get_rbm_params(rbm):
+    """
+    Returns the parameters of a binary-binary RBM in the format expected
+    by `rbm_ais` and `rbm_scan_ais`.
+
+    Parameters
+    ----------
+    rbm : pylearn2.models.rbm.RBM
+        The model.
+
+    Returns
+    -------
+    rbm_params : list
+        [weights, visbias, hidbias], as `numpy.ndarrays`.
+    """
+    return [rbm.get_weights(), rbm.bias_vis.get_value(),
+            rbm.bias_hid.get_value()]
+
+
 def rbm_ais(rbm_params, n_runs, visbias_a=None, data=None,
             betas=None, key_betas=None, rng=None, seed=23098):
     """
@@ -161,19 +331,7 @@ def rbm_ais(rbm_params, n_runs, visbias_a=None, data=None,
 
     rng = make_np_rng(rng, seed, ['random_sample', 'rand'])
 
-    if data is None:
-        if visbias_a is None:
-            # configure base-rate biases to those supplied by user
-            visbias_a = visbias
-        else:
-            visbias_a = visbias_a
-    else:
-        # set biases of base-rate model to ML solution
-        data = numpy.asarray(data, dtype=config.floatX)
-        data = numpy.mean(data, axis=0)
-        data = numpy.minimum(data, 1 - 1e-5)
-        data = numpy.maximum(data, 1e-5)
-        visbias_a = -numpy.log(1. / data - 1)
+    visbias_a = rbm_base_rate_visbias(visbias, visbias_a, data)
     hidbias_a = numpy.zeros_like(hidbias)
     weights_a = numpy.zeros_like(weights)
     # generate exact sample for the base model
@@ -191,6 +349,71 @@ def rbm_ais(rbm_params, n_runs, visbias_a=None, data=None,
     return (ais.log_zb, var_dlogz), ais
 
 
+def rbm_scan_ais(rbm_params, n_runs, visbias_a=None, data=None,
+                 betas=None, key_betas=None, num_workers=1, seed=23098):
+    """
+    Estimates the log partition function of a binary-binary RBM with
+    `ScanAIS`, which runs all the intermediate distributions in a single
+    compiled function and can spread the runs over several processes.
+
+    Parameters
+    ----------
+    rbm_params : list or pylearn2.models.rbm.RBM
+        The RBM, or its parameters as for `rbm_ais`.
+    n_runs : int
+        Number of independent AIS runs.
+    visbias_a : numpy.ndarray, optional
+        See `rbm_ais`
+    data : numpy.ndarray, optional
+        See `rbm_ais`
+    betas : numpy.ndarray, optional
+        See `rbm_ais`
+    key_betas : numpy.ndarray, optional
+        See `rbm_ais`
+    num_workers : int, optional
+        Number of processes among which the runs are divided.
+    seed : int, optional
+        Seed of the random number generators.
+
+    Returns
+    -------
+    estimate : tuple
+        The estimated log partition function and the estimated variance
+        of the log ratio of partition functions.
+    ais : ScanAIS
+        The AIS object, from which e.g. the effective sample size can be
+        retrieved.
+    """
+    if not isinstance(rbm_params, (list, tuple)):
+        rbm_params = get_rbm_params(rbm_params)
+    rbm_params = [numpy.asarray(q, dtype=config.floatX) for q in rbm_params]
+    (weights, visbias, hidbias) = rbm_params
+
+    visbias_a = numpy.asarray(rbm_base_rate_visbias(visbias, visbias_a, data),
+                              dtype=config.floatX)
+    rbmA_params = [numpy.zeros_like(weights), visbias_a,
+                   numpy.zeros_like(hidbias)]
+
+    def free_energy(beta, state):
+        return rbm_ais_pk_free_energy(rbmA_params, rbm_params, beta, state[0])
+
+    def sample(beta, state, theano_rng):
+        return [rbm_ais_gibbs_for_v(rbmA_params, rbm_params, beta, state[0],
+                                    theano_rng=theano_rng)]
+
+    def sample_base(num, rng):
+        # exact sample of the base-rate model
+        pv = numpy.tile(1. / (1 + numpy.exp(-visbias_a)), (num, 1))
+        return [numpy.array(pv > rng.random_sample(pv.shape),
+                            dtype=config.floatX)]
+
+    log_za = (weights.shape[1] * numpy.log(2) +
+              numpy.sum(numpy.log(1 + numpy.exp(visbias_a))))
+    ais = ScanAIS(free_energy, sample, sample_base, log_za, betas=betas,
+                  key_betas=key_betas, seed=seed)
+    return ais.run(n_runs, num_workers=num_workers), ais
+
+
 def rbm_z_ratio(rbmA_params, rbmB_params, n_runs, v0=None,
                 betas=None, key_betas=None, rng=None, seed=23098):
     """
@@ -302,7 +525,8 @@ def rbm_ais_pk_free_energy(rbmA_params, rbmB_params, beta, v_sample):
     return fe_a + fe_b
 
 
-def rbm_ais_gibbs_for_v(rbmA_params, rbmB_params, beta, v_sample, seed=23098):
+def rbm_ais_gibbs_for_v(rbmA_params, rbmB_params, beta, v_sample, seed=23098,
+                        theano_rng=None):
     """
     .. todo::
 
@@ -326,12 +550,17 @@ def rbm_ais_gibbs_for_v(rbmA_params, rbmB_params, beta, v_sample, seed=23098):
 
     seed : int, optional
         Optional seed parameter for sampling from binomial units.
+
+    theano_rng : RandomStreams, optional
+        Random number generator to use instead of a new one seeded with
+        `seed`.
     """
 
     (weights_a, visbias_a, hidbias_a) = rbmA_params
     (weights_b, visbias_b, hidbias_b) = rbmB_params
 
-    theano_rng = make_theano_rng(seed, which_method='binomial')
+    if theano_rng is None:
+        theano_rng = make_theano_rng(seed, which_method='binomial')
 
     # equation 15 (Salakhutdinov & Murray 2008)
     ph_a = nnet.sigmoid((1 - beta) * (tensor.dot(v_sample, weights_a) +
@@ -546,3 +775,260 @@ class AIS(object):
                      numpy.sum(numpy.exp(log_ais_w - m)) ** 2 - 1.)
 
         return dlogz, var_dlogz
+
+
+def _log_sum_exp(x):
+    """
+    Numerically stable log(sum(exp(x))) of a numpy vector.
+    """
+    m = numpy.max(x)
+    return m + numpy.log(numpy.sum(numpy.exp(x - m)))
+
+
+def _reseed(theano_rng, rng):
+    """
+    Draws new states for the random streams of `theano_rng` that are
+    already used in a graph. Not every version of Theano has
+    `MRG_RandomStreams.seed`.
+
+    Parameters
+    ----------
+    theano_rng : MRG_RandomStreams
+    rng : numpy.random.RandomState
+        Generator of the new states.
+    """
+    for rstate, _ in theano_rng.state_updates:
+        value = rstate.get_value(borrow=True)
+        # Valid MRG31k3p states are positive and below both moduli
+        rstate.set_value(rng.randint(1, 2147462579, size=value.shape)
+                         .astype(value.dtype), borrow=True)
+
+
+class ScanAIS(object):
+    """
+    Annealed importance sampling in which the whole sequence of
+    intermediate distributions is compiled into a single Theano scan over
+    the inverse temperatures, instead of calling compiled functions from
+    Python at every temperature as `AIS` does.
+
+    The model is described by symbolic functions of the state of the
+    chains, so the same engine is used for RBMs (`rbm_scan_ais`) and DBMs
+    (`pylearn2.scripts.dbm.dbm_metrics`). Independent runs can be divided
+    among several processes; their log AIS weights are gathered before
+    being averaged, so the estimate does not depend on the number of
+    processes.
+
+    Parameters
+    ----------
+    free_energy : callable
+        `free_energy(beta, state)` returns the symbolic vector of free
+        energies of the chains in `state` (a list of symbolic tensors)
+        under the interpolating distribution at inverse temperature `beta`.
+    sample : callable
+        `sample(beta, state, theano_rng)` returns the list of new states
+        after a transition operator that leaves the interpolating
+        distribution at inverse temperature `beta` invariant. Random
+        numbers must be drawn from `theano_rng`.
+    sample_base : callable
+        `sample_base(n_runs, rng)` returns a list of `numpy.ndarrays`,
+        exact samples of the base-rate model (at inverse temperature 0),
+        drawn using the `numpy.random.RandomState` `rng`.
+    log_za : float
+        Log partition function of the base-rate model.
+    betas : numpy.ndarray, optional
+        Inverse temperatures of the intermediate distributions, in
+        increasing order. Defaults to `AIS.dflt_beta`.
+    key_betas : numpy.ndarray, optional
+        Inverse temperatures at which to also estimate the log partition
+        function, as for `AIS`.
+    seed : int, optional
+        Seed of the random number generators.
+    """
+
+    def __init__(self, free_energy, sample, sample_base, log_za, betas=None,
+                 key_betas=None, seed=23098):
+        self.free_energy = free_energy
+        self.sample = sample
+        self.sample_base = sample_base
+        self.log_za = log_za
+        self.rng = make_np_rng(seed, 23098, ['randint'])
+        self.theano_rng = make_theano_rng(seed, 23098,
+                                          which_method='binomial')
+        self._fn = None
+
+        if key_betas is not None:
+            key_betas = numpy.sort(numpy.asarray(key_betas,
+                                                 dtype=config.floatX))
+        self.key_betas = key_betas
+        if betas is None:
+            betas = AIS.dflt_beta
+        betas = numpy.asarray(betas, dtype=config.floatX)
+        # insert key temperatures within
+        if key_betas is not None:
+            betas = numpy.sort(numpy.hstack((betas, key_betas)))
+        self.betas = betas
+
+    def _compile(self, state0):
+        """
+        Compiles the function computing the log AIS weights of a set of
+        runs from their initial states.
+
+        Parameters
+        ----------
+        state0 : list of numpy.ndarrays
+            Example initial states, used for their number of dimensions.
+        """
+        betas = tensor.vector('ais_betas')
+        state0 = [tensor.TensorType(config.floatX, (False,) * x.ndim)(
+                  'ais_state0_%d' % i) for i, x in enumerate(state0)]
+
+        def step(bp, bp1, log_ais_w, *state):
+            state = list(state)
+            # log-ratio of (free) energies for two nearby temperatures
+            log_ais_w = log_ais_w + tensor.cast(
+                self.free_energy(bp, state) - self.free_energy(bp1, state),
+                config.floatX)
+            # generate a new sample at temperature beta_{i+1}
+            new_state = self.sample(bp1, state, self.theano_rng)
+            return [log_ais_w] + [tensor.cast(s, config.floatX)
+                                  for s in new_state]
+
+        log_ais_w0 = tensor.zeros((state0[0].shape[0],), dtype=config.floatX)
+        outputs, updates = theano.scan(step,
+                                       sequences=[betas[:-1], betas[1:]],
+                                       outputs_info=[log_ais_w0] + state0,
+                                       name='ais_scan')
+        if self.key_betas is None:
+            # Only the last weights are needed, which lets scan discard the
+            # intermediate ones.
+            log_ais_w = outputs[0][-1]
+        else:
+            # Row i of the output holds the weights at temperature
+            # betas[i + 1].
+            rows = [numpy.flatnonzero(self.betas[1:] == b)[0]
+                    for b in self.key_betas]
+            rows.append(len(self.betas) - 2)
+            log_ais_w = outputs[0][numpy.asarray(rows, dtype='int64')]
+        self._fn = theano.function([betas] + state0, log_ais_w,
+                                   updates=updates, name='ais_fn')
+
+    def run_shard(self, n_runs, seed):
+        """
+        Performs `n_runs` independent AIS runs in the current process.
+
+        Parameters
+        ----------
+        n_runs : int
+            Number of runs.
+        seed : int
+            Seed of the random number generators for these runs.
+
+        Returns
+        -------
+        log_ais_w : numpy.ndarray
+            The log AIS weights of the runs. If `key_betas` were given,
+            this is a matrix with one row per key temperature followed by
+            a row for the weights at inverse temperature 1.
+        """
+        rng = numpy.random.RandomState(seed)
+        state0 = self.sample_base(n_runs, rng)
+        if self._fn is None:
+            self._compile(state0)
+        _reseed(self.theano_rng, rng)
+        return self._fn(self.betas, *state0)
+
+    def run(self, n_runs, num_workers=1):
+        """
+        Performs the AIS runs and estimates the log partition function.
+
+        Parameters
+        ----------
+        n_runs : int
+            Number of independent AIS runs.
+        num_workers : int, optional
+            Number of processes among which the runs are divided. This
+            requires the 'fork' start method of multiprocessing.
+
+        Returns
+        -------
+        log_z : float
+            Estimated log partition function.
+        var_dlogz : float
+            Estimated variance of the log ratio of partition functions.
+        """
+        num_workers = max(1, min(num_workers, n_runs))
+        bounds = numpy.linspace(0, n_runs, num_workers + 1).astype('int64')
+        tasks = [(bounds[i + 1] - bounds[i], self.rng.randint(2 ** 30))
+                 for i in xrange(num_workers)]
+        if num_workers > 1 and self._fn is None:
+            # Compile before forking so that the workers share the function.
+            self._compile(self.sample_base(1, self.rng))
+        with ForkedPool(lambda task: self.run_shard(*task),
+                        num_workers) as pool:
+            shards = pool.map(tasks)
+        log_ais_w = numpy.concatenate(shards, axis=-1)
+
+        self.logz_beta = []
+        self.var_logz_beta = []
+        if self.key_betas is not None:
+            # same (decreasing) order as AIS.logz_beta
+            for key_log_ais_w in log_ais_w[-2::-1]:
+                dlogz, var_dlogz = self.estimate_from_weights(key_log_ais_w)
+                self.logz_beta.append(dlogz)
+                self.var_logz_beta.append(var_dlogz)
+            log_ais_w = log_ais_w[-1]
+        self.log_ais_w = log_ais_w
+
+        dlogz, var_dlogz = self.estimate_from_weights()
+        self.log_zb = self.log_za + dlogz
+        self.ess = self.effective_sample_size()
+        return self.log_zb, var_dlogz
+
+    def estimate_from_weights(self, log_ais_w=None):
+        """
+        Estimates the mean and variance of log(Zb/Za) from the log AIS
+        weights.
+
+        Parameters
+        ----------
+        log_ais_w : numpy.ndarray, optional
+            Log AIS weights. Defaults to those computed by `run`.
+
+        Returns
+        -------
+        dlogz : float
+            Estimated mean of log(Zb/Za), where Zb is the partition
+            function of the model and Za that of the base-rate model.
+        var_dlogz : float
+            Estimated variance of log(Zb/Za)
+        """
+        log_ais_w = self.log_ais_w if log_ais_w is None else log_ais_w
+        log_ais_w = numpy.asarray(log_ais_w, dtype='float64')
+        n = log_ais_w.shape[0]
+        # log-mean of the AIS weights
+        dlogz = _log_sum_exp(log_ais_w) - numpy.log(n)
+        # VAR(log(X)) \approx VAR(X) / E(X)^2 = E(X^2)/E(X)^2 - 1
+        var_dlogz = (n * numpy.exp(_log_sum_exp(2 * log_ais_w) -
+                                   2 * _log_sum_exp(log_ais_w)) - 1.)
+        return dlogz, var_dlogz
+
+    def effective_sample_size(self, log_ais_w=None):
+        """
+        Returns the effective sample size of the AIS weights,
+        :math:`(\\sum_i w_i)^2 / \\sum_i w_i^2`, which is close to the number
+        of runs only when the weights have a small variance.
+
+        Parameters
+        ----------
+        log_ais_w : numpy.ndarray, optional
+            Log AIS weights. Defaults to those computed by `run`.
+
+        Returns
+        -------
+        ess : float
+            The effective sample size.
+        """
+        log_ais_w = self.log_ais_w if log_ais_w is None else log_ais_w
+        log_ais_w = numpy.asarray(log_ais_w, dtype='float64')
+        return float(numpy.exp(2 * _log_sum_exp(log_ais_w) -
+                               _log_sum_exp(2 * log_ais_w)))
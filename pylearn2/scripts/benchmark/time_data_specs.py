@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+"""
+Benchmark of DataSpecsMapping on deeply nested data specs, such as those of
+recurrent models (a sequence and its mask at each level) combined with
+multi-source costs (the same source used by several costs), comparing the
+validating `flatten` with the unchecked `flatten_tuple` and `nest_tuple`.
+
+Basic usage:
+
+.. code-block:: none
+
+    time_data_specs.py [--depth 8] [--width 3] [--repeat 10000]
+"""
+from __future__ import print_function
+
+import argparse
+import time
+
+from pylearn2.space import CompositeSpace, VectorSpace
+from pylearn2.utils.data_specs import DataSpecsMapping
+
+
+def make_data_specs(depth, width):
+    """
+    Returns nested data specs, each level of which is made of `width`
+    (sequence, mask) pairs, a 'targets' source shared by all the levels,
+    and the next level.
+
+    Parameters
+    ----------
+    depth : int
+        Number of levels.
+    width : int
+        Number of (sequence, mask) pairs per level.
+
+    Returns
+    -------
+    data_specs : tuple
+        A (space, source) pair.
+    """
+    space = VectorSpace(dim=1)
+    source = 'targets'
+    for level in range(depth):
+        spaces = [space, VectorSpace(dim=1)]
+        sources = [source, 'targets']
+        for i in range(width):
+            name = 'features_%d_%d' % (level, i)
+            spaces.append(CompositeSpace([VectorSpace(dim=10),
+                                          VectorSpace(dim=10)]))
+            sources.append((name, name + '_mask'))
+        space = CompositeSpace(spaces)
+        source = tuple(sources)
+    return space, source
+
+
+def time_fn(fn, arg, repeat):
+    """
+    Returns the mean time taken by a call to fn(arg).
+
+    Parameters
+    ----------
+    fn : callable
+    arg : object
+    repeat : int
+        Number of calls.
+
+    Returns
+    -------
+    seconds : float
+    """
+    t0 = time.time()
+    for _ in range(repeat):
+        fn(arg)
+    return (time.time() - t0) / repeat
+
+
+def make_argument_parser():
+    """
+    Creates an ArgumentParser to read the options for this script from
+    sys.argv
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--depth', type=int, default=8)
+    parser.add_argument('--width', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=10000,
+                        help='Number of calls of each kind')
+    return parser
+
+
+def main(depth=8, width=3, repeat=10000):
+    """
+    Times flatten and nest on nested data specs.
+
+    Parameters
+    ----------
+    depth : int, optional
+        Number of levels of the data specs.
+    width : int, optional
+        Number of (sequence, mask) pairs per level.
+    repeat : int, optional
+        Number of calls of each kind.
+    """
+    data_specs = make_data_specs(depth, width)
+    t0 = time.time()
+    mapping = DataSpecsMapping(data_specs)
+    print('building the mapping: %.3f ms' % ((time.time() - t0) * 1000.))
+    flat = tuple(range(mapping.n_unique_specs))
+    nested = mapping.nest(flat)
+    print('%d unique specs' % mapping.n_unique_specs)
+    for name, fn, arg in [('nest', mapping.nest, flat),
+                          ('nest_tuple', mapping.nest_tuple, flat),
+                          ('flatten', mapping.flatten, nested),
+                          ('flatten_tuple', mapping.flatten_tuple, nested)]:
+        print('%-16s %9.3f us' % (name,
+                                  time_fn(fn, arg, repeat) * 1000000.))
+
+
+if __name__ == "__main__":
+    args = make_argument_parser().parse_args()
+    main(args.depth, args.width, args.repeat)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Benchmark of the formatting of numeric batches between spaces, comparing
+Space.np_format_as, which validates every batch, with the conversion plans
+returned by Space.np_format_plan, with and without reused output buffers.
+
+Basic usage:
+
+.. code-block:: none
+
+    time_space_conversion.py [--batch-size 128] [--repeat 200]
+
+The time reported for np_format_as includes making its result contiguous,
+as theano does when it is passed a transposed view.
+"""
+from __future__ import print_function
+
+import argparse
+import itertools
+import time
+
+import numpy as np
+
+from pylearn2.space import Conv2DSpace, VectorSpace
+
+
+AXES = [('b', 0, 1, 'c'), ('b', 'c', 0, 1), ('c', 0, 1, 'b')]
+
+
+def time_fn(fn, batch, repeat):
+    """
+    Returns the mean time taken by a call to fn(batch).
+
+    Parameters
+    ----------
+    fn : callable
+    batch : numpy.ndarray
+    repeat : int
+        Number of calls.
+
+    Returns
+    -------
+    seconds : float
+    """
+    fn(batch)
+    t0 = time.time()
+    for _ in range(repeat):
+        fn(batch)
+    return (time.time() - t0) / repeat
+
+
+def make_argument_parser():
+    """
+    Creates an ArgumentParser to read the options for this script from
+    sys.argv
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--batch-size', type=int, default=128)
+    parser.add_argument('--shape', type=int, nargs=2, default=[32, 32],
+                        help='Rows and columns of the images')
+    parser.add_argument('--channels', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=200,
+                        help='Number of conversions of each kind')
+    return parser
+
+
+def main(batch_size=128, shape=(32, 32), channels=3, repeat=200):
+    """
+    Times the conversions between a VectorSpace and Conv2DSpaces with
+    several axes, in all directions.
+
+    Parameters
+    ----------
+    batch_size : int, optional
+        Number of examples per batch.
+    shape : tuple, optional
+        Rows and columns of the images.
+    channels : int, optional
+        Number of channels of the images.
+    repeat : int, optional
+        Number of conversions of each kind.
+    """
+    spaces = [VectorSpace(dim=shape[0] * shape[1] * channels)]
+    spaces += [Conv2DSpace(shape=shape, num_channels=channels, axes=axes)
+               for axes in AXES]
+    names = ['vector'] + [''.join(str(axis) for axis in axes)
+                          for axes in AXES]
+    rng = np.random.RandomState([2015, 5, 2])
+    print('%-16s %12s %12s %12s' % ('conversion', 'format_as', 'plan',
+                                    'plan+buffer'))
+    for (source, source_name), (target, target_name) in \
+            itertools.product(zip(spaces, names), zip(spaces, names)):
+        if source == target:
+            continue
+        batch = source.get_origin_batch(batch_size)
+        batch[...] = rng.uniform(size=batch.shape)
+        fns = [lambda b: np.ascontiguousarray(source.np_format_as(b,
+                                                                  target)),
+               source.np_format_plan(target),
+               source.np_format_plan(target, reuse_buffer=True)]
+        times = [time_fn(fn, batch, repeat) * 1000. for fn in fns]
+        print('%-16s %9.3f ms %9.3f ms %9.3f ms' %
+              ((source_name + '->' + target_name,) + tuple(times)))
+
+
+if __name__ == "__main__":
+    args = make_argument_parser().parse_args()
+    main(args.batch_size, tuple(args.shape), args.channels, args.repeat)
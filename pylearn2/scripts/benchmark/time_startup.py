@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Benchmark of the startup time of pylearn2: the time taken by a fresh
+python interpreter to import the main modules, and optionally to unpickle
+a model, as done by the inspection scripts (print_monitor.py,
+summarize_model.py, ...).
+
+Basic usage:
+
+.. code-block:: none
+
+    time_startup.py [--pkl model.pkl] [--repeat 5] [--max-seconds 10]
+
+With --max-seconds, the script exits with a nonzero status if any of the
+steps takes longer than the given time, so that it can guard against
+startup time regressions.
+"""
+from __future__ import print_function
+
+import argparse
+import subprocess
+import sys
+import time
+
+
+STATEMENTS = [('import pylearn2', 'import pylearn2'),
+              ('import pylearn2.space', 'import pylearn2.space'),
+              ('import pylearn2.config.yaml_parse',
+               'import pylearn2.config.yaml_parse'),
+              ('import pylearn2.models.mlp', 'import pylearn2.models.mlp')]
+
+
+def time_statement(statement, repeat):
+    """
+    Returns the best time taken by a fresh interpreter to run a statement.
+
+    Parameters
+    ----------
+    statement : str
+        Python code to run.
+    repeat : int
+        Number of runs.
+
+    Returns
+    -------
+    seconds : float
+        The shortest wall clock time of the runs, which includes the
+        startup of the interpreter.
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.time()
+        subprocess.check_call([sys.executable, '-c', statement])
+        best = min(best, time.time() - t0)
+    return best
+
+
+def make_argument_parser():
+    """
+    Creates an ArgumentParser to read the options for this script from
+    sys.argv
+    """
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--pkl', help='Also time the loading of this model')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs of each step')
+    parser.add_argument('--max-seconds', type=float,
+                        help='Fail if a step takes longer than this')
+    return parser
+
+
+def main(pkl=None, repeat=3, max_seconds=None):
+    """
+    Times the import of the main modules, and the loading of a model.
+
+    Parameters
+    ----------
+    pkl : str, optional
+        Path of a pickled model to load.
+    repeat : int, optional
+        Number of runs of each step.
+    max_seconds : float, optional
+        Maximum time allowed for each step.
+
+    Returns
+    -------
+    ok : bool
+        False if a step took longer than `max_seconds`.
+    """
+    statements = list(STATEMENTS)
+    if pkl is not None:
+        statements.append(('load %s' % pkl,
+                           'from pylearn2.utils import serial; '
+                           'serial.load(%r)' % pkl))
+    baseline = time_statement('pass', repeat)
+    print('interpreter startup: %.2f s' % baseline)
+    ok = True
+    for name, statement in statements:
+        seconds = time_statement(statement, repeat)
+        print('%s: %.2f s' % (name, seconds))
+        if max_seconds is not None and seconds > max_seconds:
+            print('  slower than %.2f s' % max_seconds)
+            ok = False
+    return ok
+
+
+if __name__ == "__main__":
+    args = make_argument_parser().parse_args()
+    if not main(args.pkl, args.repeat, args.max_seconds):
+        sys.exit(1)
@@ -19,7 +19,7 @@ function.
 TODO: add more details, cite paper
 
 
-usage: dbm_metrics.py [-h] {ais} model_path
+usage: dbm_metrics.py [-h] [--num-workers NUM_WORKERS] {ais} model_path
 
 positional arguments:
     {ais}       the desired metric
@@ -27,6 +27,8 @@ positional arguments:
 
 optional arguments:
     -h, --help  show the help message and exit
+    --num-workers NUM_WORKERS
+                number of processes running AIS
 """
 
 import argparse
@@ -43,6 +45,7 @@ from theano.sandbox.scan import scan
 import pylearn2
 from pylearn2.compat import OrderedDict
 from pylearn2.datasets.mnist import MNIST
+from pylearn2.rbm_tools import ScanAIS
 from pylearn2.utils import serial
 from pylearn2 import utils
 
@@ -52,7 +55,8 @@ rng = numpy.random.RandomState(9873242)
 theano_rng = RandomStreams(rng.randint(2**30))
 
 
-def _sample_even_odd(W_list, b_list, samples, beta, odd=True):
+def _sample_even_odd(W_list, b_list, samples, beta, odd=True,
+                     theano_rng=theano_rng):
     """
     Sample from the even (or odd) layers given a list of previous states.
 
@@ -70,9 +74,12 @@ def _sample_even_odd(W_list, b_list, samples, beta, odd=True):
     odd : boolean
         Whether to sample from the odd or the even layers (defaults to sampling
         from odd layers)
+    theano_rng : theano RandomStreams, optional
+        Random number generator. Defaults to the one of the module.
     """
     for i in xrange(odd, len(samples), 2):
-        samples[i] = sample_hi_given(samples, i, W_list, b_list, beta)
+        samples[i] = sample_hi_given(samples, i, W_list, b_list, beta,
+                                     theano_rng=theano_rng)
 
 
 def _activation_even_odd(W_list, b_list, samples, beta, odd=True):
@@ -134,7 +141,8 @@ def neg_sampling(W_list, b_list, nsamples, beta=1.0, pa_bias=None,
     new_nsamples = [nsamples[i] for i in xrange(depth)]
 
     # Contribution from model B, at temperature beta_k
-    _sample_even_odd(W_list, b_list, new_nsamples, beta, odd=marginalize_odd)
+    _sample_even_odd(W_list, b_list, new_nsamples, beta, odd=marginalize_odd,
+                     theano_rng=theano_rng)
     _activation_even_odd(W_list, b_list, new_nsamples, beta,
                          odd=not marginalize_odd)
 
@@ -145,7 +153,7 @@ def neg_sampling(W_list, b_list, nsamples, beta=1.0, pa_bias=None,
     for i in xrange(not marginalize_odd, depth, 2):
         new_nsamples[i] = T.nnet.sigmoid(new_nsamples[i])
         new_nsamples[i] = theano_rng.binomial(
-            size=nsamples[i].get_value().shape, n=1, p=new_nsamples[i],
+            size=nsamples[i].shape, n=1, p=new_nsamples[i],
             dtype=floatX
         )
 
@@ -274,6 +282,42 @@ def estimate_from_weights(log_ais_w):
     return dlogz, var_dlogz
 
 
+def sample_base_model(b_list, pa_bias, n_runs, rng, marginalize_odd=True):
+    """
+    Generate exact samples for the base model p_A, in which the layer whose
+    biases are 'pa_bias' is independent from the other layers, which are
+    uniformly distributed (see compute_log_za).
+
+    Parameters
+    ----------
+    b_list : array-like object of theano shared variables
+        Biases of the DBM
+    pa_bias : array-like object of theano shared variables
+        Biases for the A model
+    n_runs : integer
+        Number of samples
+    rng : numpy.random.RandomState
+        Random number generator
+    marginalize_odd : boolean
+        Whether to marginalize odd layers
+
+    Returns
+    -------
+    samples : list of numpy.ndarray
+        samples[i] contains the samples of the i-th layer
+    """
+    samples = []
+    for i, b in enumerate(b_list):
+        if i == (not marginalize_odd):
+            hi_mean_vec = 1. / (1. + numpy.exp(-pa_bias))
+        else:
+            hi_mean_vec = 0.5 * numpy.ones(b.get_value().shape[0])
+        hi_mean = numpy.tile(hi_mean_vec, (n_runs, 1))
+        r = rng.random_sample(hi_mean.shape)
+        samples.append(numpy.array(hi_mean > r, dtype=floatX))
+    return samples
+
+
 def compute_log_za(b_list, pa_bias, marginalize_odd=True):
     """
     Compute the exact partition function of model p_A(h1)
@@ -429,7 +473,8 @@ def hi_given(samples, i, W_list, b_list, beta=1.0, apply_sigmoid=True):
         return hi_mean
 
 
-def sample_hi_given(samples, i, W_list, b_list, beta=1.0):
+def sample_hi_given(samples, i, W_list, b_list, beta=1.0,
+                    theano_rng=theano_rng):
     """
     Given current state of our DBM ('samples'), sample the values taken by
     the i-th layer.
@@ -450,6 +495,8 @@ def sample_hi_given(samples, i, W_list, b_list, beta=1.0):
         Biases of the DBM
     beta : scalar
         Inverse temperature parameter used when performing AIS
+    theano_rng : theano RandomStreams, optional
+        Random number generator. Defaults to the one of the module.
 
     Returns
     -------
@@ -459,7 +506,7 @@ def sample_hi_given(samples, i, W_list, b_list, beta=1.0):
     hi_mean = hi_given(samples, i, W_list, b_list, beta)
 
     hi_sample = theano_rng.binomial(
-        size=samples[i].get_value().shape,
+        size=samples[i].shape,
         n=1, p=hi_mean,
         dtype=floatX
     )
@@ -511,7 +558,7 @@ def _e_step(psamples, W_list, b_list, n_steps=100, eps=1e-5):
 
 def estimate_likelihood(W_list, b_list, trainset, testset, free_energy_fn=None,
                         batch_size=100, large_ais=False, log_z=None,
-                        pos_mf_steps=50, pos_sample_steps=0):
+                        pos_mf_steps=50, pos_sample_steps=0, num_workers=1):
     """
     Compute estimate of log-partition function and likelihood of trainset and
     testset
@@ -538,6 +585,8 @@ def estimate_likelihood(W_list, b_list, trainset, testset, free_energy_fn=None,
     pos_sample_steps: same thing as pos_mf_steps
         when both pos_mf_steps > 0 and pos_sample_steps > 0,
         pos_mf_steps has a priority
+    num_workers : integer
+        Number of processes among which the AIS runs are divided
 
     Returns
     -------
@@ -606,34 +655,19 @@ def estimate_likelihood(W_list, b_list, trainset, testset, free_energy_fn=None,
     mean_pos = numpy.maximum(mean_pos, 1e-5)
     pa_bias = -numpy.log(1./mean_pos[0] - 1.)
 
-    # Build Theano function to sample from interpolating distributions.
-    updates = OrderedDict()
-    new_nsamples = neg_sampling(W_list, b_list, nsamples, beta=beta,
-                                pa_bias=pa_bias,
-                                marginalize_odd=marginalize_odd,
-                                theano_rng=theano_rng)
-    for (nsample, new_nsample) in zip(nsamples, new_nsamples):
-        updates[nsample] = new_nsample
-    sample_fn = theano.function([beta], [], updates=updates,
-                                name='sample_func')
-
-    # Build function to compute free-energy of p_k(h1).
-    fe_bp_h1 = free_energy_at_beta(W_list, b_list, nsamples, beta,
-                                   pa_bias, marginalize_odd=marginalize_odd)
-    free_energy_fn = theano.function([beta], fe_bp_h1)
+    # Interpolating distributions, as functions of the state of the chains.
+    def ais_free_energy(beta, state):
+        return free_energy_at_beta(W_list, b_list, state, beta, pa_bias,
+                                   marginalize_odd=marginalize_odd)
 
-    ###########
-    ## RUN AIS
-    ###########
+    def ais_sample(beta, state, theano_rng):
+        return neg_sampling(W_list, b_list, state, beta=beta,
+                            pa_bias=pa_bias, marginalize_odd=marginalize_odd,
+                            theano_rng=theano_rng)
 
-    # Generate exact sample for the base model.
-    for i, nsample_i in enumerate(nsamples):
-        bias = pa_bias if i == 1 else b_list[i].get_value()
-        hi_mean_vec = 1. / (1. + numpy.exp(-bias))
-        hi_mean = numpy.tile(hi_mean_vec, (batch_size, 1))
-        r = rng.random_sample(hi_mean.shape)
-        hi_sample = numpy.array(hi_mean > r, dtype=floatX)
-        nsample_i.set_value(hi_sample)
+    def ais_sample_base(n_runs, rng):
+        return sample_base_model(b_list, pa_bias, n_runs, rng,
+                                 marginalize_odd=marginalize_odd)
 
     # Default configuration for interpolating distributions
     if large_ais:
@@ -647,16 +681,20 @@ def estimate_likelihood(W_list, b_list, trainset, testset, free_energy_fn=None,
                          numpy.linspace(0.5, 0.9, 1e4+1)[:-1],
                          numpy.linspace(0.9, 1.0, 1e4))))
 
+    ###########
+    ## RUN AIS
+    ###########
+
     if log_z is None:
-        log_ais_w = compute_log_ais_weights(batch_size, free_energy_fn,
-                                            sample_fn, betas)
-        dlogz, var_dlogz = estimate_from_weights(log_ais_w)
         log_za = compute_log_za(b_list, pa_bias, marginalize_odd)
-        log_z = log_za + dlogz
+        ais = ScanAIS(ais_free_energy, ais_sample, ais_sample_base, log_za,
+                      betas=betas, seed=rng.randint(2**30))
+        log_z, var_dlogz = ais.run(batch_size, num_workers=num_workers)
         logging.info('log_z = %f' % log_z)
         logging.info('log_za = %f' % log_za)
-        logging.info('dlogz = %f' % dlogz)
+        logging.info('dlogz = %f' % (log_z - log_za))
         logging.info('var_dlogz = %f' % var_dlogz)
+        logging.info('effective sample size = %f' % ais.ess)
 
     train_ll = compute_likelihood_given_logz(nsamples, psamples, batch_size,
                                              energy_fn, inference_fn, log_z,
@@ -682,6 +720,8 @@ if __name__ == '__main__':
     parser.add_argument("dataset", help="the dataset used for computing the " +
                         "metric", choices=datasets.keys())
     parser.add_argument("model_path", help="path to the pickled DBM model")
+    parser.add_argument("--num-workers", type=int, default=1,
+                        help="number of processes running AIS")
     args = parser.parse_args()
 
     metric = metrics[args.metric]
@@ -696,4 +736,5 @@ if __name__ == '__main__':
     trainset = dataset(which_set='train')
     testset = dataset(which_set='test')
 
-    metric(W_list, b_list, trainset, testset, pos_mf_steps=5)
+    metric(W_list, b_list, trainset, testset, pos_mf_steps=5,
+           num_workers=args.num_workers)
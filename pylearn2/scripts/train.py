@@ -69,6 +69,7 @@ import numpy as np
 
 # Local imports
 from pylearn2.utils import serial
+from pylearn2.utils.function_cache import set_cache_directory
 from pylearn2.utils.logger import (
     CustomStreamHandler, CustomFormatter, restore_defaults
 )
@@ -159,6 +160,13 @@ def make_argument_parser():
                         action='store_true',
                         help='Display any DEBUG-level log messages, '
                              'suppressed by default.')
+    parser.add_argument('--function-cache', '-C',
+                        help='Directory in which to cache the optimized '
+                             'theano functions, to skip graph optimization '
+                             'in later runs of identical jobs.')
+    parser.add_argument('--threads', '-j', type=int, default=1,
+                        help='Number of threads constructing the '
+                             'independent datasets concurrently.')
     parser.add_argument('config', action='store',
                         choices=None,
                         help='A YAML configuration file specifying the '
@@ -167,7 +175,8 @@ def make_argument_parser():
 
 
 def train(config, level_name=None, timestamp=None, time_budget=None,
-          verbose_logging=None, debug=None):
+          verbose_logging=None, debug=None, function_cache=None,
+          threads=1):
     """
     Trains a given YAML file.
 
@@ -193,8 +202,18 @@ def train(config, level_name=None, timestamp=None, time_budget=None,
     debug : bool, optional
         Display any DEBUG-level log messages,
         False by default.
+    function_cache : str, optional
+        Directory in which to cache the optimized
+        theano functions. See
+        `pylearn2.utils.function_cache`.
+    threads : int, optional
+        Number of threads constructing the independent
+        objects of the YAML file, such as the datasets,
+        concurrently.
     """
-    train_obj = serial.load_train_file(config)
+    if function_cache is not None:
+        set_cache_directory(function_cache)
+    train_obj = serial.load_train_file(config, num_threads=threads)
     try:
         iter(train_obj)
         iterable = True
@@ -249,4 +268,5 @@ if __name__ == "__main__":
     parser = make_argument_parser()
     args = parser.parse_args()
     train(args.config, args.level_name, args.timestamp, args.time_budget,
-          args.verbose_logging, args.debug)
+          args.verbose_logging, args.debug, args.function_cache,
+          args.threads)
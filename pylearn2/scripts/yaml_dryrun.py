@@ -36,6 +36,13 @@ def main(args=None):
                              'checking a file that requires a GPU in an '
                              'environment that lacks one (e.g. a cluster '
                              'head node)')
+    parser.add_argument('-j', '--threads', type=int, default=1,
+                        help='Number of threads constructing the '
+                             'independent datasets concurrently.')
+    parser.add_argument('-T', '--timing',
+                        action='store_const', default=False, const=True,
+                        help='Report the time taken to construct each '
+                             'object, slowest first.')
     args = parser.parse_args(args=args)
     name = args.yaml_file.name
     initialize()
@@ -43,8 +50,12 @@ def main(args=None):
         yaml_load(args.yaml_file)
         print("Successfully parsed %s (but objects not instantiated)." % name)
     else:
-        load(args.yaml_file)
+        timings = [] if args.timing else None
+        load(args.yaml_file, num_threads=args.threads, timings=timings)
         print("Successfully parsed and loaded %s." % name)
+        if timings is not None:
+            for callable_name, seconds in sorted(timings, key=lambda t: -t[1]):
+                print("%10.3f s  %s" % (seconds, callable_name))
 
 
 if __name__ == "__main__":
@@ -33,6 +33,7 @@ __maintainer__ = "LISA Lab"
 __email__ = "pylearn-dev@googlegroups"
 
 import functools
+import sys
 import warnings
 import numpy as np
 from theano.compat.six.moves import xrange
@@ -41,7 +42,6 @@ import theano.sparse
 from theano import tensor
 from theano.tensor import TensorType
 from theano.gof.op import get_debug_values
-from theano.sandbox.cuda.type import CudaNdarrayType
 from pylearn2.utils import py_integer_types, safe_zip, sharedX, wraps
 from pylearn2.format.target_format import OneHotFormatter
 
@@ -50,6 +50,27 @@ if theano.sparse.enable_sparse:
     import scipy.sparse
 
 
+def _cuda_ndarray_types():
+    """
+    Returns a tuple containing CudaNdarrayType if theano.sandbox.cuda has
+    been imported, and an empty tuple otherwise.
+
+    Importing theano.sandbox.cuda is slow, and no CUDA variable can exist
+    before it has been imported, so it is only looked up in `sys.modules`.
+    """
+    cuda_type = sys.modules.get('theano.sandbox.cuda.type')
+    if cuda_type is None:
+        return ()
+    return (cuda_type.CudaNdarrayType,)
+
+
+def _dense_batch_types():
+    """
+    Returns the theano types of symbolic dense batches.
+    """
+    return (theano.tensor.TensorType,) + _cuda_ndarray_types()
+
+
 def _is_batch_all(batch, predicate):
     """
     Implementation of is_symbolic_batch() and is_numeric_batch().
@@ -206,7 +227,7 @@ def _cast(arg, dtype):
         else:
             return arg
     elif (isinstance(arg, theano.gof.Variable) and
-          isinstance(arg.type, CudaNdarrayType)):  # symbolic CUDA array
+          isinstance(arg.type, _cuda_ndarray_types())):  # symbolic CUDA
         if str(dtype) != 'float32':
             raise TypeError("Can only cast a theano CudaNdArrayType to "
                             "float32, not %s" % dtype)
@@ -218,7 +239,8 @@ def _cast(arg, dtype):
         return theano.tensor.cast(arg, dtype)
     elif isinstance(arg, theano.sparse.SparseVariable):
         return theano.sparse.cast(arg, dtype)
-    elif isinstance(arg, theano.sandbox.cuda.var.CudaNdarrayVariable):
+    elif (isinstance(arg, theano.gof.Variable) and
+          isinstance(arg.type, _cuda_ndarray_types())):
         return arg
     else:
         raise TypeError("Unsupported arg type '%s'" % str(type(arg)))
@@ -457,6 +479,45 @@ class Space(object):
                                batch=batch,
                                space=space)
 
+    def np_format_plan(self, space, reuse_buffer=False):
+        """
+        Returns a callable formatting numeric batches of this space into
+        `space`, like `np_format_as`, for when many batches have to be
+        formatted the same way (e.g. by a dataset iterator).
+
+        The first batch is validated and the sizes of the spaces are
+        checked, as `np_format_as` does, but not the following ones.
+        Dense conversions between VectorSpace and Conv2DSpace write their
+        result into a C-contiguous array in a single copy, rather than
+        returning a transposed view.
+
+        Parameters
+        ----------
+        space : Space
+            Target space to format batches to.
+        reuse_buffer : bool, optional
+            If True, the result is written into the same array at every
+            call with the same batch size, which the caller must not keep
+            across calls. Such plans are not shared.
+
+        Returns
+        -------
+        plan : FormatPlan
+            A callable taking a batch of this space and returning the
+            formatted batch.
+        """
+        if reuse_buffer:
+            return FormatPlan(self, space, reuse_buffer=True)
+        key = (self, space)
+        try:
+            hash(key)
+        except TypeError:
+            # Some spaces do not implement __hash__
+            return FormatPlan(self, space)
+        if key not in _format_plans:
+            _format_plans[key] = FormatPlan(self, space)
+        return _format_plans[key]
+
     def _check_sizes(self, space):
         """
         Called by self._format_as(space), to check whether self and space
@@ -1007,8 +1068,7 @@ class IndexSpace(SimplyTypedSpace):
             if not isinstance(batch, theano.gof.Variable):
                 raise TypeError("IndexSpace batch should be a theano "
                                 "Variable, got " + str(type(batch)))
-            if not isinstance(batch.type, (theano.tensor.TensorType,
-                                           CudaNdarrayType)):
+            if not isinstance(batch.type, _dense_batch_types()):
                 raise TypeError("IndexSpace batch should be TensorType or "
                                 "CudaNdarrayType, got " + str(batch.type))
             if batch.ndim != 2:
@@ -1238,8 +1298,7 @@ class VectorSpace(SimplyTypedSpace):
                                     'provided batch is not. (batch type: "%s")'
                                     % ('' if self.sparse else ' not',
                                        type(batch)))
-            elif not isinstance(batch.type, (theano.tensor.TensorType,
-                                             CudaNdarrayType)):
+            elif not isinstance(batch.type, _dense_batch_types()):
                 raise TypeError("VectorSpace batch should be TensorType or "
                                 "CudaNdarrayType, got " + str(batch.type))
 
@@ -1370,8 +1429,7 @@ class VectorSequenceSpace(SimplyTypedSpace):
             if not isinstance(batch, theano.gof.Variable):
                 raise TypeError("VectorSequenceSpace batch should be a theano "
                                 "Variable, got " + str(type(batch)))
-            if not isinstance(batch.type, (theano.tensor.TensorType,
-                                           CudaNdarrayType)):
+            if not isinstance(batch.type, _dense_batch_types()):
                 raise TypeError("VectorSequenceSpace batch should be "
                                 "TensorType or CudaNdarrayType, got " +
                                 str(batch.type))
@@ -1518,8 +1576,7 @@ class IndexSequenceSpace(SimplyTypedSpace):
             if not isinstance(batch, theano.gof.Variable):
                 raise TypeError("IndexSequenceSpace batch should be a theano "
                                 "Variable, got " + str(type(batch)))
-            if not isinstance(batch.type, (theano.tensor.TensorType,
-                                           CudaNdarrayType)):
+            if not isinstance(batch.type, _dense_batch_types()):
                 raise TypeError("IndexSequenceSpace batch should be "
                                 "TensorType or CudaNdarrayType, got " +
                                 str(batch.type))
@@ -1763,8 +1820,7 @@ class Conv2DSpace(SimplyTypedSpace):
                 raise TypeError("Conv2DSpace batches must be theano "
                                 "Variables, got " + str(type(batch)))
 
-            if not isinstance(batch.type, (theano.tensor.TensorType,
-                                           CudaNdarrayType)):
+            if not isinstance(batch.type, _dense_batch_types()):
                 raise TypeError('Expected TensorType or CudaNdArrayType, got '
                                 '"%s"' % type(batch.type))
 
@@ -2322,3 +2378,166 @@ class NullSpace(Space):
         # have been in the batch, since it is empty. We return 0.
         self._validate(is_numeric, batch)
         return 0
+
+
+# Plans returned by Space.np_format_plan, by (source space, target space).
+# Spaces compare equal when their dtypes are, so this is also by dtype.
+_format_plans = {}
+
+
+class FormatPlan(object):
+    """
+    Formats numeric batches from one space to another, as
+    `Space.np_format_as` does, without validating every batch. Use
+    `Space.np_format_plan` to get one.
+
+    Parameters
+    ----------
+    source : Space
+        The space of the batches.
+    target : Space
+        The space to format them to.
+    reuse_buffer : bool, optional
+        See `Space.np_format_plan`.
+    """
+
+    def __init__(self, source, target, reuse_buffer=False):
+        self.source = source
+        self.target = target
+        self.reuse_buffer = reuse_buffer
+        self._buffer = None
+        self._validated = False
+
+        # Dense conversions are done as: reshape the batch to
+        # (batch size,) + in_shape, transpose its axes by perm, and
+        # reshape the result to (batch size,) + out_shape. None means
+        # no reshape or no transposition.
+        self.dense = False
+        self.batch_axis = 0
+        self.in_shape = None
+        self.perm = None
+        self.out_shape = None
+        if isinstance(source, VectorSpace) and source.sparse:
+            return
+        if isinstance(target, VectorSpace) and target.sparse:
+            return
+        if isinstance(source, Conv2DSpace):
+            self.batch_axis = source.axes.index('b')
+        if (isinstance(source, VectorSpace) and
+                isinstance(target, VectorSpace)):
+            self.dense = True
+        elif (isinstance(source, VectorSpace) and
+                isinstance(target, Conv2DSpace)):
+            self.dense = True
+            self.in_shape = self._topo_shape(target, target.default_axes)
+            self.perm = self._permutation(target.default_axes, target.axes)
+        elif (isinstance(source, Conv2DSpace) and
+                isinstance(target, VectorSpace)):
+            self.dense = True
+            self.perm = self._permutation(source.axes, source.default_axes)
+            self.out_shape = (target.dim,)
+        elif (isinstance(source, Conv2DSpace) and
+                isinstance(target, Conv2DSpace)):
+            self.dense = True
+            self.perm = self._permutation(source.axes, target.axes)
+
+    @staticmethod
+    def _topo_shape(space, axes):
+        """
+        Returns the shape of an example of a Conv2DSpace with given axes.
+
+        Parameters
+        ----------
+        space : Conv2DSpace
+        axes : tuple
+            Axes, including 'b', which is left out of the shape.
+
+        Returns
+        -------
+        shape : tuple
+        """
+        dims = {0: space.shape[0],
+                1: space.shape[1],
+                'c': space.num_channels}
+        return tuple(dims[axis] for axis in axes if axis != 'b')
+
+    @staticmethod
+    def _permutation(src_axes, dst_axes):
+        """
+        Returns the transposition from one order of axes to another.
+
+        Parameters
+        ----------
+        src_axes, dst_axes : tuple
+
+        Returns
+        -------
+        perm : tuple or None
+            None if the orders are the same.
+        """
+        if tuple(src_axes) == tuple(dst_axes):
+            return None
+        return tuple(src_axes.index(axis) for axis in dst_axes)
+
+    def _output(self, shape, dtype):
+        """
+        Returns an array to write the result into.
+
+        Parameters
+        ----------
+        shape : tuple
+        dtype : str
+
+        Returns
+        -------
+        out : numpy.ndarray
+            An uninitialized C-contiguous array, which is the one of the
+            previous call if buffers are reused and the shape and dtype are
+            the same.
+        """
+        if not self.reuse_buffer:
+            return np.empty(shape, dtype=dtype)
+        if (self._buffer is None or self._buffer.shape != shape or
+                self._buffer.dtype != dtype):
+            self._buffer = np.empty(shape, dtype=dtype)
+        return self._buffer
+
+    def __call__(self, batch):
+        """
+        Formats a batch.
+
+        Parameters
+        ----------
+        batch : numpy.ndarray, scipy.sparse matrix or tuple
+            A numeric batch of the source space.
+
+        Returns
+        -------
+        batch : numpy.ndarray, scipy.sparse matrix or tuple
+            The batch, formatted to lie in the target space.
+        """
+        if not self._validated:
+            self.source.np_validate(batch)
+            self.source._check_sizes(self.target)
+            self._validated = True
+        if not self.dense or not isinstance(batch, np.ndarray):
+            return self.source._format_as_impl(True, batch, self.target)
+
+        dtype = self.target.dtype
+        if dtype is None:
+            dtype = batch.dtype
+        batch_size = batch.shape[self.batch_axis]
+        if self.in_shape is not None:
+            batch = batch.reshape((batch_size,) + self.in_shape)
+        if self.perm is not None:
+            batch = batch.transpose(self.perm)
+        if self.perm is None and batch.flags.c_contiguous:
+            result = _cast(batch, dtype)
+        else:
+            # Also copies views of part of a batch along another axis than
+            # the first one
+            result = self._output(batch.shape, dtype)
+            result[...] = batch
+        if self.out_shape is not None:
+            result = result.reshape((batch_size,) + self.out_shape)
+        return result
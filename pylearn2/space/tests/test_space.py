@@ -108,6 +108,49 @@ def test_np_format_as_conv2d2vector():
     assert np.all(rval == nval)
 
 
+def test_np_format_plan():
+    """
+    Tests that conversion plans format batches like np_format_as, into
+    C-contiguous arrays for dense conversions.
+    """
+    axes = [('b', 0, 1, 'c'), ('b', 'c', 0, 1), ('c', 0, 1, 'b'),
+            ('c', 'b', 1, 0)]
+    spaces = [VectorSpace(dim=4 * 5 * 3), VectorSpace(dim=4 * 5 * 3,
+                                                      dtype='float64')]
+    spaces += [Conv2DSpace(shape=(4, 5), num_channels=3, axes=a)
+               for a in axes]
+    rng = np.random.RandomState([2015, 5, 2])
+    for source, target in itertools.product(spaces, spaces):
+        data = source.get_origin_batch(6)
+        data[...] = rng.randn(*data.shape)
+        plan = source.np_format_plan(target)
+        assert source.np_format_plan(target) is plan
+        # A view of the first two examples
+        index = [slice(None)] * data.ndim
+        index[source.get_batch_axis()] = slice(0, 2)
+        for batch in [data, data[tuple(index)]]:
+            expected = source.np_format_as(batch, target)
+            rval = plan(batch)
+            assert rval.dtype == expected.dtype
+            assert np.all(rval == expected)
+            assert rval.flags.c_contiguous
+
+    source, target = spaces[2], spaces[3]
+    plan = source.np_format_plan(target, reuse_buffer=True)
+    assert plan is not source.np_format_plan(target)
+    data = source.get_origin_batch(6)
+    first = plan(data)
+    assert plan(data + 1) is first
+    assert np.all(first == 1)
+
+    # Other spaces are formatted by np_format_as
+    index_space = IndexSpace(max_labels=10, dim=1)
+    data = np.array([[0], [2], [1]])
+    rval = index_space.np_format_plan(VectorSpace(dim=10))(data)
+    assert np.all(rval == index_space.np_format_as(data,
+                                                   VectorSpace(dim=10)))
+
+
 def test_np_format_as_conv2d_vector_conv2d():
     conv2d_space1 = Conv2DSpace(shape=(8, 8), num_channels=3,
                                 axes=('c', 'b', 1, 0))
@@ -32,9 +32,14 @@ def compute_logz(rbm_params):
     model.bias_vis.set_value(rbm_params[1])
     model.bias_hid.set_value(rbm_params[2])
 
-    hid = T.matrix('hid')
-    hid_fe = model.free_energy_given_h(hid)
-    free_energy_fn = theano.function([hid], hid_fe)
+    # compute_log_z enumerates the states of the smaller layer
+    if nvis < nhid:
+        state = T.matrix('vis')
+        fe = model.free_energy_given_v(state)
+    else:
+        state = T.matrix('hid')
+        fe = model.free_energy_given_h(state)
+    free_energy_fn = theano.function([state], fe)
 
     return rbm_tools.compute_log_z(model, free_energy_fn)
 
@@ -99,3 +104,47 @@ def test_ais():
 
     # Estimate can be off when using the wrong base-rate model.
     ais_nodata('mnistvh.mat', do_exact=do_exact, betas=betas)
+
+
+def test_scan_ais():
+    """
+    Compares the estimate of the log partition function of a small RBM
+    computed by rbm_scan_ais, in one and in two processes, to its exact
+    value.
+    """
+    rng = numpy.random.RandomState([2015, 4, 21])
+    nvis, nhid = 12, 8
+    rbm_params = [numpy.asarray(rng.randn(nvis, nhid), dtype=config.floatX),
+                  numpy.asarray(rng.randn(nvis), dtype=config.floatX),
+                  numpy.asarray(rng.randn(nhid), dtype=config.floatX)]
+    exact_logz = compute_logz(rbm_params)
+
+    betas = numpy.linspace(0, 1, 1000)
+    for num_workers in [1, 2]:
+        (logz, var_dlogz), ais = rbm_tools.rbm_scan_ais(
+            rbm_params, n_runs=100, betas=betas, key_betas=[0.5],
+            num_workers=num_workers, seed=123)
+        assert ais.log_ais_w.shape == (100,)
+        assert len(ais.logz_beta) == 1
+        assert 1 <= ais.ess <= 100
+        assert abs(exact_logz - logz) < 0.1
+
+
+def test_compute_log_z_gray():
+    """
+    Checks that the Gray-code enumeration of compute_log_z_gray gives the
+    same log partition function as compute_log_z, for each choice of the
+    enumerated layer, block size and number of threads.
+    """
+    rng = numpy.random.RandomState([2015, 4, 22])
+    for nvis, nhid in [(12, 9), (7, 10)]:
+        rbm_params = [numpy.asarray(rng.randn(nvis, nhid),
+                                    dtype=config.floatX),
+                      numpy.asarray(rng.randn(nvis), dtype=config.floatX),
+                      numpy.asarray(rng.randn(nhid), dtype=config.floatX)]
+        exact_logz = compute_logz(rbm_params)
+        for max_bits, num_threads in [(15, 1), (3, 1), (4, 3)]:
+            logz = rbm_tools.compute_log_z_gray(rbm_params,
+                                                max_bits=max_bits,
+                                                num_threads=num_threads)
+            assert numpy.allclose(logz, exact_logz, rtol=1e-4)
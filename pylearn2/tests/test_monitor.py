@@ -23,6 +23,8 @@ from pylearn2.testing.datasets import ArangeDataset
 from pylearn2.training_algorithms.default import DefaultTrainingAlgorithm
 from pylearn2.utils.iteration import _iteration_schemes, has_uniform_batch_size
 from pylearn2.utils import py_integer_types
+from pylearn2.utils.function_cache import (get_compile_times,
+                                           set_in_process_cache)
 from pylearn2.utils.serial import from_string
 from pylearn2.utils.serial import to_string
 from pylearn2.utils import sharedX
@@ -604,5 +606,43 @@ def test_extra_costs():
                   extra_costs=extra_costs)
 
 
+class FeaturesCost(Cost):
+    """
+    The mean over examples of the sum of the features.
+    """
+    def get_data_specs(self, model):
+        return (model.get_input_space(), 'features')
+
+    def expr(self, model, data):
+        return data.sum(axis=1).mean()
+
+
+def test_shared_expressions():
+    """
+    Makes sure the monitor builds the expression of a cost once for all
+    the datasets, and optimizes the accum functions of datasets of
+    different sizes once.
+    """
+    num_features = 3
+    model = DummyModel(num_features=num_features)
+    datasets = OrderedDict()
+    datasets['a'] = DummyDataset(num_examples=2, num_features=num_features)
+    datasets['b'] = DummyDataset(num_examples=5, num_features=num_features)
+    monitor = Monitor.get_monitor(model)
+    monitor.setup(datasets, FeaturesCost(), 1)
+    assert (monitor.channels['a_objective'].val is
+            monitor.channels['b_objective'].val)
+
+    set_in_process_cache(True)
+    try:
+        monitor()
+    finally:
+        set_in_process_cache(False)
+    assert get_compile_times()[-1][2] == 'memory'
+    for name in datasets:
+        value = monitor.channels[name + '_objective'].val_record[-1]
+        assert np.allclose(value, datasets[name].X.sum(axis=1).mean())
+
+
 if __name__ == '__main__':
     test_revisit()
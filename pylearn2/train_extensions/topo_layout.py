@@ -0,0 +1,67 @@
+"""
+TrainExtension laying out image datasets in the input space of the model
+before training, so that no batch has to be reshaped and transposed.
+"""
+import os
+
+from pylearn2.datasets.dense_design_matrix import DenseDesignMatrix
+from pylearn2.space import Conv2DSpace
+from pylearn2.train_extensions import TrainExtension
+
+
+class TopoLayout(TrainExtension):
+    """
+    Lays out the features of the training dataset, and of other datasets
+    such as the monitoring ones, in the input space of the model, using
+    `DenseDesignMatrix.set_topo_layout`. Nothing is done if the input space
+    of the model is not a Conv2DSpace.
+
+    Parameters
+    ----------
+    datasets : list, optional
+        Other DenseDesignMatrix datasets to lay out.
+    directory : str, optional
+        If given, the laid out arrays are saved as .npy files in this
+        directory and memory-mapped, and the files saved by previous runs
+        are reused if they were laid out from the same data in the same
+        space. The training dataset is saved as train.npy, the others as
+        0.npy, 1.npy, etc.
+    """
+
+    def __init__(self, datasets=None, directory=None):
+        if datasets is None:
+            datasets = []
+        self.datasets = datasets
+        self.directory = directory
+
+    def setup(self, model, dataset, algorithm):
+        """
+        Lays out the datasets.
+
+        Parameters
+        ----------
+        model : Model
+            The model, whose input space is used.
+        dataset : Dataset
+            The training dataset.
+        algorithm : TrainingAlgorithm
+            Not used.
+        """
+        space = model.get_input_space()
+        if not isinstance(space, Conv2DSpace):
+            return
+        if self.directory is not None and not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        names = ['train'] + [str(i) for i in range(len(self.datasets))]
+        done = []
+        for name, d in zip(names, [dataset] + list(self.datasets)):
+            if not isinstance(d, DenseDesignMatrix):
+                continue
+            if any(d is other for other in done):
+                continue
+            if self.directory is None:
+                path = None
+            else:
+                path = os.path.join(self.directory, name + '.npy')
+            d.set_topo_layout(space, path)
+            done.append(d)
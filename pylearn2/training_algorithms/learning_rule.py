@@ -6,6 +6,7 @@ import numpy as np
 import warnings
 
 from theano.compat import six
+from theano import clone
 from theano import config
 from theano import tensor as T
 
@@ -98,14 +99,30 @@ class Momentum(LearningRule):
     nesterov_momentum: bool
         Use the accelerated momentum technique described in:
         "Advances in Optimizing Recurrent Networks", Yoshua Bengio, et al.
+    momentum_schedule : Schedule, optional
+        A `pylearn2.training_algorithms.schedule.Schedule`. If specified,
+        the momentum coefficient used for each update is `momentum` times
+        the value of this schedule, which is evaluated and advanced inside
+        the compiled update function.
 
     """
 
-    def __init__(self, init_momentum, nesterov_momentum=False):
+    def __init__(self, init_momentum, nesterov_momentum=False,
+                 momentum_schedule=None):
         assert init_momentum >= 0.
         assert init_momentum < 1.
         self.momentum = sharedX(init_momentum, 'momentum')
         self.nesterov_momentum = nesterov_momentum
+        self.momentum_schedule = momentum_schedule
+
+    def _get_momentum(self):
+        """
+        Returns the symbolic momentum coefficient used for the current
+        update.
+        """
+        if self.momentum_schedule is None:
+            return self.momentum
+        return self.momentum * self.momentum_schedule.expr()
 
     def add_channels_to_monitor(self, monitor, monitoring_dataset):
         """
@@ -122,7 +139,7 @@ class Momentum(LearningRule):
         monitor.add_channel(
             name='momentum',
             ipt=None,
-            val=self.momentum,
+            val=self._get_momentum(),
             data_specs=(NullSpace(), ''),
             dataset=monitoring_dataset)
 
@@ -144,6 +161,10 @@ class Momentum(LearningRule):
 
         updates = OrderedDict()
 
+        momentum = self._get_momentum()
+        if self.momentum_schedule is not None:
+            updates.update(self.momentum_schedule.get_updates())
+
         for (param, grad) in six.iteritems(grads):
             vel = sharedX(param.get_value() * 0.)
             assert param.dtype == vel.dtype
@@ -152,11 +173,11 @@ class Momentum(LearningRule):
                 vel.name = 'vel_' + param.name
 
             scaled_lr = learning_rate * lr_scalers.get(param, 1.)
-            updates[vel] = self.momentum * vel - scaled_lr * grad
+            updates[vel] = momentum * vel - scaled_lr * grad
 
             inc = updates[vel]
             if self.nesterov_momentum:
-                inc = self.momentum * inc - scaled_lr * grad
+                inc = momentum * inc - scaled_lr * grad
 
             assert inc.dtype == vel.dtype
             updates[param] = param + inc
@@ -497,3 +518,303 @@ class RMSProp(LearningRule):
             updates[param] = param + delta_x_t
 
         return updates
+
+
+class Adam(LearningRule):
+    """
+    Implements the Adam learning rule as described in:
+    "Adam: A Method for Stochastic Optimization", Diederik P. Kingma,
+    Jimmy Ba.
+
+    Parameters are updated by the formula:
+    m := beta1 * m + (1 - beta1) * d cost / d param
+    v := beta2 * v + (1 - beta2) * (d cost / d param) ** 2
+    param := param - learning_rate * sqrt(1 - beta2 ** t) / (1 - beta1 ** t)
+             * m / (sqrt(v) + epsilon)
+
+    Parameters
+    ----------
+    beta1 : float, optional
+        Decay rate of the first moment estimate.
+    beta2 : float, optional
+        Decay rate of the second moment estimate.
+    epsilon : float, optional
+        Small constant added to the denominator for numerical stability.
+    amsgrad : bool, optional
+        If True, use the maximum of all the second moment estimates seen
+        so far in the denominator, as described in "On the Convergence of
+        Adam and Beyond", Sashank J. Reddi, Satyen Kale, Sanjiv Kumar.
+
+    Notes
+    -----
+    All the moment estimates of a parameter are stored in a single shared
+    variable (stacked along a new leading axis), and the time step used
+    for bias correction is shared by all the parameters. This keeps the
+    number of updates in the compiled `sgd_update` function to two per
+    parameter, plus one.
+    """
+
+    def __init__(self, beta1=0.9, beta2=0.999, epsilon=1e-8, amsgrad=False):
+        assert 0. <= beta1 < 1.
+        assert 0. <= beta2 < 1.
+        assert epsilon > 0.
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.epsilon = epsilon
+        self.amsgrad = amsgrad
+
+    def _num_moments(self):
+        """
+        Returns the number of moment estimates stored for each parameter.
+        """
+        if self.amsgrad:
+            return 3
+        return 2
+
+    def _get_step(self, t, moments, grad):
+        """
+        Computes the new moment estimates of a parameter and the direction
+        in which to move it.
+
+        Parameters
+        ----------
+        t : theano scalar
+            The current time step, starting at 1.
+        moments : theano tensor
+            The previous moment estimates, stacked along the first axis.
+        grad : theano tensor
+            The gradient of the cost with respect to the parameter.
+
+        Returns
+        -------
+        new_moments : list
+            The new moment estimates, in the same order as in `moments`.
+        step : theano tensor
+            The step to subtract from the parameter, before scaling by the
+            learning rate.
+        """
+        m = self.beta1 * moments[0] + (1. - self.beta1) * grad
+        v = self.beta2 * moments[1] + (1. - self.beta2) * T.sqr(grad)
+        new_moments = [m, v]
+        if self.amsgrad:
+            v = T.maximum(moments[2], v)
+            new_moments.append(v)
+        correction = T.sqrt(1. - self.beta2 ** t) / (1. - self.beta1 ** t)
+        step = correction * m / (T.sqrt(v) + self.epsilon)
+        return new_moments, step
+
+    def get_updates(self, learning_rate, grads, lr_scalers=None):
+        """
+        Compute the updates of the adaptive moment learning rule.
+
+        Parameters
+        ----------
+        learning_rate : float
+            Learning rate coefficient.
+        grads : dict
+            A dictionary mapping from the model's parameters to their
+            gradients.
+        lr_scalers : dict
+            A dictionary mapping from the model's parameters to a learning
+            rate multiplier.
+        """
+        updates = OrderedDict()
+
+        prefix = self.__class__.__name__.lower()
+        prev_t = sharedX(0., prefix + '_t')
+        t = prev_t + 1.
+        updates[prev_t] = t
+
+        for (param, grad) in six.iteritems(grads):
+            shape = param.get_value(borrow=True).shape
+            moments = sharedX(np.zeros((self._num_moments(),) + shape))
+            assert moments.dtype == param.dtype
+            if param.name is not None:
+                moments.name = prefix + '_moments_' + param.name
+
+            new_moments, step = self._get_step(t, moments, grad)
+            updates[moments] = T.concatenate([T.shape_padleft(moment)
+                                              for moment in new_moments])
+
+            scaled_lr = learning_rate * lr_scalers.get(param, 1.)
+            updates[param] = param - T.cast(scaled_lr * step, param.dtype)
+
+        return updates
+
+
+class Adamax(Adam):
+    """
+    Implements the Adamax learning rule, the variant of Adam based on the
+    infinity norm described in Section 7 of:
+    "Adam: A Method for Stochastic Optimization", Diederik P. Kingma,
+    Jimmy Ba.
+
+    Parameters are updated by the formula:
+    m := beta1 * m + (1 - beta1) * d cost / d param
+    u := max(beta2 * u, abs(d cost / d param))
+    param := param - learning_rate / (1 - beta1 ** t) * m / (u + epsilon)
+
+    Parameters
+    ----------
+    beta1 : float, optional
+        Decay rate of the first moment estimate.
+    beta2 : float, optional
+        Decay rate of the exponentially weighted infinity norm.
+    epsilon : float, optional
+        Small constant added to the denominator for numerical stability.
+    """
+
+    def __init__(self, beta1=0.9, beta2=0.999, epsilon=1e-8):
+        Adam.__init__(self, beta1=beta1, beta2=beta2, epsilon=epsilon,
+                      amsgrad=False)
+
+    @wraps(Adam._get_step)
+    def _get_step(self, t, moments, grad):
+        m = self.beta1 * moments[0] + (1. - self.beta1) * grad
+        u = T.maximum(self.beta2 * moments[1], abs(grad))
+        step = m / ((1. - self.beta1 ** t) * (u + self.epsilon))
+        return [m, u], step
+
+
+class Nadam(Adam):
+    """
+    Implements the Nadam learning rule, Adam with Nesterov momentum, as
+    described in:
+    "Incorporating Nesterov Momentum into Adam", Timothy Dozat.
+
+    The first moment estimate used in the update looks one step ahead:
+    m_hat := beta1 * m / (1 - beta1 ** (t + 1))
+             + (1 - beta1) * d cost / d param / (1 - beta1 ** t)
+
+    Parameters
+    ----------
+    beta1 : float, optional
+        Decay rate of the first moment estimate.
+    beta2 : float, optional
+        Decay rate of the second moment estimate.
+    epsilon : float, optional
+        Small constant added to the denominator for numerical stability.
+    amsgrad : bool, optional
+        If True, use the maximum of all the second moment estimates seen
+        so far in the denominator.
+    """
+
+    @wraps(Adam._get_step)
+    def _get_step(self, t, moments, grad):
+        m = self.beta1 * moments[0] + (1. - self.beta1) * grad
+        v = self.beta2 * moments[1] + (1. - self.beta2) * T.sqr(grad)
+        new_moments = [m, v]
+        if self.amsgrad:
+            v = T.maximum(moments[2], v)
+            new_moments.append(v)
+        m_hat = (self.beta1 * m / (1. - self.beta1 ** (t + 1.)) +
+                 (1. - self.beta1) * grad / (1. - self.beta1 ** t))
+        v_hat = v / (1. - self.beta2 ** t)
+        step = m_hat / (T.sqrt(v_hat) + self.epsilon)
+        return new_moments, step
+
+
+class Flattened(LearningRule):
+    """
+    Applies another learning rule to all the parameters at once, as if they
+    formed a single flat vector.
+
+    The gradients are concatenated into one vector, the wrapped learning
+    rule keeps each kind of state (velocities, moment estimates, ...) in a
+    single contiguous shared variable, and the new values of the parameters
+    are views into the updated flat vector. For models with many small
+    parameters, this replaces one set of update ops per parameter with a
+    single set of vectorized ops.
+
+    Parameters
+    ----------
+    learning_rule : LearningRule
+        The learning rule to apply to the flattened parameters. Its
+        attributes (e.g. `momentum`) are exposed by this object, so
+        extensions such as `MomentumAdjustor` keep working.
+
+    Notes
+    -----
+    All the parameters must have the same dtype. Learning rate scalers are
+    expanded to one scaling coefficient per element of the flat vector.
+    """
+
+    def __init__(self, learning_rule):
+        self.learning_rule = learning_rule
+
+    def __getattr__(self, name):
+        # Guard against infinite recursion while unpickling, when
+        # learning_rule is not yet in __dict__.
+        if name == 'learning_rule':
+            raise AttributeError(name)
+        return getattr(self.learning_rule, name)
+
+    @wraps(LearningRule.add_channels_to_monitor)
+    def add_channels_to_monitor(self, monitor, monitoring_dataset):
+        self.learning_rule.add_channels_to_monitor(monitor,
+                                                   monitoring_dataset)
+
+    def get_updates(self, learning_rate, grads, lr_scalers=None):
+        """
+        Provides the updates of the wrapped learning rule, computed on the
+        flattened parameters.
+
+        Parameters
+        ----------
+        learning_rate : float
+            Learning rate coefficient.
+        grads : dict
+            A dictionary mapping from the model's parameters to their
+            gradients.
+        lr_scalers : dict
+            A dictionary mapping from the model's parameters to a learning
+            rate multiplier.
+        """
+        if lr_scalers is None:
+            lr_scalers = {}
+        params = list(grads.keys())
+        dtypes = set(param.dtype for param in params)
+        if len(dtypes) != 1:
+            raise TypeError("Flattened requires all the parameters to have "
+                            "the same dtype, got " + str(sorted(dtypes)))
+        dtype = dtypes.pop()
+
+        shapes = [param.get_value(borrow=True).shape for param in params]
+        sizes = [int(np.prod(shape)) for shape in shapes]
+
+        # The wrapped rule only uses this shared variable to learn the
+        # shape, dtype and name of the flat parameter vector. It is then
+        # replaced by the concatenation of the actual parameters, so that
+        # values set directly on the parameters are always honored.
+        flat_param = sharedX(np.zeros(sum(sizes)), 'flat_params',
+                             dtype=dtype)
+        flat_value = T.concatenate([param.flatten() for param in params])
+        flat_grad = T.concatenate([grads[param].flatten()
+                                   for param in params])
+
+        flat_lr_scalers = {}
+        if any(param in lr_scalers for param in params):
+            scales = np.concatenate([
+                np.ones(size) * lr_scalers.get(param, 1.)
+                for param, size in zip(params, sizes)])
+            flat_lr_scalers[flat_param] = sharedX(scales, 'flat_lr_scalers',
+                                                  dtype=dtype)
+
+        flat_updates = self.learning_rule.get_updates(
+            learning_rate, OrderedDict([(flat_param, flat_grad)]),
+            flat_lr_scalers)
+        new_flat_param = flat_updates.pop(flat_param)
+
+        updated = list(flat_updates.values()) + [new_flat_param]
+        updated = clone(updated, replace={flat_param: flat_value})
+
+        updates = OrderedDict(zip(flat_updates.keys(), updated[:-1]))
+        new_flat_param = updated[-1]
+        pos = 0
+        for param, shape, size in zip(params, shapes, sizes):
+            new_param = new_flat_param[pos:pos + size].reshape(shape)
+            updates[param] = T.patternbroadcast(new_param,
+                                                param.broadcastable)
+            pos += size
+
+        return updates
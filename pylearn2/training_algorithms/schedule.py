@@ -0,0 +1,220 @@
+"""
+Schedules for hyperparameters such as the learning rate and the momentum,
+evaluated inside the compiled training function.
+
+A schedule is a symbolic function of its own shared step counter. Its
+value at step t multiplies the shared value of the hyperparameter it is
+attached to, so extensions that adjust that shared value (e.g.
+`MonitorBasedLRAdjuster` or `MomentumAdjustor`) keep working. Because the
+counter is incremented by the updates of the training function itself,
+schedules change smoothly within an epoch without any per-batch Python
+callback.
+"""
+import numpy as np
+from theano import config
+from theano import tensor as T
+
+from pylearn2.compat import OrderedDict
+from pylearn2.utils import sharedX
+from pylearn2.utils import wraps
+
+
+class Schedule(object):
+    """
+    A multiplicative factor that depends on the number of training steps
+    done so far.
+    """
+
+    def __init__(self):
+        self.step = sharedX(0, 'schedule_step', dtype='int64')
+
+    def value_at(self, step):
+        """
+        Returns the symbolic value of the schedule at a given step.
+
+        Parameters
+        ----------
+        step : theano scalar
+            The number of training steps done so far, as a floatX scalar.
+
+        Returns
+        -------
+        value : theano scalar
+            The factor to apply to the hyperparameter.
+        """
+        raise NotImplementedError(str(type(self)) + " does not implement "
+                                  "value_at.")
+
+    def expr(self):
+        """
+        Returns the symbolic value of the schedule at the current step.
+
+        Returns
+        -------
+        value : theano scalar
+            The factor to apply to the hyperparameter.
+        """
+        return T.cast(self.value_at(T.cast(self.step, config.floatX)),
+                      config.floatX)
+
+    def get_updates(self):
+        """
+        Returns the updates that advance the schedule by one step. They
+        must be included in the training function that uses `expr`.
+
+        Returns
+        -------
+        updates : OrderedDict
+            A dictionary mapping the step counter to its new value.
+        """
+        return OrderedDict([(self.step, self.step + 1)])
+
+    def reset(self):
+        """
+        Moves the schedule back to its first step.
+        """
+        self.step.set_value(np.cast['int64'](0))
+
+
+class Warmup(Schedule):
+    """
+    Grows the factor linearly from `start_factor` to 1 over the first
+    `warmup_steps` steps, then follows another schedule.
+
+    Parameters
+    ----------
+    warmup_steps : int
+        The number of steps of the linear warmup.
+    start_factor : float, optional
+        The value of the factor at the first step.
+    schedule : Schedule, optional
+        The schedule to follow after the warmup, started at step 0 when the
+        warmup ends. If not specified, the factor stays at 1.
+    """
+
+    def __init__(self, warmup_steps, start_factor=0., schedule=None):
+        assert warmup_steps > 0
+        super(Warmup, self).__init__()
+        self.warmup_steps = warmup_steps
+        self.start_factor = start_factor
+        self.schedule = schedule
+
+    @wraps(Schedule.value_at)
+    def value_at(self, step):
+        alpha = T.minimum(step / self.warmup_steps, 1.)
+        warmup = self.start_factor + (1. - self.start_factor) * alpha
+        if self.schedule is None:
+            return warmup
+        after = self.schedule.value_at(T.maximum(step - self.warmup_steps,
+                                                 0.))
+        return T.switch(T.lt(step, self.warmup_steps), warmup, after)
+
+
+class Cosine(Schedule):
+    """
+    Anneals the factor from 1 to `min_factor` following half a cosine
+    period over `decay_steps` steps, as in "SGDR: Stochastic Gradient
+    Descent with Warm Restarts", Ilya Loshchilov, Frank Hutter.
+
+    Parameters
+    ----------
+    decay_steps : int
+        The number of steps after which the factor reaches `min_factor`.
+    min_factor : float, optional
+        The value of the factor after `decay_steps` steps.
+    """
+
+    def __init__(self, decay_steps, min_factor=0.):
+        assert decay_steps > 0
+        super(Cosine, self).__init__()
+        self.decay_steps = decay_steps
+        self.min_factor = min_factor
+
+    @wraps(Schedule.value_at)
+    def value_at(self, step):
+        alpha = T.minimum(step / self.decay_steps, 1.)
+        cosine = 0.5 * (1. + T.cos(np.pi * alpha))
+        return self.min_factor + (1. - self.min_factor) * cosine
+
+
+class Step(Schedule):
+    """
+    Multiplies the factor by `decay_factor` every `step_size` steps.
+
+    Parameters
+    ----------
+    step_size : int
+        The number of steps between two decays.
+    decay_factor : float, optional
+        The amount by which the factor is multiplied at each decay.
+    """
+
+    def __init__(self, step_size, decay_factor=0.1):
+        assert step_size > 0
+        super(Step, self).__init__()
+        self.step_size = step_size
+        self.decay_factor = decay_factor
+
+    @wraps(Schedule.value_at)
+    def value_at(self, step):
+        return self.decay_factor ** T.floor(step / self.step_size)
+
+
+class Exponential(Schedule):
+    """
+    Decays the factor exponentially, as
+    `max(min_factor, decay_factor ** (step / decay_steps))`.
+
+    Parameters
+    ----------
+    decay_factor : float
+        The amount by which the factor is multiplied every `decay_steps`
+        steps.
+    decay_steps : int, optional
+        The number of steps over which the factor is multiplied by
+        `decay_factor`.
+    min_factor : float, optional
+        The factor is clipped to be at least this value.
+    """
+
+    def __init__(self, decay_factor, decay_steps=1, min_factor=0.):
+        assert decay_steps > 0
+        super(Exponential, self).__init__()
+        self.decay_factor = decay_factor
+        self.decay_steps = decay_steps
+        self.min_factor = min_factor
+
+    @wraps(Schedule.value_at)
+    def value_at(self, step):
+        return T.maximum(self.min_factor,
+                         self.decay_factor ** (step / self.decay_steps))
+
+
+class Polynomial(Schedule):
+    """
+    Decays the factor from 1 to `end_factor` over `decay_steps` steps, as
+    `end_factor + (1 - end_factor) * (1 - step / decay_steps) ** power`.
+    A power of 1 gives a linear decay.
+
+    Parameters
+    ----------
+    decay_steps : int
+        The number of steps after which the factor reaches `end_factor`.
+    power : float, optional
+        The power of the polynomial.
+    end_factor : float, optional
+        The value of the factor after `decay_steps` steps.
+    """
+
+    def __init__(self, decay_steps, power=1., end_factor=0.):
+        assert decay_steps > 0
+        super(Polynomial, self).__init__()
+        self.decay_steps = decay_steps
+        self.power = power
+        self.end_factor = end_factor
+
+    @wraps(Schedule.value_at)
+    def value_at(self, step):
+        alpha = T.minimum(step / self.decay_steps, 1.)
+        return (self.end_factor +
+                (1. - self.end_factor) * (1. - alpha) ** self.power)
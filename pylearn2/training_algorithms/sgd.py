@@ -18,6 +18,7 @@ import numpy as np
 from theano.compat import six
 from theano import config
 from theano import function
+from theano import tensor as T
 from theano.gof.op import get_debug_values
 
 from pylearn2.compat import OrderedDict, first_key
@@ -37,6 +38,11 @@ from pylearn2.utils import contains_nan
 from pylearn2.utils import contains_inf
 from pylearn2.utils import isfinite
 from pylearn2.utils.data_specs import DataSpecsMapping
+from pylearn2.utils.function_cache import (cached_function,
+                                           get_compile_count,
+                                           get_compile_times,
+                                           summarize_compile_times)
+from pylearn2.utils.graph_cache import GraphCache
 from pylearn2.utils.exc import reraise_as
 from pylearn2.utils.timing import log_timing
 from pylearn2.utils.rng import make_np_rng
@@ -149,6 +155,50 @@ class SGD(TrainingAlgorithm):
     seed : valid argument to np.random.RandomState, optional
         The seed used for the random number generate to be passed to the
         training dataset iterator (if any)
+    grad_accumulation_steps : int, optional
+        Defaults to 1.
+        If greater than 1, the gradients of this many consecutive
+        minibatches are accumulated into shared buffers (weighted by the
+        number of examples in each minibatch) before the learning rule
+        is applied once to their average. This gives an effective batch
+        size of `grad_accumulation_steps * batch_size` while only ever
+        holding one minibatch in memory. In this mode, `update_callbacks`
+        and `Monitor.report_batch` are called once per parameter update
+        rather than once per minibatch, and any partially accumulated
+        gradient is applied at the end of each epoch.
+    nonfinite_policy : str, optional
+        If specified, `sgd_update` also computes a single scalar telling
+        whether all the updated parameter values are finite, and this
+        flag is checked after every update instead of scanning the
+        parameters on the host before and after each epoch. The policy
+        decides what happens when an update produces a NaN or Inf:
+
+        - 'halt': raise a FloatingPointError.
+        - 'skip': leave the parameters and learning rule state unchanged
+          (the update is discarded in the graph) and keep training.
+        - 'rollback': restore the parameters and learning rule state
+          saved at the start of the epoch and keep training.
+
+        The check sums each parameter, so values large enough to overflow
+        the sum are also reported as non-finite.
+    learning_rate_schedule : \
+        pylearn2.training_algorithms.schedule.Schedule, optional
+
+        If specified, the learning rate used for each update is
+        `learning_rate` times the value of this schedule, which is
+        evaluated and advanced inside `sgd_update`. Unlike the
+        `update_callbacks` that adjust the learning rate, this adds no
+        Python overhead per minibatch. Train extensions may still adjust
+        `learning_rate`, which then acts as the base of the schedule.
+    loss_scale : float, optional
+        If specified, it is passed to `cost.get_gradients`, which
+        back-propagates the cost multiplied by this factor and divides the
+        gradients by it afterwards. This is meant for models storing their
+        activations in float16 (see the `activation_dtypes` argument of
+        `MLP`), whose small gradients would otherwise underflow on their
+        way down. The cost must support it, see `Cost.get_gradients`. A
+        factor large enough to overflow gives infinite gradients, which
+        can be discarded with `nonfinite_policy='skip'`.
     """
     def __init__(self, learning_rate, cost=None, batch_size=None,
                  monitoring_batch_size=None, monitoring_batches=None,
@@ -158,7 +208,9 @@ class SGD(TrainingAlgorithm):
                  set_batch_size = False,
                  train_iteration_mode = None, batches_per_iter=None,
                  theano_function_mode = None, monitoring_costs=None,
-                 seed=[2012, 10, 5]):
+                 seed=[2012, 10, 5], grad_accumulation_steps=1,
+                 nonfinite_policy=None, learning_rate_schedule=None,
+                 loss_scale=None):
 
         if isinstance(cost, (list, tuple, set)):
             raise TypeError("SGD no longer supports using collections of " +
@@ -192,8 +244,21 @@ class SGD(TrainingAlgorithm):
         self.rng = make_np_rng(seed, which_method=["randn","randint"])
         self.theano_function_mode = theano_function_mode
         self.monitoring_costs = monitoring_costs
-
-    def _setup_monitor(self):
+        if grad_accumulation_steps < 1:
+            raise ValueError("grad_accumulation_steps must be at least 1, "
+                             "got " + str(grad_accumulation_steps))
+        self.grad_accumulation_steps = grad_accumulation_steps
+        if nonfinite_policy not in (None, 'halt', 'skip', 'rollback'):
+            raise ValueError("nonfinite_policy must be None, 'halt', 'skip' "
+                             "or 'rollback', got " + str(nonfinite_policy))
+        self.nonfinite_policy = nonfinite_policy
+        self.learning_rate_schedule = learning_rate_schedule
+        if loss_scale is not None and loss_scale <= 0:
+            raise ValueError("loss_scale must be positive, got " +
+                             str(loss_scale))
+        self.loss_scale = loss_scale
+
+    def _setup_monitor(self, graph_cache=None):
         """
         Set up monitor to model the objective value, learning rate,
         momentum (if applicable), and extra channels defined by
@@ -202,6 +267,12 @@ class SGD(TrainingAlgorithm):
         This method must be called after `learning_rule.get_updates`,
         since it may have an effect on `learning_rule.add_channels_to_monitor`
         (that is currently the case for `learning_rule.RMSProp`).
+
+        Parameters
+        ----------
+        graph_cache : GraphCache, optional
+            The symbolic batches and expressions built by `setup`, which
+            the monitor reuses.
         """
         if bool(self.monitoring_dataset):
             if (self.monitoring_batch_size is None and
@@ -213,7 +284,8 @@ class SGD(TrainingAlgorithm):
                                batch_size=self.monitoring_batch_size,
                                num_batches=self.monitoring_batches,
                                extra_costs=self.monitoring_costs,
-                               mode=self.monitor_iteration_mode)
+                               mode=self.monitor_iteration_mode,
+                               graph_cache=graph_cache)
             dataset_name = first_key(self.monitoring_dataset)
             monitoring_dataset = self.monitoring_dataset[dataset_name]
             #TODO: have Monitor support non-data-dependent channels
@@ -223,6 +295,15 @@ class SGD(TrainingAlgorithm):
                                      data_specs=(NullSpace(), ''),
                                      dataset=monitoring_dataset)
 
+            if self.learning_rate_schedule is not None:
+                self.monitor.add_channel(
+                    name='scheduled_learning_rate',
+                    ipt=None,
+                    val=(self.learning_rate *
+                         self.learning_rate_schedule.expr()),
+                    data_specs=(NullSpace(), ''),
+                    dataset=monitoring_dataset)
+
             if self.learning_rule:
                 self.learning_rule.add_channels_to_monitor(
                         self.monitor,
@@ -288,32 +369,28 @@ class SGD(TrainingAlgorithm):
                              "even_sequential, even_shuffled_sequential or "
                              "even_batchwise_shuffled_sequential")
 
+        compile_times_start = get_compile_count()
+        # The symbolic batches and the cost expression are shared with the
+        # monitor, which then builds its channels on the same graph
+        graph_cache = GraphCache()
+
         data_specs = self.cost.get_data_specs(self.model)
-        mapping = DataSpecsMapping(data_specs)
-        space_tuple = mapping.flatten(data_specs[0], return_tuple=True)
-        source_tuple = mapping.flatten(data_specs[1], return_tuple=True)
 
         # Build a flat tuple of Theano Variables, one for each space.
         # We want that so that if the same space/source is specified
         # more than once in data_specs, only one Theano Variable
         # is generated for it, and the corresponding value is passed
         # only once to the compiled Theano function.
-        theano_args = []
-        for space, source in safe_zip(space_tuple, source_tuple):
-            name = '%s[%s]' % (self.__class__.__name__, source)
-            arg = space.make_theano_batch(name=name,
-                                          batch_size=self.batch_size)
-            theano_args.append(arg)
-        theano_args = tuple(theano_args)
-
         # Methods of `self.cost` need args to be passed in a format compatible
         # with data_specs
-        nested_args = mapping.nest(theano_args)
+        theano_args, nested_args = graph_cache.batches(
+            data_specs, self.__class__.__name__ + '[%s]',
+            batch_size=self.batch_size)
         fixed_var_descr = self.cost.get_fixed_var_descr(model, nested_args)
         self.on_load_batch = fixed_var_descr.on_load_batch
 
-        cost_value = self.cost.expr(model, nested_args,
-                                    ** fixed_var_descr.fixed_vars)
+        cost_value = graph_cache.cost_expr(self.cost, model, nested_args,
+                                           ** fixed_var_descr.fixed_vars)
 
         if cost_value is not None and cost_value.name is None:
             # Concatenate the name of all tensors in theano_args !?
@@ -326,8 +403,11 @@ class SGD(TrainingAlgorithm):
             if param.name is None:
                 param.name = 'sgd_params[%d]' % i
 
+        kwargs = dict(fixed_var_descr.fixed_vars)
+        if self.loss_scale is not None:
+            kwargs['loss_scale'] = self.loss_scale
         grads, updates = self.cost.get_gradients(model, nested_args,
-                                                 ** fixed_var_descr.fixed_vars)
+                                                 ** kwargs)
         if not isinstance(grads, OrderedDict):
             raise TypeError(str(type(self.cost)) + ".get_gradients returned " +
                             "something with" + str(type(grads)) + "as its " +
@@ -360,6 +440,21 @@ class SGD(TrainingAlgorithm):
             lr = learning_rate.get_value() * lr_scalers.get(param,1.)
             log.info('\t' + param_name + ': ' + str(lr))
 
+        if self.grad_accumulation_steps > 1:
+            # The cost's own updates (e.g. persistent chains) depend on the
+            # data, so they are run with every minibatch, while the learning
+            # rule only sees the averaged gradient of several minibatches.
+            (num_examples, accumulate_updates, grads,
+             reset_updates) = self._setup_grad_accumulation(params, grads,
+                                                            updates)
+            updates = OrderedDict()
+
+        if self.learning_rate_schedule is not None:
+            learning_rate = (self.learning_rate *
+                             self.learning_rate_schedule.expr())
+            learning_rate.name = 'scheduled_learning_rate'
+            updates.update(self.learning_rate_schedule.get_updates())
+
         if self.learning_rule:
             updates.update(self.learning_rule.get_updates(
                 learning_rate, grads, lr_scalers))
@@ -385,6 +480,15 @@ class SGD(TrainingAlgorithm):
                     raise ValueError("debug value of %s contains nans" %
                             update.name)
 
+        sgd_update_outputs = []
+        if self.nonfinite_policy is not None:
+            is_finite = self._get_finite_check(params, updates)
+            if self.nonfinite_policy == 'skip':
+                updates = OrderedDict(
+                    (var, T.switch(is_finite, update, var))
+                    for var, update in six.iteritems(updates))
+            sgd_update_outputs.append(is_finite)
+            self._guarded_vars = list(updates.keys())
 
         # Set up monitor to model the objective value, learning rate,
         # momentum (if applicable), and extra channels defined by
@@ -393,15 +497,134 @@ class SGD(TrainingAlgorithm):
         # called, since it may have an effect on
         # learning_rule.add_channels_to_monitor (that is currently the case
         # for AdaDelta and RMSProp).
-        self._setup_monitor()
+        self._setup_monitor(graph_cache)
+
+        if self.grad_accumulation_steps > 1:
+            updates.update(reset_updates)
+            with log_timing(log, 'Compiling sgd_accumulate'):
+                self.sgd_accumulate = cached_function(
+                    theano_args + (num_examples,),
+                    updates=accumulate_updates,
+                    name='sgd_accumulate',
+                    on_unused_input='ignore',
+                    mode=self.theano_function_mode)
+            sgd_update_inputs = []
+        else:
+            sgd_update_inputs = theano_args
 
         with log_timing(log, 'Compiling sgd_update'):
-            self.sgd_update = function(theano_args,
-                                       updates=updates,
-                                       name='sgd_update',
-                                       on_unused_input='ignore',
-                                       mode=self.theano_function_mode)
+            self.sgd_update = cached_function(sgd_update_inputs,
+                                              sgd_update_outputs,
+                                              updates=updates,
+                                              name='sgd_update',
+                                              on_unused_input='ignore',
+                                              mode=self.theano_function_mode)
         self.params = params
+        log.info('Compiled during setup: ' + summarize_compile_times(
+            get_compile_times(compile_times_start)))
+
+    def _get_finite_check(self, params, updates):
+        """
+        Builds a scalar telling whether all the updated parameter values
+        are finite.
+
+        Parameters
+        ----------
+        params : list
+            The parameters of the model.
+        updates : OrderedDict
+            The updates of the SGD step, including those of `params`.
+
+        Returns
+        -------
+        is_finite : theano scalar
+            1 if the new values of all the parameters are finite, else 0.
+
+        Notes
+        -----
+        NaNs and Infs propagate through sums, so one reduction per
+        parameter and a scalar test are enough, which is much cheaper than
+        an elementwise test and avoids moving the parameters to the host.
+        """
+        total = sum(T.sum(updates[param]) for param in params)
+        is_finite = T.eq(T.or_(T.isnan(total), T.isinf(total)), 0)
+        is_finite.name = 'sgd_update_is_finite'
+        return is_finite
+
+    def _handle_update_outputs(self, outputs):
+        """
+        Applies `nonfinite_policy` given the outputs of `sgd_update`.
+
+        Parameters
+        ----------
+        outputs : list
+            The values returned by `sgd_update`.
+        """
+        if self.nonfinite_policy is None or outputs[0]:
+            return
+        if self.nonfinite_policy == 'halt':
+            raise FloatingPointError("sgd_update produced NaN or Inf "
+                                     "parameter values.")
+        elif self.nonfinite_policy == 'skip':
+            log.warning("sgd_update produced NaN or Inf parameter values, "
+                        "the update was skipped.")
+        else:
+            assert self.nonfinite_policy == 'rollback'
+            log.warning("sgd_update produced NaN or Inf parameter values, "
+                        "rolling back to the start of the epoch.")
+            for var, value in safe_zip(self._guarded_vars, self._snapshot):
+                var.set_value(value)
+
+    def _setup_grad_accumulation(self, params, grads, updates):
+        """
+        Builds the symbolic expressions used to accumulate gradients over
+        several minibatches before applying the learning rule.
+
+        Parameters
+        ----------
+        params : list
+            The parameters of the model.
+        grads : OrderedDict
+            A dictionary mapping from the model's parameters to their
+            gradients on a single minibatch.
+        updates : OrderedDict
+            The updates returned by the cost along with the gradients.
+            They are run once per minibatch.
+
+        Returns
+        -------
+        num_examples : theano scalar
+            Input giving the number of examples in the current minibatch.
+        accumulate_updates : OrderedDict
+            Updates adding the example-weighted gradients of one minibatch
+            to the accumulation buffers.
+        avg_grads : OrderedDict
+            A dictionary mapping from the model's parameters to their
+            gradients averaged over all the accumulated examples.
+        reset_updates : OrderedDict
+            Updates clearing the accumulation buffers.
+        """
+        num_examples = T.scalar('num_examples', dtype=config.floatX)
+        examples_seen = sharedX(0., 'sgd_accumulated_examples')
+
+        accumulate_updates = OrderedDict(updates)
+        avg_grads = OrderedDict()
+        reset_updates = OrderedDict()
+        for param in params:
+            grad_acc = sharedX(param.get_value() * 0.)
+            grad_acc.name = 'grad_acc_' + param.name
+            assert grad_acc.dtype == param.dtype
+            accumulate_updates[grad_acc] = (grad_acc +
+                                            num_examples * grads[param])
+            # A zero-size batch (e.g. a NullSpace) accumulates no examples
+            avg_grads[param] = grad_acc / T.maximum(examples_seen, 1.)
+            if grads[param].name is not None:
+                avg_grads[param].name = 'mean_' + grads[param].name
+            reset_updates[grad_acc] = T.zeros_like(grad_acc)
+        accumulate_updates[examples_seen] = examples_seen + num_examples
+        reset_updates[examples_seen] = T.zeros_like(examples_seen)
+
+        return num_examples, accumulate_updates, avg_grads, reset_updates
 
     def train(self, dataset):
         """
@@ -414,11 +637,14 @@ class SGD(TrainingAlgorithm):
         if not hasattr(self, 'sgd_update'):
             raise Exception("train called without first calling setup")
 
-        # Make sure none of the parameters have bad values
-        for param in self.params:
-            value = param.get_value(borrow=True)
-            if not isfinite(value):
-                raise Exception("NaN in " + param.name)
+        if self.nonfinite_policy is None:
+            # Make sure none of the parameters have bad values
+            for param in self.params:
+                value = param.get_value(borrow=True)
+                if not isfinite(value):
+                    raise Exception("NaN in " + param.name)
+        elif self.nonfinite_policy == 'rollback':
+            self._snapshot = [var.get_value() for var in self._guarded_vars]
 
         self.first = False
         rng = self.rng
@@ -447,25 +673,77 @@ class SGD(TrainingAlgorithm):
                 rng = rng, num_batches = self.batches_per_iter)
 
         on_load_batch = self.on_load_batch
+        if self.grad_accumulation_steps > 1:
+            self._train_accumulated(iterator, flat_data_specs)
+        else:
+            for batch in iterator:
+                for callback in on_load_batch:
+                    callback(*batch)
+                self._handle_update_outputs(self.sgd_update(*batch))
+                # iterator might return a smaller batch if dataset size
+                # isn't divisible by batch_size
+                # Note: if data_specs[0] is a NullSpace, there is no way to
+                # know how many examples would actually have been in the
+                # batch, since it was empty, so actual_batch_size would be
+                # reported as 0.
+                actual_batch_size = flat_data_specs[0].np_batch_size(batch)
+                self.monitor.report_batch(actual_batch_size)
+                for callback in self.update_callbacks:
+                    callback(self)
+
+        if self.nonfinite_policy is None:
+            # Make sure none of the parameters have bad values
+            for param in self.params:
+                value = param.get_value(borrow=True)
+                if not isfinite(value):
+                    raise Exception("NaN in " + param.name)
+
+    def _train_accumulated(self, iterator, flat_data_specs):
+        """
+        Runs one epoch of SGD with gradient accumulation: the gradients of
+        `grad_accumulation_steps` minibatches are accumulated before each
+        parameter update.
+
+        Parameters
+        ----------
+        iterator : iterable
+            The iterator over the training minibatches.
+        flat_data_specs : tuple
+            The flat data specs of the minibatches returned by `iterator`.
+        """
+        num_batches = 0
+        num_examples = 0
         for batch in iterator:
-            for callback in on_load_batch:
+            for callback in self.on_load_batch:
                 callback(*batch)
-            self.sgd_update(*batch)
-            # iterator might return a smaller batch if dataset size
-            # isn't divisible by batch_size
-            # Note: if data_specs[0] is a NullSpace, there is no way to know
-            # how many examples would actually have been in the batch,
-            # since it was empty, so actual_batch_size would be reported as 0.
             actual_batch_size = flat_data_specs[0].np_batch_size(batch)
-            self.monitor.report_batch(actual_batch_size)
-            for callback in self.update_callbacks:
-                callback(self)
-
-        # Make sure none of the parameters have bad values
-        for param in self.params:
-            value = param.get_value(borrow=True)
-            if not isfinite(value):
-                raise Exception("NaN in " + param.name)
+            weight = np.cast[config.floatX](actual_batch_size)
+            self.sgd_accumulate(*(tuple(batch) + (weight,)))
+            num_batches += 1
+            num_examples += actual_batch_size
+            if num_batches == self.grad_accumulation_steps:
+                self._apply_accumulated(num_examples)
+                num_batches = 0
+                num_examples = 0
+        # Apply what is left over, so that the parameters seen by the
+        # monitor and the train extensions reflect the whole epoch.
+        if num_batches > 0:
+            self._apply_accumulated(num_examples)
+
+    def _apply_accumulated(self, num_examples):
+        """
+        Applies the learning rule to the accumulated gradients and reports
+        the update to the monitor and the update callbacks.
+
+        Parameters
+        ----------
+        num_examples : int
+            The number of examples the gradients were accumulated over.
+        """
+        self._handle_update_outputs(self.sgd_update())
+        self.monitor.report_batch(num_examples)
+        for callback in self.update_callbacks:
+            callback(self)
 
     def continue_learning(self, model):
         """
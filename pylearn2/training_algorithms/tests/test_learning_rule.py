@@ -11,6 +11,10 @@ from pylearn2.training_algorithms.learning_rule import Momentum
 from pylearn2.training_algorithms.learning_rule import AdaDelta
 from pylearn2.training_algorithms.learning_rule import AdaGrad
 from pylearn2.training_algorithms.learning_rule import RMSProp
+from pylearn2.training_algorithms.learning_rule import Adam
+from pylearn2.training_algorithms.learning_rule import Adamax
+from pylearn2.training_algorithms.learning_rule import Nadam
+from pylearn2.training_algorithms.learning_rule import Flattened
 
 from test_sgd import DummyCost, DummyModel
 
@@ -280,3 +284,151 @@ def test_rmsprop():
     assert all(np.allclose(manual_param, sgd_param.get_value())
                for manual_param, sgd_param
                in izip(manual, model.get_params()))
+
+
+def check_adaptive_moment_rule(learning_rule, manual_step, num_moments):
+    """
+    Make sure that an adaptive moment learning rule obtains the same
+    parameter values as a hand-crafted implementation, given a dummy model
+    and learning rate scaler for each parameter.
+
+    Parameters
+    ----------
+    learning_rule : LearningRule
+        The learning rule to test.
+    manual_step : callable
+        Takes the time step, the list of moment estimates of a parameter
+        (updated in place) and its gradient, and returns the step to
+        subtract from the parameter before scaling by the learning rate.
+    num_moments : int
+        The number of moment estimates stored per parameter.
+    """
+    cost = SumOfCosts([SumOfOneHalfParamsSquared(), (0., DummyCost())])
+    model = DummyModel(shapes, lr_scalers=scales)
+    dataset = ArangeDataset(1)
+
+    sgd = SGD(cost=cost,
+              learning_rate=learning_rate,
+              learning_rule=learning_rule,
+              batch_size=1)
+
+    sgd.setup(model=model, dataset=dataset)
+
+    state = {}
+    for param in model.get_params():
+        param_shape = param.get_value().shape
+        state[param] = [np.zeros(param_shape) for i in range(num_moments)]
+
+    def manual_update(model, state, t):
+        rval = []
+        for scale, param in izip(scales, model.get_params()):
+            param_val = param.get_value()
+            step = manual_step(t, state[param], param_val)
+            rval += [param_val - scale * learning_rate * step]
+        return rval
+
+    for t in [1, 2, 3]:
+        manual = manual_update(model, state, t)
+        sgd.train(dataset=dataset)
+        assert all(np.allclose(manual_param, sgd_param.get_value())
+                   for manual_param, sgd_param
+                   in izip(manual, model.get_params()))
+
+
+def test_adam():
+    """
+    Make sure that learning_rule.Adam obtains the same parameter values as
+    with a hand-crafted Adam implementation, with and without AMSGrad.
+
+    Reference:
+    "Adam: A Method for Stochastic Optimization", Diederik P. Kingma,
+    Jimmy Ba.
+    """
+    beta1 = 0.9
+    beta2 = 0.999
+    epsilon = 1e-8
+
+    for amsgrad in [False, True]:
+        def adam_step(t, moments, grad):
+            moments[0] = beta1 * moments[0] + (1 - beta1) * grad
+            moments[1] = beta2 * moments[1] + (1 - beta2) * grad ** 2
+            v = moments[1]
+            if amsgrad:
+                moments[2] = np.maximum(moments[2], moments[1])
+                v = moments[2]
+            correction = np.sqrt(1 - beta2 ** t) / (1 - beta1 ** t)
+            return correction * moments[0] / (np.sqrt(v) + epsilon)
+
+        check_adaptive_moment_rule(Adam(beta1, beta2, epsilon, amsgrad),
+                                   adam_step, 3 if amsgrad else 2)
+
+
+def test_adamax():
+    """
+    Make sure that learning_rule.Adamax obtains the same parameter values
+    as with a hand-crafted Adamax implementation.
+    """
+    beta1 = 0.9
+    beta2 = 0.999
+    epsilon = 1e-8
+
+    def adamax_step(t, moments, grad):
+        moments[0] = beta1 * moments[0] + (1 - beta1) * grad
+        moments[1] = np.maximum(beta2 * moments[1], np.abs(grad))
+        return moments[0] / ((1 - beta1 ** t) * (moments[1] + epsilon))
+
+    check_adaptive_moment_rule(Adamax(beta1, beta2, epsilon),
+                               adamax_step, 2)
+
+
+def test_nadam():
+    """
+    Make sure that learning_rule.Nadam obtains the same parameter values as
+    with a hand-crafted Nadam implementation.
+
+    Reference:
+    "Incorporating Nesterov Momentum into Adam", Timothy Dozat.
+    """
+    beta1 = 0.9
+    beta2 = 0.999
+    epsilon = 1e-8
+
+    def nadam_step(t, moments, grad):
+        moments[0] = beta1 * moments[0] + (1 - beta1) * grad
+        moments[1] = beta2 * moments[1] + (1 - beta2) * grad ** 2
+        m_hat = (beta1 * moments[0] / (1 - beta1 ** (t + 1)) +
+                 (1 - beta1) * grad / (1 - beta1 ** t))
+        v_hat = moments[1] / (1 - beta2 ** t)
+        return m_hat / (np.sqrt(v_hat) + epsilon)
+
+    check_adaptive_moment_rule(Nadam(beta1, beta2, epsilon),
+                               nadam_step, 2)
+
+
+def test_flattened():
+    """
+    Make sure that learning_rule.Flattened obtains the same parameter values
+    as the learning rule it wraps, given a dummy model and learning rate
+    scaler for each parameter.
+    """
+    cost = SumOfCosts([SumOfOneHalfParamsSquared(), (0., DummyCost())])
+    dataset = ArangeDataset(1)
+
+    for make_rule in [lambda: Momentum(.5, nesterov_momentum=True),
+                      lambda: AdaDelta(),
+                      lambda: Adam(amsgrad=True)]:
+        # Both models start from the same parameters
+        models = [DummyModel(shapes, lr_scalers=scales) for i in range(2)]
+        models[1].set_param_vector(models[0].get_param_vector())
+        learning_rules = [make_rule(), Flattened(make_rule())]
+        for model, learning_rule in zip(models, learning_rules):
+            sgd = SGD(cost=cost,
+                      learning_rate=learning_rate,
+                      learning_rule=learning_rule,
+                      batch_size=1)
+            sgd.setup(model=model, dataset=dataset)
+            for i in range(3):
+                sgd.train(dataset=dataset)
+
+        assert np.allclose(models[0].get_param_vector(),
+                           models[1].get_param_vector())
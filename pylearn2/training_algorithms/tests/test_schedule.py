@@ -0,0 +1,124 @@
+"""
+Tests for pylearn2.training_algorithms.schedule
+"""
+import numpy as np
+
+from theano import function
+
+from pylearn2.costs.cost import SumOfCosts
+from pylearn2.testing.cost import SumOfParams
+from pylearn2.testing.datasets import ArangeDataset
+from pylearn2.training_algorithms.schedule import (Warmup, Cosine, Step,
+                                                   Exponential, Polynomial)
+from pylearn2.training_algorithms.sgd import SGD
+from pylearn2.training_algorithms.learning_rule import Momentum
+
+from test_sgd import DummyCost, DummyModel
+
+
+def check_schedule(schedule, expected, num_steps=20):
+    """
+    Compares the values of a schedule over its first steps with those of
+    a numpy implementation.
+
+    Parameters
+    ----------
+    schedule : Schedule
+        The schedule to test.
+    expected : callable
+        Takes the step and returns the expected value of the schedule.
+    num_steps : int, optional
+        The number of steps to check.
+    """
+    f = function([], schedule.expr(), updates=schedule.get_updates())
+    for step in range(num_steps):
+        assert np.allclose(f(), expected(step)), step
+    schedule.reset()
+    assert np.allclose(f(), expected(0))
+
+
+def test_warmup():
+    """
+    Tests a linear warmup that starts from a nonzero factor.
+    """
+    check_schedule(Warmup(5, start_factor=.5),
+                   lambda t: .5 + .5 * min(t / 5., 1.))
+
+
+def test_warmup_then_cosine():
+    """
+    Tests a warmup followed by another schedule.
+    """
+    def expected(t):
+        if t < 4:
+            return t / 4.
+        return 0.5 * (1. + np.cos(np.pi * min((t - 4) / 10., 1.)))
+    check_schedule(Warmup(4, schedule=Cosine(10)), expected)
+
+
+def test_cosine():
+    """
+    Tests cosine annealing down to a minimum factor.
+    """
+    check_schedule(Cosine(10, min_factor=.1),
+                   lambda t: .1 + .9 * 0.5 * (1. + np.cos(
+                       np.pi * min(t / 10., 1.))))
+
+
+def test_step():
+    """
+    Tests step decay.
+    """
+    check_schedule(Step(3, decay_factor=.5),
+                   lambda t: .5 ** (t // 3))
+
+
+def test_exponential():
+    """
+    Tests exponential decay clipped to a minimum factor.
+    """
+    check_schedule(Exponential(.5, decay_steps=2, min_factor=.05),
+                   lambda t: max(.05, .5 ** (t / 2.)))
+
+
+def test_polynomial():
+    """
+    Tests polynomial decay down to an end factor.
+    """
+    check_schedule(Polynomial(10, power=2., end_factor=.2),
+                   lambda t: .2 + .8 * (1. - min(t / 10., 1.)) ** 2)
+
+
+def test_sgd_learning_rate_schedule():
+    """
+    Make sure that SGD uses the scheduled learning rate on each minibatch,
+    and that a scheduled momentum is taken into account.
+    """
+    shapes = [(1,), (9,), (8, 7)]
+    learning_rate = .01
+    num_batches = 7
+
+    cost = SumOfCosts([SumOfParams(), (0., DummyCost())])
+    dataset = ArangeDataset(num_batches)
+
+    model = DummyModel(shapes)
+    init_params = [param.get_value() for param in model.get_params()]
+    sgd = SGD(cost=cost,
+              learning_rate=learning_rate,
+              learning_rate_schedule=Step(2, decay_factor=.5),
+              learning_rule=Momentum(.5, momentum_schedule=Warmup(3)),
+              batch_size=1,
+              train_iteration_mode='sequential')
+    sgd.setup(model=model, dataset=dataset)
+    sgd.train(dataset=dataset)
+
+    # The gradient of SumOfParams is always 1.
+    vel = 0.
+    total = 0.
+    for t in range(num_batches):
+        momentum = .5 * min(t / 3., 1.)
+        vel = momentum * vel - learning_rate * .5 ** (t // 2)
+        total += vel
+
+    for init_param, param in zip(init_params, model.get_params()):
+        assert np.allclose(init_param + total, param.get_value())
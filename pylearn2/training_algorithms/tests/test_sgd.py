@@ -1933,5 +1933,156 @@ def test_uneven_batch_size():
         monitor_iteration_mode='even_sequential')
 
 
+def test_grad_accumulation():
+    """
+    Make sure that accumulating the gradients of several minibatches gives
+    the same parameters, and the same monitor counts, as using one large
+    minibatch.
+    """
+    dim = 3
+    m = 13
+
+    rng = np.random.RandomState([25, 9, 2012])
+
+    X = rng.randn(m, dim)
+
+    idx = rng.randint(0, dim, (m, ))
+    Y = np.zeros((m, dim))
+    for i in xrange(m):
+        Y[i, idx[i]] = 1
+
+    dataset = DenseDesignMatrix(X=X, y=Y)
+
+    def train_one_epoch(batch_size, grad_accumulation_steps):
+        model = SoftmaxModel(dim)
+        algorithm = SGD(1e-1, SupervisedDummyCost(),
+                        batch_size=batch_size,
+                        train_iteration_mode='sequential',
+                        learning_rule=Momentum(.5),
+                        grad_accumulation_steps=grad_accumulation_steps)
+        algorithm.setup(dataset=dataset, model=model)
+        algorithm.train(dataset)
+        algorithm.train(dataset)
+        return model
+
+    # Batches of 10 and 3 examples, in both cases.
+    large = train_one_epoch(10, 1)
+    accumulated = train_one_epoch(5, 2)
+
+    assert np.allclose(large.P.get_value(), accumulated.P.get_value())
+    assert (large.monitor.get_batches_seen() ==
+            accumulated.monitor.get_batches_seen() == 4)
+    assert (large.monitor.get_examples_seen() ==
+            accumulated.monitor.get_examples_seen() == 2 * m)
+
+
+class LogCost(DefaultDataSpecsMixin, Cost):
+    """
+    A cost whose gradient with respect to the parameters of a SoftmaxModel
+    is infinite on examples equal to 0.
+    """
+    def expr(self, model, data):
+        space, sources = self.get_data_specs(model)
+        space.validate(data)
+        return T.log(data).mean() * model.P.sum()
+
+
+def test_nonfinite_policy():
+    """
+    Make sure that each nonfinite_policy of SGD handles an update producing
+    infinite parameter values as documented.
+    """
+    X = np.array([[1.], [2.], [3.], [0.]])
+    dataset = DenseDesignMatrix(X=X)
+    learning_rate = 1e-2
+
+    def train_one_epoch(nonfinite_policy):
+        model = SoftmaxModel(1)
+        algorithm = SGD(learning_rate, LogCost(),
+                        batch_size=1,
+                        train_iteration_mode='sequential',
+                        nonfinite_policy=nonfinite_policy)
+        algorithm.setup(dataset=dataset, model=model)
+        init_P = model.P.get_value()
+        algorithm.train(dataset)
+        return init_P, model.P.get_value()
+
+    init_P, P = train_one_epoch('skip')
+    assert np.allclose(P, init_P - learning_rate * np.log(X[:3]).sum())
+
+    init_P, P = train_one_epoch('rollback')
+    assert np.allclose(P, init_P)
+
+    try:
+        train_one_epoch('halt')
+        assert False
+    except FloatingPointError:
+        pass
+
+
+class ModifiedGradientCost(SupervisedDummyCost):
+    """
+    A cost whose gradients are half those of its expression, plus a
+    constant term.
+    """
+    def get_gradients(self, model, data, **kwargs):
+        """
+        Returns half the gradients of the expression, plus .01.
+
+        Parameters
+        ----------
+        model : Model
+        data : tuple
+        kwargs : dict
+        """
+        grads, updates = super(ModifiedGradientCost, self).get_gradients(
+            model, data, **kwargs)
+        for param in grads:
+            grads[param] = .5 * grads[param] + np.cast[param.dtype](.01)
+        return grads, updates
+
+
+def test_loss_scale():
+    """
+    Make sure that scaling the loss does not change the updates, even with
+    the gradients of costs that are not those of their expression.
+    """
+    dim = 3
+    m = 10
+
+    rng = np.random.RandomState([25, 9, 2012])
+
+    X = rng.randn(m, dim)
+
+    idx = rng.randint(0, dim, (m, ))
+    Y = np.zeros((m, dim))
+    for i in xrange(m):
+        Y[i, idx[i]] = 1
+
+    dataset = DenseDesignMatrix(X=X, y=Y)
+
+    def train_one_epoch(cost, loss_scale):
+        model = SoftmaxModel(dim)
+        algorithm = SGD(1e-1, cost,
+                        batch_size=5,
+                        train_iteration_mode='sequential',
+                        learning_rule=Momentum(.5),
+                        loss_scale=loss_scale)
+        algorithm.setup(dataset=dataset, model=model)
+        algorithm.train(dataset)
+        return model.P.get_value()
+
+    for cost in [SupervisedDummyCost(), ModifiedGradientCost(),
+                 SumOfCosts([SupervisedDummyCost(), ModifiedGradientCost()])]:
+        assert np.allclose(train_one_epoch(cost, None),
+                           train_one_epoch(cost, 1024.))
+
+    try:
+        SGD(1e-1, loss_scale=0.)
+        assert False
+    except ValueError:
+        pass
+
+
 if __name__ == '__main__':
     test_monitor_based_lr()
@@ -384,8 +384,12 @@ def function(*args, **kwargs):
     A wrapper around theano.function that disables the on_unused_input error.
     Almost no part of pylearn2 can assume that an unused input is an error, so
     the default from theano is inappropriate for this project.
+
+    The optimized graphs are stored in, and loaded from, the function cache
+    when it is enabled; see `pylearn2.utils.function_cache`.
     """
-    return theano.function(*args, on_unused_input='ignore', **kwargs)
+    from pylearn2.utils.function_cache import cached_function
+    return cached_function(*args, on_unused_input='ignore', **kwargs)
 
 
 def grad(*args, **kwargs):
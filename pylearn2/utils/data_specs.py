@@ -3,6 +3,8 @@ Utilities for working with data format specifications.
 
 See :ref:`data_specs` for a high level overview of the relevant concepts.
 """
+import operator
+
 from pylearn2.space import CompositeSpace, NullSpace, Space
 from pylearn2.utils import safe_zip
 
@@ -28,6 +30,17 @@ class DataSpecsMapping(object):
     index in the flattened space.  Not sure if this one should
     be a member, or passed as a parameter to _fill_mapping. It
     might be us
+    nest_tuple : callable
+        Builds the nested tuple from a flat tuple of exactly
+        `n_unique_specs` elements. It is built from the mapping when
+        the mapping is built, so it does no recursion or type checks,
+        and is what `nest` uses for tuples.
+    flatten_tuple : callable
+        Returns the flat tuple of a nested tuple (not a Space) which has
+        exactly the structure of the data specs. Like `nest_tuple`, it
+        does no checks: when an element occurs more than once, its first
+        occurrence is used, and elements corresponding to NullSpaces are
+        ignored. Use `flatten` to have the nested tuple validated.
     """
     #might be useful to get the index of one data_specs later
     #but if it is not, then we should remove it.
@@ -42,6 +55,38 @@ class DataSpecsMapping(object):
         assert isinstance(space, Space), 'Given space: '+str(space)+\
                                          ' was not a instance of Space.'
         self.spec_mapping = self._fill_mapping(space, source)
+        self._build_functions()
+
+    def _build_functions(self):
+        """
+        Builds `nest_tuple` and `flatten_tuple` from the mapping.
+        """
+        self.nest_tuple = _make_nest_tuple(self.spec_mapping,
+                                           self.n_unique_specs)
+        self.flatten_tuple = _make_flatten_tuple(self.spec_mapping,
+                                                 self.n_unique_specs)
+
+    def __getstate__(self):
+        """
+        Returns the state of the mapping, without `nest_tuple` and
+        `flatten_tuple`, which are closures and cannot be pickled.
+        """
+        state = self.__dict__.copy()
+        state.pop('nest_tuple', None)
+        state.pop('flatten_tuple', None)
+        return state
+
+    def __setstate__(self, state):
+        """
+        Restores the state of the mapping, and builds its functions
+        again.
+
+        Parameters
+        ----------
+        state : dict
+        """
+        self.__dict__.update(state)
+        self._build_functions()
 
     def _fill_mapping(self, space, source):
         """
@@ -184,38 +229,6 @@ class DataSpecsMapping(object):
         elif isinstance(nested, Space):
             return CompositeSpace(rval)
 
-    def _make_nested_tuple(self, flat, mapping):
-        """
-        Auxiliary recursive function used by self.nest
-
-        Parameters
-        ----------
-        flat : WRITEME
-        mapping : WRITEME
-
-        Returns
-        -------
-        WRITEME
-        """
-        if mapping is None:
-            # The corresponding space was a NullSpace,
-            # and there is no corresponding value in flat,
-            # we use None as a placeholder
-            return None
-        if isinstance(mapping, int):
-            # We are at a leaf of the tree
-            idx = mapping
-            if isinstance(flat, tuple):
-                assert 0 <= idx < len(flat)
-                return flat[idx]
-            else:
-                assert idx == 0
-                return flat
-        else:
-            return tuple(
-                    self._make_nested_tuple(flat, sub_mapping)
-                    for sub_mapping in mapping)
-
     def _make_nested_space(self, flat, mapping):
         """
         Auxiliary recursive function used by self.nest
@@ -271,7 +284,163 @@ class DataSpecsMapping(object):
                 # flat is not iterable, this is valid only if spec_mapping
                 # contains only 0's, that is, when self.n_unique_specs == 1
                 assert self.n_unique_specs == 1
-            return self._make_nested_tuple(flat, self.spec_mapping)
+                flat = (flat,)
+            return self.nest_tuple(flat)
+
+
+def _tuple_getter(indices):
+    """
+    Returns a function getting some elements of a sequence as a tuple.
+
+    Parameters
+    ----------
+    indices : list of int
+
+    Returns
+    -------
+    getter : callable
+        Returns the tuple of the elements at `indices` of its argument.
+    """
+    if len(indices) == 0:
+        return lambda values: ()
+    if len(indices) == 1:
+        index, = indices
+        return lambda values: (values[index],)
+    return operator.itemgetter(*indices)
+
+
+def _nest_positions(mapping, n_unique, getters):
+    """
+    Plans the building of the nested tuple of a (sub-)mapping.
+
+    The nested tuple is built in a list holding the elements of the flat
+    tuple, then None (the placeholder of NullSpaces), then each sub-tuple
+    in the order of `getters`, which are applied to that list.
+
+    Parameters
+    ----------
+    mapping : None, int or tuple
+        A (sub-)mapping of a DataSpecsMapping.
+    n_unique : int
+        The number of elements of the flat tuple.
+    getters : list
+        Filled with the function building each sub-tuple, innermost
+        first.
+
+    Returns
+    -------
+    position : int
+        The position of the value corresponding to `mapping` in the list.
+    """
+    if mapping is None:
+        return n_unique
+    if isinstance(mapping, int):
+        return mapping
+    indices = [_nest_positions(sub_mapping, n_unique, getters)
+               for sub_mapping in mapping]
+    getters.append(_tuple_getter(indices))
+    return n_unique + len(getters)
+
+
+def _make_nest_tuple(mapping, n_unique):
+    """
+    Returns the function building the nested tuple of a mapping from a
+    flat tuple.
+
+    Parameters
+    ----------
+    mapping : None, int or tuple
+        The mapping of a DataSpecsMapping.
+    n_unique : int
+        The number of elements of the flat tuple.
+
+    Returns
+    -------
+    nest_tuple : callable
+    """
+    getters = []
+    root = _nest_positions(mapping, n_unique, getters)
+    if not getters:
+        if mapping is None:
+            return lambda flat: None
+        return operator.itemgetter(root)
+    if len(getters) == 1 and None not in mapping:
+        # The usual case of a flat CompositeSpace
+        return getters[0]
+
+    def nest_tuple(flat):
+        values = list(flat)
+        values.append(None)
+        for getter in getters:
+            values.append(getter(values))
+        return values[root]
+    return nest_tuple
+
+
+def _fill_paths(mapping, path, paths):
+    """
+    Finds where each element of a flat tuple first occurs in the nested
+    tuple.
+
+    Parameters
+    ----------
+    mapping : None, int or tuple
+        A (sub-)mapping of a DataSpecsMapping.
+    path : tuple
+        The indices of the sub-tuple corresponding to `mapping` in the
+        nested tuple, e.g. (1, 0).
+    paths : dict
+        Filled with the path of the first occurrence of each index of the
+        flat tuple.
+    """
+    if mapping is None:
+        return
+    if isinstance(mapping, int):
+        paths.setdefault(mapping, path)
+        return
+    for i, sub_mapping in enumerate(mapping):
+        _fill_paths(sub_mapping, path + (i,), paths)
+
+
+def _make_flatten_tuple(mapping, n_unique):
+    """
+    Returns the function getting the flat tuple of a nested tuple.
+
+    Parameters
+    ----------
+    mapping : None, int or tuple
+        The mapping of a DataSpecsMapping.
+    n_unique : int
+        The number of elements of the flat tuple.
+
+    Returns
+    -------
+    flatten_tuple : callable
+    """
+    paths = {}
+    _fill_paths(mapping, (), paths)
+    paths = [paths[i] for i in range(n_unique)]
+    if all(len(path) == 1 for path in paths):
+        # The usual case of a flat CompositeSpace
+        return _tuple_getter([path[0] for path in paths])
+
+    # The values are got in a list holding the nested tuple, then each
+    # sub-tuple or element on the paths, got from one before it
+    steps = []
+    positions = {(): 0}
+    for path in paths:
+        for depth in range(1, len(path) + 1):
+            if path[:depth] not in positions:
+                steps.append((positions[path[:depth - 1]], path[depth - 1]))
+                positions[path[:depth]] = len(steps)
+    getter = _tuple_getter([positions[path] for path in paths])
+
+    def flatten_tuple(nested):
+        values = [nested]
+        for position, index in steps:
+            values.append(values[position][index])
+        return getter(values)
+    return flatten_tuple
 
 
 def is_flat_space(space):
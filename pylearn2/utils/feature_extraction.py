@@ -0,0 +1,355 @@
+"""
+Applies a Block or a Model to a whole dataset, writing the outputs to disk.
+
+The examples are split into chunks, which are processed by a pool of forked
+worker processes, each compiling its own theano function. The outputs are
+written directly into a preallocated .npy memmap, or into an HDF5 file by
+the parent process, since HDF5 files can not safely be written to
+concurrently.
+Every chunk that has been written is recorded in a progress file next to
+the output, so that an interrupted extraction can be resumed by calling
+`extract_features` again with the same arguments.
+"""
+import logging
+import os
+import time
+
+import numpy as np
+import theano
+from theano.compat.six.moves import xrange
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+from pylearn2.blocks import Block
+from pylearn2.space import Conv2DSpace
+from pylearn2.utils.forked_pool import ForkedPool
+
+
+logger = logging.getLogger(__name__)
+
+
+def is_hdf5_path(path):
+    """
+    Returns whether the outputs should be written to an HDF5 file.
+
+    Parameters
+    ----------
+    path : str
+        Path of the output file.
+
+    Returns
+    -------
+    rval : bool
+        True if `path` has an HDF5 extension.
+    """
+    return os.path.splitext(path)[1] in ['.h5', '.hdf5']
+
+
+def compile_transform(transformer):
+    """
+    Compiles a theano function applying a Block or a Model to a batch.
+
+    Parameters
+    ----------
+    transformer : Block or Model
+        Blocks are applied with `Block.function`, Models with `fprop`.
+
+    Returns
+    -------
+    fn : callable
+        Maps a batch in the input format of `transformer` to its output.
+    """
+    if isinstance(transformer, Block):
+        return transformer.function('extract_features')
+    X = transformer.get_input_space().make_theano_batch()
+    return theano.function([X], transformer.fprop(X),
+                           name='extract_features')
+
+
+def format_batch(transformer, dataset, batch):
+    """
+    Converts a batch of rows of the design matrix of `dataset` to the input
+    format of `transformer`.
+
+    Parameters
+    ----------
+    transformer : Block or Model
+        The transformer, whose input space is used if it is a Model with a
+        topological input.
+    dataset : Dataset
+        The dataset the batch comes from.
+    batch : numpy.ndarray
+        Rows of the design matrix.
+
+    Returns
+    -------
+    batch : numpy.ndarray
+        The batch, ready to be passed to the function returned by
+        `compile_transform`.
+    """
+    batch = np.cast[theano.config.floatX](batch)
+    if isinstance(transformer, Block):
+        return batch
+    input_space = transformer.get_input_space()
+    if isinstance(input_space, Conv2DSpace):
+        view_converter = dataset.view_converter
+        topo = view_converter.design_mat_to_topo_view(batch)
+        space = Conv2DSpace(shape=view_converter.shape[:2],
+                            num_channels=view_converter.shape[2],
+                            axes=view_converter.axes)
+        return space.np_format_as(topo, input_space)
+    return batch
+
+
+def _transform_chunk(job, start, stop):
+    """
+    Applies the transformer of an extraction job to a chunk of examples.
+
+    Parameters
+    ----------
+    job : dict
+        The extraction job. The function it applies is compiled the first
+        time, in each process.
+    start, stop : int
+        Range of the examples of the chunk.
+
+    Returns
+    -------
+    output : numpy.ndarray
+        The outputs for the examples of the chunk.
+    """
+    if job['fn'] is None:
+        job['fn'] = compile_transform(job['transformer'])
+    X = job['X']
+    outputs = []
+    for i in xrange(start, stop, job['batch_size']):
+        batch = X[i:min(i + job['batch_size'], stop)]
+        batch = format_batch(job['transformer'], job['dataset'], batch)
+        output = job['fn'](batch)
+        outputs.append(output.reshape((output.shape[0], -1)))
+    return np.concatenate(outputs)
+
+
+def _extract_chunk(job, bounds):
+    """
+    Processes a chunk of examples, possibly in a worker process. When
+    writing to a .npy file, the outputs are written directly into it.
+
+    Parameters
+    ----------
+    job : dict
+        The extraction job.
+    bounds : tuple
+        Range (start, stop) of the examples of the chunk.
+
+    Returns
+    -------
+    bounds : tuple
+        The range of the chunk.
+    output : numpy.ndarray or None
+        The outputs, if they have to be written by the parent process.
+    """
+    start, stop = bounds
+    output = _transform_chunk(job, start, stop)
+    if job['hdf5']:
+        return bounds, output
+    features = np.load(job['output_path'], mmap_mode='r+')
+    features[start:stop] = output
+    features.flush()
+    del features
+    return bounds, None
+
+
+def _read_progress(progress_path):
+    """
+    Returns the chunks recorded as done in a progress file.
+
+    Parameters
+    ----------
+    progress_path : str
+        Path of the progress file.
+
+    Returns
+    -------
+    done : set
+        Set of (start, stop) ranges.
+    """
+    done = set()
+    if os.path.exists(progress_path):
+        with open(progress_path) as f:
+            for line in f:
+                fields = line.split()
+                # The last line may be truncated if the job was killed
+                if len(fields) == 2:
+                    done.add((int(fields[0]), int(fields[1])))
+    return done
+
+
+def _output_matches(output_path, hdf5, hdf5_key, shape, dtype):
+    """
+    Returns whether an existing output file has the shape and dtype of the
+    outputs, so that an extraction can be resumed into it.
+
+    Parameters
+    ----------
+    output_path : str
+        Path of the output.
+    hdf5 : bool
+        Whether the output is an HDF5 file.
+    hdf5_key : str
+        Name of the HDF5 dataset holding the outputs.
+    shape : tuple
+        Shape of all the outputs.
+    dtype : numpy.dtype
+        Dtype of the outputs.
+
+    Returns
+    -------
+    rval : bool
+    """
+    try:
+        if hdf5:
+            with h5py.File(output_path, 'r') as h5_file:
+                if hdf5_key not in h5_file:
+                    return False
+                features = h5_file[hdf5_key]
+                return (features.shape == shape and
+                        features.dtype == dtype)
+        features = np.load(output_path, mmap_mode='r')
+        return features.shape == shape and features.dtype == dtype
+    except (IOError, ValueError):
+        return False
+
+
+def extract_features(transformer, dataset, output_path, batch_size=1000,
+                     chunk_size=10000, num_workers=1, hdf5_key='features'):
+    """
+    Applies a Block or a Model to all the examples of a dataset and writes
+    the outputs, one row per example, to a .npy or an HDF5 file.
+
+    Parameters
+    ----------
+    transformer : Block or Model
+        The transformation to apply. Blocks are applied with
+        `Block.function`, Models with `fprop`. Outputs with more than two
+        dimensions are flattened.
+    dataset : DenseDesignMatrix
+        The dataset, whose design matrix may be a memmap or an HDF5
+        dataset.
+    output_path : str
+        Path of the output. Files ending in .h5 or .hdf5 are written with
+        h5py, others as .npy files.
+    batch_size : int, optional
+        Number of examples per call to the compiled function.
+    chunk_size : int, optional
+        Number of examples processed by a worker at a time. Progress is
+        checkpointed after each chunk.
+    num_workers : int, optional
+        Number of worker processes. With 1, the chunks are processed in
+        the calling process. Workers rely on being forked, so they should
+        not be used with a GPU.
+    hdf5_key : str, optional
+        Name of the HDF5 dataset to write the outputs to.
+
+    Returns
+    -------
+    examples_per_second : float
+        Throughput of the extraction, not counting the chunks done by a
+        previous run.
+
+    Notes
+    -----
+    An existing output is only resumed if it has the shape and dtype of the
+    outputs of the transformer on the dataset. Otherwise, it is
+    overwritten.
+    """
+    hdf5 = is_hdf5_path(output_path)
+    if hdf5 and h5py is None:
+        raise RuntimeError("Could not import h5py.")
+
+    X = dataset.get_design_matrix()
+    num_examples = X.shape[0]
+    progress_path = output_path + '.progress'
+    chunks = [(start, min(start + chunk_size, num_examples))
+              for start in xrange(0, num_examples, chunk_size)]
+    if os.path.exists(output_path):
+        done = _read_progress(progress_path)
+    else:
+        done = set()
+    job = {'transformer': transformer,
+           'dataset': dataset,
+           'X': X,
+           'batch_size': batch_size,
+           'output_path': output_path,
+           'hdf5': hdf5,
+           'fn': None}
+    if len(done) > 0 and num_examples > 0:
+        # Only resume into an output of the shape and dtype of the outputs
+        # of this dataset and transformer
+        output = _transform_chunk(job, 0, 1)
+        shape = (num_examples, output.shape[1])
+        if not _output_matches(output_path, hdf5, hdf5_key, shape,
+                               output.dtype):
+            logger.warning('%s does not hold outputs of shape %s and dtype '
+                           '%s, starting over', output_path, shape,
+                           output.dtype)
+            done = set()
+    pending = [chunk for chunk in chunks if chunk not in done]
+    if len(done) > 0:
+        logger.info('resuming feature extraction: %d of %d chunks done',
+                    len(chunks) - len(pending), len(chunks))
+    if len(pending) == 0:
+        return 0.
+
+    h5_file = None
+    t0 = time.time()
+    num_done = 0
+    try:
+        if len(done) == 0:
+            # The first chunk gives the shape of the output
+            start, stop = pending.pop(0)
+            output = _transform_chunk(job, start, stop)
+            shape = (num_examples, output.shape[1])
+            if hdf5:
+                h5_file = h5py.File(output_path, 'w')
+                h5_file.create_dataset(hdf5_key, shape=shape,
+                                       dtype=output.dtype)
+                h5_file[hdf5_key][start:stop] = output
+                h5_file.flush()
+            else:
+                features = np.lib.format.open_memmap(output_path, mode='w+',
+                                                     dtype=output.dtype,
+                                                     shape=shape)
+                features[start:stop] = output
+                features.flush()
+                del features
+            with open(progress_path, 'w') as progress:
+                progress.write('%d %d\n' % (start, stop))
+            num_done += stop - start
+        elif hdf5:
+            h5_file = h5py.File(output_path, 'r+')
+
+        if num_workers > 1:
+            # Each worker compiles its own function
+            job['fn'] = None
+
+        with ForkedPool(lambda chunk: _extract_chunk(job, chunk),
+                        num_workers) as pool:
+            with open(progress_path, 'a') as progress:
+                for (start, stop), output in pool.imap_unordered(pending):
+                    if hdf5:
+                        h5_file[hdf5_key][start:stop] = output
+                        h5_file.flush()
+                    progress.write('%d %d\n' % (start, stop))
+                    progress.flush()
+                    num_done += stop - start
+                    logger.info('extracted features for %d more examples, '
+                                '%.1f examples / s', num_done,
+                                num_done / max(time.time() - t0, 1e-6))
+    finally:
+        if h5_file is not None:
+            h5_file.close()
+
+    return num_done / max(time.time() - t0, 1e-6)
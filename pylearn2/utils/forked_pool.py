@@ -0,0 +1,114 @@
+"""
+Maps a function over tasks in worker processes that are forked from the
+caller, so that they inherit the function and everything it refers to
+(datasets, compiled theano functions, ...) instead of receiving pickled
+copies. Only the tasks and the results are pickled.
+
+This requires the 'fork' start method of multiprocessing, so it is not
+available on Windows, and should not be used once a GPU context exists.
+"""
+import multiprocessing
+
+
+# Function mapped by the workers of the current ForkedPool, which they
+# inherit when they are forked
+_forked_fn = None
+
+
+def _call(task):
+    """
+    Applies the function of the current ForkedPool to a task, in a worker
+    process.
+
+    Parameters
+    ----------
+    task : object
+        An item of the tasks given to `ForkedPool.map`.
+
+    Returns
+    -------
+    result : object
+        What the function returns.
+    """
+    return _forked_fn(task)
+
+
+class ForkedPool(object):
+    """
+    A pool of forked worker processes applying the same function to tasks.
+    It is used as a context manager, which terminates the workers on exit.
+
+    Only one pool can be open at a time in a process.
+
+    Parameters
+    ----------
+    fn : callable
+        The function applied to each task. It is not pickled, so it can be
+        a closure or a bound method.
+    num_workers : int
+        Number of worker processes. With 1 or less, the tasks are
+        processed in the calling process.
+    """
+
+    def __init__(self, fn, num_workers):
+        self.fn = fn
+        self.num_workers = num_workers
+        self._pool = None
+
+    def __enter__(self):
+        global _forked_fn
+        if self.num_workers > 1:
+            if _forked_fn is not None:
+                raise RuntimeError("Another ForkedPool is already open.")
+            _forked_fn = self.fn
+            try:
+                self._pool = multiprocessing.Pool(self.num_workers)
+            except Exception:
+                _forked_fn = None
+                raise
+        return self
+
+    def __exit__(self, *exc_info):
+        global _forked_fn
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+            _forked_fn = None
+
+    def map(self, tasks):
+        """
+        Applies the function to every task.
+
+        Parameters
+        ----------
+        tasks : list
+            Picklable tasks.
+
+        Returns
+        -------
+        results : list
+            The result of each task, in the order of the tasks.
+        """
+        if self._pool is None:
+            return [self.fn(task) for task in tasks]
+        return self._pool.map(_call, tasks)
+
+    def imap_unordered(self, tasks):
+        """
+        Applies the function to every task, yielding the results as they
+        are ready.
+
+        Parameters
+        ----------
+        tasks : list
+            Picklable tasks.
+
+        Returns
+        -------
+        results : iterator
+            The result of each task, in the order in which they are done.
+        """
+        if self._pool is None:
+            return (self.fn(task) for task in tasks)
+        return self._pool.imap_unordered(_call, tasks)
@@ -0,0 +1,594 @@
+"""
+An opt-in, persistent cache of compiled theano functions.
+
+Graph optimization dominates the compilation time of large models, and is
+repeated by every run of a job. When a cache directory is set, with
+`set_cache_directory` or the PYLEARN2_FUNCTION_CACHE environment variable,
+`cached_function` stores the optimized graph of every function it compiles,
+keyed by a canonical hash of the unoptimized graph, of its input types and
+of the optimizer configuration. Later runs building an identical or
+structurally identical graph (the same operations on variables of the
+same types, whatever their names or the values of the shared variables)
+load the optimized graph and only link it, skipping the optimization.
+
+The shared variables of the cached graph are replaced by those of the
+graph being compiled, so the loaded functions update the parameters of
+the current model. Functions compiled with a mode object, rather than a
+mode name, are never cached, since the mode may record or profile the
+optimization.
+
+Independently of the cache directory, the most recently used optimized
+graphs can also be kept in memory, with `set_in_process_cache`, so that
+structurally identical functions compiled by the same job (e.g. the
+monitor's functions for each monitoring dataset) are optimized only once.
+The time spent compiling the most recent functions is recorded, see
+`get_compile_times`.
+"""
+from collections import deque
+import hashlib
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import theano
+from theano import config
+from theano.compat import six
+from theano.compat.six.moves import cPickle
+from theano.compile import Mode, get_mode
+from theano.compile.pfunc import pfunc, rebuild_collect_shared
+from theano.gof import Constant, Variable
+from theano.gof.graph import clone_get_equiv, io_toposort
+
+from pylearn2.compat import OrderedDict
+
+
+logger = logging.getLogger(__name__)
+
+_cache_directory = None
+
+# Maximum number of optimized graphs kept in memory, 0 when disabled, and
+# the graphs kept, the least recently used first
+_in_process = 0
+_memory = OrderedDict()
+
+# (name, seconds, source) of the most recent calls of cached_function, and
+# the number of calls so far
+_compile_times = deque(maxlen=1000)
+_num_calls = 0
+
+
+def set_cache_directory(path):
+    """
+    Sets the directory in which `cached_function` stores the compiled
+    functions, overriding the PYLEARN2_FUNCTION_CACHE environment variable.
+
+    Parameters
+    ----------
+    path : str or None
+        The directory, created if needed. None disables the cache, unless
+        the environment variable is set.
+    """
+    global _cache_directory
+    _cache_directory = path
+
+
+def get_cache_directory():
+    """
+    Returns the directory of the function cache.
+
+    Returns
+    -------
+    path : str or None
+        The directory set by `set_cache_directory` or the
+        PYLEARN2_FUNCTION_CACHE environment variable, or None if the cache
+        is disabled.
+    """
+    if _cache_directory is not None:
+        return _cache_directory
+    return os.environ.get('PYLEARN2_FUNCTION_CACHE') or None
+
+
+def set_in_process_cache(enabled, max_entries=100):
+    """
+    Enables or disables the reuse of optimized graphs within a process,
+    which is disabled by default.
+
+    Parameters
+    ----------
+    enabled : bool
+        If False, the optimized graphs kept in memory are dropped, and
+        only the cache directory, if any, is used.
+    max_entries : int, optional
+        Number of optimized graphs kept in memory. The least recently used
+        ones are dropped first.
+    """
+    global _in_process
+    _in_process = max_entries if enabled else 0
+    _memory.clear()
+
+
+def _remember(key, entry):
+    """
+    Keeps an optimized graph in memory, if enabled, as the most recently
+    used one.
+
+    Parameters
+    ----------
+    key : str
+    entry : dict
+    """
+    if not _in_process:
+        return
+    _memory.pop(key, None)
+    _memory[key] = entry
+    while len(_memory) > _in_process:
+        _memory.popitem(last=False)
+
+
+def get_compile_count():
+    """
+    Returns the number of calls of `cached_function` so far, which can be
+    passed to `get_compile_times` to get the times of the later calls.
+
+    Returns
+    -------
+    count : int
+    """
+    return _num_calls
+
+
+def get_compile_times(start=0):
+    """
+    Returns the time taken by the calls of `cached_function`. Only the most
+    recent calls are recorded.
+
+    Parameters
+    ----------
+    start : int, optional
+        Number of calls to skip, as returned by `get_compile_count`.
+
+    Returns
+    -------
+    compile_times : list
+        A (name, seconds, source) tuple for each call still recorded, in
+        order. `source` is 'memory' or 'disk' when the optimized graph was
+        reused, and 'compiled' when the function was optimized.
+    """
+    first = _num_calls - len(_compile_times)
+    return list(_compile_times)[max(start - first, 0):]
+
+
+def summarize_compile_times(compile_times):
+    """
+    Returns a one-line summary of compile times.
+
+    Parameters
+    ----------
+    compile_times : list
+        Items of the list returned by `get_compile_times`.
+
+    Returns
+    -------
+    summary : str
+    """
+    total = sum(seconds for _, seconds, _ in compile_times)
+    reused = sum(source != 'compiled' for _, _, source in compile_times)
+    return ('%d functions in %.2f s, %d of which reused an optimized graph'
+            % (len(compile_times), total, reused))
+
+
+def _op_key(op):
+    """
+    Returns a string describing an op and its parameters.
+
+    Parameters
+    ----------
+    op : theano Op
+
+    Returns
+    -------
+    key : str
+    """
+    cls = type(op)
+    key = '%s.%s %s' % (cls.__module__, cls.__name__, op)
+    props = getattr(op, '__props__', None)
+    if props:
+        key += ' %r' % (tuple(str(getattr(op, prop)) for prop in props),)
+    # Ops with an inner graph, such as Scan and OpFromGraph
+    inner_inputs = getattr(op, 'inputs', None)
+    inner_outputs = getattr(op, 'outputs', None)
+    if (isinstance(inner_inputs, (list, tuple)) and
+            isinstance(inner_outputs, (list, tuple)) and
+            all(isinstance(v, Variable)
+                for v in list(inner_inputs) + list(inner_outputs))):
+        key += ' {%s}' % _graph_description(inner_inputs, inner_outputs)
+        info = getattr(op, 'info', None)
+        if isinstance(info, dict):
+            key += ' %r' % sorted((k, str(v)) for k, v in info.items())
+    return key
+
+
+def _constant_key(constant):
+    """
+    Returns a string describing the type and the value of a constant.
+
+    Parameters
+    ----------
+    constant : theano Constant
+
+    Returns
+    -------
+    key : str
+    """
+    data = constant.data
+    if isinstance(data, (np.ndarray, np.number)):
+        data = np.asarray(data)
+        value = '%s%s:%s' % (data.dtype, data.shape,
+                             hashlib.md5(data.tostring()).hexdigest())
+    else:
+        value = repr(data)
+    return 'constant %s %s' % (constant.type, value)
+
+
+def _graph_description(inputs, outputs):
+    """
+    Returns a canonical description of a graph, which does not depend on
+    the names or the identities of its variables.
+
+    Parameters
+    ----------
+    inputs : list of theano variables
+    outputs : list of theano variables
+
+    Returns
+    -------
+    description : str
+    """
+    ids = {}
+    lines = []
+
+    def get_id(var):
+        if var not in ids:
+            if not isinstance(var, Constant):
+                raise ValueError("%s is not an input of the graph." % var)
+            ids[var] = 'c%d' % len(ids)
+            lines.append('%s = %s' % (ids[var], _constant_key(var)))
+        return ids[var]
+
+    for i, var in enumerate(inputs):
+        ids[var] = 'i%d' % i
+        lines.append('%s = input %s' % (ids[var], var.type))
+    for node in io_toposort(list(inputs), list(outputs)):
+        args = ', '.join(get_id(var) for var in node.inputs)
+        for var in node.outputs:
+            ids[var] = 'v%d' % len(ids)
+        lines.append('%s = %s(%s) %s' % (
+            ', '.join(ids[var] for var in node.outputs), _op_key(node.op),
+            args, ', '.join(str(var.type) for var in node.outputs)))
+    lines.append('outputs %s' % ', '.join(get_id(var) for var in outputs))
+    return '\n'.join(lines)
+
+
+def graph_key(inputs, outputs, mode=None):
+    """
+    Returns the cache key of a graph: a hash of its canonical description,
+    of the optimizer configuration and of the versions of theano and
+    python.
+
+    Parameters
+    ----------
+    inputs : list of theano variables
+        The inputs of the graph, including its shared variables.
+    outputs : list of theano variables
+        The outputs of the graph, including the update expressions.
+    mode : str, optional
+        Name of the compilation mode.
+
+    Returns
+    -------
+    key : str
+    """
+    description = [_graph_description(inputs, outputs),
+                   str(mode), config.mode, config.linker, config.optimizer,
+                   config.optimizer_including, config.optimizer_excluding,
+                   config.device, config.floatX, theano.__version__,
+                   sys.version]
+    return hashlib.sha1('\n'.join(description).encode('utf-8')).hexdigest()
+
+
+def _load(path):
+    """
+    Loads a cache entry.
+
+    Parameters
+    ----------
+    path : str
+
+    Returns
+    -------
+    entry : dict or None
+        The entry, or None if it does not exist or can not be read.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return cPickle.load(f)
+    except Exception as e:
+        logger.warning('could not read the function cache entry %s: %s',
+                       path, e)
+        return None
+
+
+def _save(path, entry):
+    """
+    Saves a cache entry atomically, so that concurrent jobs never read a
+    partially written entry.
+
+    Parameters
+    ----------
+    path : str
+    entry : dict
+    """
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # Created by a concurrent job
+            pass
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            cPickle.dump(entry, f, protocol=cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, path)
+    except Exception as e:
+        logger.warning('could not write the function cache entry %s: %s',
+                       path, e)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _make_entry(fn, inputs, shared_inputs, num_outputs):
+    """
+    Extracts the optimized graph of a compiled function, detached from
+    its shared variables.
+
+    Parameters
+    ----------
+    fn : theano Function
+    inputs : list of theano variables
+        The explicit inputs of the function.
+    shared_inputs : list of theano shared variables
+        Its shared variables, in the order of `rebuild_collect_shared`.
+    num_outputs : int
+        The number of outputs, excluding the updates.
+
+    Returns
+    -------
+    entry : dict or None
+        None if the graph of the function can not be matched with its
+        inputs.
+    """
+    fgraph = fn.maker.fgraph
+    roles = []
+    updated = []
+    for i, spec in enumerate(fn.maker.inputs):
+        if spec.implicit:
+            if spec.variable not in shared_inputs:
+                return None
+            roles.append(('shared', shared_inputs.index(spec.variable)))
+            if spec.update is not None:
+                updated.append(roles[-1][1])
+        elif i < len(inputs) and spec.variable is inputs[i]:
+            roles.append(('input', i))
+        else:
+            return None
+    if (len(fgraph.inputs) != len(roles) or
+            len(fgraph.outputs) != num_outputs + len(updated)):
+        return None
+    memo = dict((var, var.type()) for var in fgraph.inputs)
+    equiv = clone_get_equiv(fgraph.inputs, fgraph.outputs, memo=memo)
+    return {'inputs': [equiv[var] for var in fgraph.inputs],
+            'outputs': [equiv[var] for var in fgraph.outputs],
+            'roles': roles,
+            'updated': updated}
+
+
+def _function_from_entry(entry, inputs, shared_inputs, outputs, mode, name,
+                         **kwargs):
+    """
+    Links the optimized graph of a cache entry, for the given inputs and
+    shared variables, without optimizing it again.
+
+    Parameters
+    ----------
+    entry : dict
+        As returned by `_make_entry`.
+    inputs : list of theano variables
+        The explicit inputs of the function.
+    shared_inputs : list of theano shared variables
+        Its shared variables, in the order of `rebuild_collect_shared`.
+    outputs : theano variable, list of theano variables or None
+        The outputs requested, which only determine whether the function
+        returns a list.
+    mode : str or None
+        Name of the compilation mode, whose linker is used.
+    name : str or None
+        Name of the function.
+    kwargs : dict
+        Other arguments of `pfunc`.
+
+    Returns
+    -------
+    fn : theano Function or None
+        None if the entry does not match the inputs.
+    """
+    replace = []
+    for cached, (role, i) in zip(entry['inputs'], entry['roles']):
+        if role == 'input':
+            if i >= len(inputs):
+                return None
+            var = inputs[i]
+        else:
+            if i >= len(shared_inputs):
+                return None
+            var = shared_inputs[i]
+        if cached.type != var.type:
+            return None
+        replace.append((cached, var))
+    cloned = theano.clone(entry['outputs'], replace=replace)
+    num_outputs = len(cloned) - len(entry['updated'])
+    fn_outputs = cloned[:num_outputs]
+    if outputs is not None and not isinstance(outputs, (list, tuple)):
+        fn_outputs, = fn_outputs
+    updates = [(shared_inputs[i], update)
+               for i, update in zip(entry['updated'], cloned[num_outputs:])]
+    linker = get_mode(mode).linker
+    return pfunc(inputs, fn_outputs, mode=Mode(linker=linker, optimizer=None),
+                 updates=updates, no_default_updates=True,
+                 accept_inplace=True, name=name, **kwargs)
+
+
+def cached_function(inputs, outputs=None, mode=None, updates=None,
+                    givens=None, name=None, **kwargs):
+    """
+    A replacement for `theano.function` that stores and reuses optimized
+    graphs.
+
+    If enabled with `set_in_process_cache`, the optimized graphs of the
+    most recent functions are kept in memory, so that structurally
+    identical functions, such as the accumulation functions of the monitor
+    for datasets of different sizes, are optimized once. When the function
+    cache directory is set, the optimized graphs are also stored there for
+    later runs.
+
+    The time taken by each call is recorded, see `get_compile_times`.
+
+    Parameters
+    ----------
+    inputs : list of theano variables
+        The explicit inputs.
+    outputs : theano variable or list of theano variables, optional
+        The outputs.
+    mode : str or Mode, optional
+        The compilation mode. Functions compiled with a Mode object are
+        not cached.
+    updates : OrderedDict or list of pairs, optional
+        Updates of shared variables.
+    givens : OrderedDict or list of pairs, optional
+        Substitutions made in the graph before compiling it.
+    name : str, optional
+        Name of the function, used in the logs.
+    kwargs : dict
+        Other arguments of `theano.function`. Only `on_unused_input` and
+        `allow_input_downcast` are supported with the cache.
+
+    Returns
+    -------
+    fn : theano Function
+    """
+    global _num_calls
+    t0 = time.time()
+    fn, source = _cached_function(inputs, outputs, mode, updates, givens,
+                                  name, **kwargs)
+    _compile_times.append((name, time.time() - t0, source))
+    _num_calls += 1
+    return fn
+
+
+def _cached_function(inputs, outputs, mode, updates, givens, name,
+                     **kwargs):
+    """
+    Implements `cached_function`.
+
+    Parameters
+    ----------
+    inputs : list of theano variables
+    outputs : theano variable or list of theano variables
+    mode : str or Mode
+    updates : OrderedDict or list of pairs
+    givens : OrderedDict or list of pairs
+    name : str
+    kwargs : dict
+        See `cached_function`.
+
+    Returns
+    -------
+    fn : theano Function
+    source : str
+        'memory' or 'disk' if the optimized graph was reused, 'compiled'
+        otherwise.
+    """
+    directory = get_cache_directory()
+    if ((directory is None and not _in_process) or
+            not (mode is None or isinstance(mode, six.string_types)) or
+            set(kwargs) - set(['on_unused_input', 'allow_input_downcast']) or
+            not all(isinstance(var, Variable) for var in inputs) or
+            (outputs is not None and
+             not all(isinstance(var, Variable) for var in
+                     (outputs if isinstance(outputs, (list, tuple))
+                      else [outputs])))):
+        return theano.function(inputs, outputs, mode=mode, updates=updates,
+                               givens=givens, name=name,
+                               **kwargs), 'compiled'
+
+    inputs = list(inputs)
+    if outputs is None:
+        flat_outputs = []
+    elif isinstance(outputs, (list, tuple)):
+        flat_outputs = list(outputs)
+    else:
+        flat_outputs = [outputs]
+    _, cloned_outputs, other = rebuild_collect_shared(
+        flat_outputs, inputs, replace=givens, updates=updates,
+        rebuild_strict=True, copy_inputs_over=True)
+    update_d, shared_inputs = other[1], other[3]
+    graph_outputs = cloned_outputs + [update_d[var] for var in shared_inputs
+                                      if var in update_d]
+    try:
+        key = graph_key(inputs + shared_inputs, graph_outputs, mode)
+    except ValueError:
+        # The graph has missing inputs: let theano report it
+        return theano.function(inputs, outputs, mode=mode, updates=updates,
+                               givens=givens, name=name,
+                               **kwargs), 'compiled'
+
+    t0 = time.time()
+    for source in ['memory', 'disk']:
+        if source == 'memory':
+            entry = _memory.get(key)
+        elif directory is not None:
+            entry = _load(os.path.join(directory, key + '.pkl'))
+        else:
+            entry = None
+        if entry is not None:
+            fn = _function_from_entry(entry, inputs, shared_inputs, outputs,
+                                      mode, name, **kwargs)
+            if fn is not None:
+                logger.info('function cache hit in %s for %s (%s), linked '
+                            'in %.2f s', source, name, key, time.time() - t0)
+                _remember(key, entry)
+                if source == 'memory' and directory is not None:
+                    path = os.path.join(directory, key + '.pkl')
+                    if not os.path.exists(path):
+                        _save(path, entry)
+                return fn, source
+
+    fn = theano.function(inputs, outputs, mode=mode, updates=updates,
+                         givens=givens, name=name, **kwargs)
+    compile_time = time.time() - t0
+    entry = _make_entry(fn, inputs, shared_inputs, len(flat_outputs))
+    if entry is None:
+        logger.warning('could not cache %s: its compiled graph does not '
+                       'match its inputs', name)
+    else:
+        _remember(key, entry)
+        if directory is not None:
+            _save(os.path.join(directory, key + '.pkl'), entry)
+    logger.info('function cache miss for %s (%s), compiled in %.2f s',
+                name, key, compile_time)
+    return fn, 'compiled'
@@ -0,0 +1,116 @@
+"""
+Symbolic expressions shared by the functions compiled for a model.
+
+The training algorithm and the monitor each build symbolic batches for the
+data specs of the cost, and call `Cost.expr` on them, which builds the
+forward expression of the model. A `GraphCache` builds the symbolic batch
+of each (space, source) pair and the expression of each cost once, so that
+`SGD.setup` and the `Monitor.setup` it calls (for every monitoring dataset)
+work on the same graph instead of building their own copy.
+
+A cache should only live while the functions of a model are being set up:
+it does not notice changes of the model or of the costs.
+"""
+from pylearn2.utils.data_specs import DataSpecsMapping
+
+
+class GraphCache(object):
+    """
+    Builds symbolic batches and cost expressions once, and returns the
+    same variables to every caller asking for them again.
+    """
+
+    def __init__(self):
+        self._batches = {}
+        self._exprs = {}
+
+    def batch(self, space, source, name, batch_size=None):
+        """
+        Returns the symbolic batch of a (space, source) pair.
+
+        Parameters
+        ----------
+        space : Space
+            A non-composite space.
+        source : str
+            The source of the batch.
+        name : str
+            The name given to the batch if it is built.
+        batch_size : int, optional
+            Passed on to `space.make_theano_batch`. Only whether it is 1
+            matters, as it makes the batch broadcastable.
+
+        Returns
+        -------
+        batch : theano variable
+        """
+        key = (space, source, batch_size == 1)
+        try:
+            hash(key)
+        except TypeError:
+            return space.make_theano_batch(name=name, batch_size=batch_size)
+        if key not in self._batches:
+            self._batches[key] = space.make_theano_batch(
+                name=name, batch_size=batch_size)
+        return self._batches[key]
+
+    def batches(self, data_specs, name_format, batch_size=None):
+        """
+        Returns the symbolic batches of some data specs.
+
+        Parameters
+        ----------
+        data_specs : tuple
+            A (space, source) pair.
+        name_format : str
+            Format of the names of the batches that are built, formatted
+            with their source, e.g. 'SGD[%s]'.
+        batch_size : int, optional
+            See `batch`.
+
+        Returns
+        -------
+        flat : tuple
+            The batch of each unique (space, source) pair of the data specs.
+        nested : tuple or theano variable
+            The batches, with the structure of the data specs.
+        """
+        mapping = DataSpecsMapping(data_specs)
+        space_tuple = mapping.flatten(data_specs[0], return_tuple=True)
+        source_tuple = mapping.flatten(data_specs[1], return_tuple=True)
+        flat = tuple(self.batch(space, source, name_format % source,
+                                batch_size)
+                     for space, source in zip(space_tuple, source_tuple))
+        return flat, mapping.nest(flat)
+
+    def cost_expr(self, cost, model, data, **kwargs):
+        """
+        Returns the expression of a cost.
+
+        Parameters
+        ----------
+        cost : Cost
+        model : Model
+        data : theano variable or tuple
+            The symbolic data, in the data specs of the cost.
+        kwargs : dict
+            Fixed variables of the cost. Expressions using fixed variables
+            are built at every call.
+
+        Returns
+        -------
+        expr : theano variable or None
+            What `cost.expr(model, data, **kwargs)` returns.
+        """
+        if kwargs:
+            return cost.expr(model, data, **kwargs)
+        try:
+            key = (id(cost), data)
+            hash(key)
+        except TypeError:
+            return cost.expr(model, data)
+        if key not in self._exprs:
+            # The cost is kept with its expression, so that its id is not
+            # reused while the entry exists
+            self._exprs[key] = (cost, cost.expr(model, data))
+        return self._exprs[key][1]
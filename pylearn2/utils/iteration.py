@@ -705,6 +705,30 @@ def resolve_iterator_class(mode):
     return subset_iter_class
 
 
+def _take(data, index, axis):
+    """
+    Returns the examples of a batch.
+
+    Parameters
+    ----------
+    data : numpy.ndarray or other indexable
+        The data of a source.
+    index : slice or list
+        The examples of the batch, as returned by a `SubsetIterator`.
+    axis : int
+        The axis of `data` indexing the examples.
+
+    Returns
+    -------
+    batch : object
+        `data[index]` if `axis` is 0, otherwise a C-contiguous copy of
+        the examples.
+    """
+    if axis == 0:
+        return data[index]
+    return np.ascontiguousarray(data[(slice(None),) * axis + (index,)])
+
+
 class FiniteDatasetIterator(object):
     """
     A wrapper around subset iterators that actually retrieves
@@ -728,6 +752,12 @@ class FiniteDatasetIterator(object):
         A list of callables, in the same order as the sources
         in `data_specs`, that will be called on the individual
         source batches prior to any further processing.
+    layouts : list, optional
+        A list, in the same order as the sources in `data_specs`, of None
+        or (array, batch_axis) pairs. An array is served instead of the
+        data of the dataset for its source: it must already be laid out in
+        the requested space, and its batches are taken along `batch_axis`
+        without any conversion.
 
     Notes
     -----
@@ -736,7 +766,7 @@ class FiniteDatasetIterator(object):
     """
 
     def __init__(self, dataset, subset_iterator, data_specs=None,
-                 return_tuple=False, convert=None):
+                 return_tuple=False, convert=None, layouts=None):
         self._data_specs = data_specs
         self._dataset = dataset
         self._subset_iterator = subset_iterator
@@ -793,9 +823,20 @@ class FiniteDatasetIterator(object):
             assert len(convert) == len(source)
             self._convert = convert
 
+        self._batch_axes = [0 for s in source]
+        if layouts is not None:
+            assert len(layouts) == len(source)
+            raw_data = list(self._raw_data)
+            for i, layout in enumerate(layouts):
+                if layout is not None:
+                    raw_data[i], self._batch_axes[i] = layout
+            self._raw_data = tuple(raw_data)
+
         for i, (so, sp, dt) in enumerate(safe_izip(source,
                                                    sub_spaces,
                                                    self._raw_data)):
+            if layouts is not None and layouts[i] is not None:
+                continue
             idx = dataset_source.index(so)
             dspace = dataset_sub_spaces[idx]
 
@@ -812,19 +853,21 @@ class FiniteDatasetIterator(object):
                 # to lambda, in order to capture their current value,
                 # otherwise they would change in the next iteration
                 # of the loop.
+                # The conversion plan only validates the first batch.
+                plan = dspace.np_format_plan(sp)
                 if fn is None:
 
-                    def fn(batch, dspace=dspace, sp=sp):
+                    def fn(batch, plan=plan):
                         try:
-                              return dspace.np_format_as(batch, sp)
+                            return plan(batch)
                         except ValueError as e:
                             msg = str(e) + '\nMake sure that the model and '\
                                            'dataset have been initialized with '\
                                            'correct values.'
                             reraise_as(ValueError(msg))
                 else:
-                    fn = (lambda batch, dspace=dspace, sp=sp, fn_=fn:
-                          dspace.np_format_as(fn_(batch), sp))
+                    fn = (lambda batch, plan=plan, fn_=fn:
+                          plan(fn_(batch)))
 
             self._convert[i] = fn
 
@@ -855,8 +898,10 @@ class FiniteDatasetIterator(object):
         # using np.take()
 
         rval = tuple(
-            fn(data[next_index]) if fn else data[next_index]
-            for data, fn in safe_izip(self._raw_data, self._convert))
+            fn(_take(data, next_index, axis)) if fn else
+            _take(data, next_index, axis)
+            for data, fn, axis in safe_izip(self._raw_data, self._convert,
+                                            self._batch_axes))
         if not self._return_tuple and len(rval) == 1:
             rval, = rval
         return rval
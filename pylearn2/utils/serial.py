@@ -482,7 +482,8 @@ def read_bin_lush_matrix(filepath):
 
     return rval
 
-def load_train_file(config_file_path, environ=None):
+
+def load_train_file(config_file_path, environ=None, num_threads=1):
     """
     Loads and parses a yaml file for a Train object.
     Publishes the relevant training environment variables
@@ -497,6 +498,10 @@ def load_train_file(config_file_path, environ=None):
         environment variables when parsing the YAML file. If a key appears
         both in `os.environ` and this dictionary, the value in this
         dictionary is used.
+    num_threads : int, optional
+        Number of threads instantiating the independent objects of the
+        YAML file, such as the datasets, concurrently. See
+        `pylearn2.config.yaml_parse.load`.
 
 
     Returns
@@ -523,4 +528,5 @@ def load_train_file(config_file_path, environ=None):
     os.environ["PYLEARN2_TRAIN_BASE_NAME"] = config_file_path.split('/')[-1]
     os.environ["PYLEARN2_TRAIN_FILE_STEM"] = config_file_full_stem.split('/')[-1]
 
-    return yaml_parse.load_path(config_file_path, environ=environ)
+    return yaml_parse.load_path(config_file_path, environ=environ,
+                                num_threads=num_threads)
@@ -1,9 +1,9 @@
 """Tests for compilation utilities."""
+from theano.compat.six.moves import cPickle
 import theano.tensor as TT
 from nose.tools import assert_raises
 from pylearn2.utils.data_specs import DataSpecsMapping
-from pylearn2.space import VectorSpace, \
-        CompositeSpace
+from pylearn2.space import VectorSpace, CompositeSpace, NullSpace
 
 
 def assert_equal(a, b):
@@ -99,3 +99,48 @@ def test_input_validation():
     assert_raises(AssertionError,
                   DataSpecsMapping,
                   (('features', 'targets'), VectorSpace(dim=10)))
+
+
+def test_compiled_functions():
+    """
+    flatten_tuple and nest_tuple should agree with flatten and nest,
+    including with repeated specs and NullSpaces, and survive pickling.
+    """
+    space = CompositeSpace([VectorSpace(dim=3),
+                            CompositeSpace([NullSpace(), VectorSpace(dim=3),
+                                            VectorSpace(dim=7)]),
+                            VectorSpace(dim=3)])
+    source = ('features', ('', 'features', 'targets'), 'targets')
+    nested = ('x', (None, 'x', 'y'), 'z')
+    mapping = DataSpecsMapping((space, source))
+
+    flat = mapping.flatten(nested, return_tuple=True)
+    assert_equal(mapping.flatten_tuple(nested), flat)
+    assert_equal(mapping.nest_tuple(flat), nested)
+    assert_equal(mapping.nest(flat), nested)
+
+    mapping = cPickle.loads(cPickle.dumps(mapping))
+    assert_equal(mapping.flatten_tuple(nested), flat)
+    assert_equal(mapping.nest_tuple(flat), nested)
+
+    mapping = DataSpecsMapping((VectorSpace(dim=3), 'features'))
+    assert_equal(mapping.flatten_tuple('x'), ('x',))
+    assert_equal(mapping.nest('x'), 'x')
+    assert_equal(mapping.nest(('x',)), 'x')
+
+    space = CompositeSpace([CompositeSpace([CompositeSpace([
+        VectorSpace(dim=3)]), VectorSpace(dim=2)]), VectorSpace(dim=3)])
+    source = ((('features',), 'targets'), 'features')
+    nested = ((('x',), 'y'), 'x')
+    mapping = DataSpecsMapping((space, source))
+    assert_equal(mapping.flatten_tuple(nested), ('x', 'y'))
+    assert_equal(mapping.nest_tuple(('x', 'y')), nested)
+
+    mapping = DataSpecsMapping((CompositeSpace([VectorSpace(dim=3)]),
+                                ('features',)))
+    assert_equal(mapping.flatten_tuple(('x',)), ('x',))
+    assert_equal(mapping.nest_tuple(('x',)), ('x',))
+
+    mapping = DataSpecsMapping((CompositeSpace([NullSpace()]), ('',)))
+    assert_equal(mapping.flatten_tuple((None,)), ())
+    assert_equal(mapping.nest_tuple(()), (None,))
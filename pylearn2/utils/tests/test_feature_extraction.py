@@ -0,0 +1,101 @@
+"""
+Tests for pylearn2.utils.feature_extraction
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from theano import config
+from theano import tensor as T
+
+from pylearn2.blocks import Block
+from pylearn2.datasets.dense_design_matrix import DenseDesignMatrix
+from pylearn2.testing.skip import skip_if_no_h5py
+from pylearn2.utils.feature_extraction import extract_features
+
+
+class SquareBlock(Block):
+    """
+    A Block squaring its inputs and appending their sums.
+    """
+
+    def __call__(self, inputs):
+        """
+        Returns the squares of the inputs, followed by their sums.
+
+        Parameters
+        ----------
+        inputs : tensor_like
+            A design matrix.
+        """
+        return T.concatenate([T.sqr(inputs),
+                              inputs.sum(axis=1, keepdims=True)], axis=1)
+
+
+def get_dataset():
+    """
+    Returns a small random dataset and the expected outputs of SquareBlock.
+    """
+    rng = np.random.RandomState([2015, 4, 25])
+    X = rng.randn(53, 4).astype(config.floatX)
+    expected = np.concatenate([X ** 2, X.sum(axis=1)[:, None]], axis=1)
+    return DenseDesignMatrix(X=X), expected
+
+
+def test_extract_features():
+    """
+    Tests the extraction to a .npy file, with and without worker processes,
+    and that an interrupted extraction resumes.
+    """
+    dataset, expected = get_dataset()
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        for num_workers in [1, 2]:
+            output_path = os.path.join(tmp_dir, 'features_%d.npy' %
+                                       num_workers)
+            extract_features(SquareBlock(), dataset, output_path,
+                             batch_size=7, chunk_size=10,
+                             num_workers=num_workers)
+            assert np.allclose(np.load(output_path), expected)
+
+        # Pretend the extraction stopped after the first two chunks
+        features = np.load(output_path, mmap_mode='r+')
+        features[20:] = 0.
+        features.flush()
+        del features
+        with open(output_path + '.progress', 'w') as f:
+            f.write('0 10\n10 20\n20')
+        extract_features(SquareBlock(), dataset, output_path,
+                         batch_size=7, chunk_size=10)
+        assert np.allclose(np.load(output_path), expected)
+
+        # An output of another dataset is not resumed, even if all its
+        # chunks are done
+        X = dataset.get_design_matrix()[:, :3]
+        extract_features(SquareBlock(), DenseDesignMatrix(X=X), output_path,
+                         batch_size=7, chunk_size=10)
+        features = np.load(output_path)
+        assert features.shape == (53, 4)
+        assert np.allclose(features[:, :3], X ** 2)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_extract_features_hdf5():
+    """
+    Tests the extraction to an HDF5 file.
+    """
+    skip_if_no_h5py()
+    import h5py
+    dataset, expected = get_dataset()
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        output_path = os.path.join(tmp_dir, 'features.h5')
+        extract_features(SquareBlock(), dataset, output_path,
+                         batch_size=7, chunk_size=10, num_workers=2,
+                         hdf5_key='squares')
+        with h5py.File(output_path, 'r') as f:
+            assert np.allclose(f['squares'][:], expected)
+    finally:
+        shutil.rmtree(tmp_dir)
@@ -0,0 +1,33 @@
+"""
+Tests for pylearn2.utils.forked_pool
+"""
+import os
+
+import numpy as np
+from nose.tools import assert_raises
+
+from pylearn2.utils.forked_pool import ForkedPool
+
+
+def test_forked_pool():
+    """
+    Tests that the workers inherit a function that can not be pickled,
+    that the results of map are in the order of the tasks, and that a
+    single worker runs the tasks in the calling process.
+    """
+    X = np.arange(12.).reshape((6, 2))
+
+    def row_sum(i):
+        return os.getpid(), X[i].sum()
+
+    for num_workers in [1, 2]:
+        with ForkedPool(row_sum, num_workers) as pool:
+            results = pool.map(range(6))
+            unordered = list(pool.imap_unordered(range(6)))
+        pids = set(pid for pid, _ in results)
+        assert (os.getpid() in pids) == (num_workers == 1)
+        assert np.all([s for _, s in results] == X.sum(axis=1))
+        assert sorted(s for _, s in unordered) == sorted(X.sum(axis=1))
+
+    with ForkedPool(row_sum, 2):
+        assert_raises(RuntimeError, ForkedPool(row_sum, 2).__enter__)
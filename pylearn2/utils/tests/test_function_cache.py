@@ -0,0 +1,121 @@
+"""
+Tests for pylearn2.utils.function_cache
+"""
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from theano import config
+from theano import tensor as T
+
+from pylearn2.compat import OrderedDict
+from pylearn2.utils import sharedX
+from pylearn2.utils.function_cache import (cached_function,
+                                           get_compile_count,
+                                           get_compile_times, graph_key,
+                                           set_cache_directory,
+                                           set_in_process_cache)
+
+
+def build_graph(name, scale=2.):
+    """
+    Builds a small graph updating a shared variable.
+
+    Parameters
+    ----------
+    name : str
+        Name given to the variables.
+    scale : float, optional
+        A constant of the graph.
+
+    Returns
+    -------
+    X : theano matrix
+        The input.
+    W : theano shared variable
+        The parameter.
+    cost : theano scalar
+        The output.
+    updates : OrderedDict
+        Update of the parameter.
+    """
+    X = T.matrix(name + '_X')
+    W = sharedX(np.ones((3, 2)), name=name + '_W')
+    cost = T.sqr(T.dot(X, W)).sum() * scale
+    updates = OrderedDict([(W, W - .1 * T.grad(cost, W))])
+    return X, W, cost, updates
+
+
+def test_graph_key():
+    """
+    Tests that structurally identical graphs have the same key, and that
+    changing a constant changes it.
+    """
+    X, W, cost, updates = build_graph('a')
+    key = graph_key([X, W], [cost, updates[W]])
+    X, W, cost, updates = build_graph('b')
+    assert graph_key([X, W], [cost, updates[W]]) == key
+    X, W, cost, updates = build_graph('c', scale=3.)
+    assert graph_key([X, W], [cost, updates[W]]) != key
+
+
+def test_cached_function():
+    """
+    Tests that a function loaded from the cache computes the same outputs
+    and updates the shared variables of the new graph.
+    """
+    cache_dir = tempfile.mkdtemp()
+    data = np.arange(6).reshape((2, 3)).astype(config.floatX)
+    try:
+        set_cache_directory(cache_dir)
+        X, W, cost, updates = build_graph('a')
+        f = cached_function([X], cost, updates=updates, name='a')
+        assert len(os.listdir(cache_dir)) == 1
+        expected_cost = f(data)
+        expected_W = W.get_value()
+
+        X, W, cost, updates = build_graph('b')
+        g = cached_function([X], cost, updates=updates, name='b')
+        assert len(os.listdir(cache_dir)) == 1
+        assert np.allclose(g(data), expected_cost)
+        assert np.allclose(W.get_value(), expected_W)
+    finally:
+        set_cache_directory(None)
+        shutil.rmtree(cache_dir)
+
+
+def test_in_process_cache():
+    """
+    Tests that the optimized graph of a function is reused within the
+    process without a cache directory when enabled, that the least
+    recently used graphs are dropped first, and that compile times are
+    recorded.
+    """
+    data = np.arange(6).reshape((2, 3)).astype(config.floatX)
+    set_in_process_cache(True, max_entries=1)
+    try:
+        start = get_compile_count()
+        X, W, cost, updates = build_graph('a')
+        f = cached_function([X], cost, updates=updates, name='a')
+        assert get_compile_times()[-1][0] == 'a'
+        expected_cost = f(data)
+
+        X, W, cost, updates = build_graph('b')
+        g = cached_function([X], cost, updates=updates, name='b')
+        assert get_compile_times()[-1][0::2] == ('b', 'memory')
+        assert np.allclose(g(data), expected_cost)
+
+        X, W, cost, updates = build_graph('c', scale=3.)
+        cached_function([X], cost, updates=updates, name='c')
+        X, W, cost, updates = build_graph('d')
+        cached_function([X], cost, updates=updates, name='d')
+        assert get_compile_times()[-1][0::2] == ('d', 'compiled')
+        assert [t[0] for t in get_compile_times(start)] == ['a', 'b', 'c',
+                                                            'd']
+    finally:
+        set_in_process_cache(False)
+
+    X, W, cost, updates = build_graph('e')
+    cached_function([X], cost, updates=updates, name='e')
+    assert get_compile_times()[-1][0::2] == ('e', 'compiled')
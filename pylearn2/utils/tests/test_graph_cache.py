@@ -0,0 +1,46 @@
+"""
+Tests for pylearn2.utils.graph_cache
+"""
+from pylearn2.costs.cost import Cost
+from pylearn2.space import CompositeSpace, VectorSpace
+from pylearn2.utils.graph_cache import GraphCache
+
+
+class SumCost(Cost):
+    """
+    The sum of the data.
+    """
+    def expr(self, model, data):
+        """
+        Returns the sum of the data.
+
+        Parameters
+        ----------
+        model : Model
+            Not used.
+        data : theano variable
+        """
+        return data.sum()
+
+
+def test_graph_cache():
+    """
+    Tests that batches and cost expressions are built once.
+    """
+    cache = GraphCache()
+    space = VectorSpace(3)
+    flat, nested = cache.batches(
+        (CompositeSpace([space, VectorSpace(2), space]),
+         ('features', 'targets', 'features')), 'test[%s]')
+    assert len(flat) == 2
+    assert nested[0] is nested[2] is flat[0]
+    assert cache.batch(space, 'features', 'other',
+                       batch_size=10) is flat[0]
+    assert cache.batch(space, 'features', 'other',
+                       batch_size=1) is not flat[0]
+
+    cost = SumCost()
+    expr = cache.cost_expr(cost, None, flat[0])
+    assert cache.cost_expr(cost, None, nested[0]) is expr
+    other = SumCost()
+    assert cache.cost_expr(other, None, flat[0]) is not expr
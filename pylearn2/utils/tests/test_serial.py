@@ -128,10 +128,12 @@ def test_read_bin_lush_matrix_double_3tensor():
 
 def test_load_train_file():
     """
-    Loads a YAML file with and without environment variables.
+    Loads a YAML file with and without environment variables, and with
+    several threads.
     """
     environ = {
         'PYLEARN2_DATA_PATH': '/just/a/test/path/'
     }
     load_train_file(yaml_path + 'test_model.yaml')
     load_train_file(yaml_path + 'test_model.yaml', environ=environ)
+    load_train_file(yaml_path + 'test_model.yaml', num_threads=2)
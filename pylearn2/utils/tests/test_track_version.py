@@ -0,0 +1,16 @@
+"""
+Tests for pylearn2.utils.track_version
+"""
+from pylearn2.utils.track_version import LibVersion, MetaLibVersion
+
+
+def test_lib_version_is_shared():
+    """
+    Tests that the classes created by MetaLibVersion share a LibVersion,
+    created on first access.
+    """
+    A = MetaLibVersion('A', (object,), {})
+    B = MetaLibVersion('B', (A,), {})
+    assert isinstance(A.libv, LibVersion)
+    assert A.libv is B.libv
+    assert B().libv is A.libv
@@ -40,6 +40,11 @@ class MetaLibVersion(type):
     constructor is called (if the "__metaclass__ = MetaLibVersion"
     line is present in the other class definition).
 
+    The `libv` attribute it gives to the class is created on first access
+    and shared by all the classes, since gathering the versions runs
+    subprocesses and would otherwise slow down the import of every module
+    defining a model.
+
     Parameters
     ----------
     cls : WRITEME
@@ -50,7 +55,28 @@ class MetaLibVersion(type):
 
     def __init__(cls, name, bases, dict):
         type.__init__(cls, name, bases, dict)
-        cls.libv = LibVersion()
+        cls.libv = _lazy_lib_version
+
+
+class _LazyLibVersion(object):
+    """
+    Descriptor returning the LibVersion shared by all the classes, created
+    on first access.
+    """
+
+    def __init__(self):
+        self.libv = None
+
+    def __get__(self, obj, cls=None):
+        """
+        Returns the shared LibVersion.
+        """
+        if self.libv is None:
+            self.libv = LibVersion()
+        return self.libv
+
+
+_lazy_lib_version = _LazyLibVersion()
 
 
 class LibVersion(object):